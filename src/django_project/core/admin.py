@@ -5,19 +5,50 @@ from . import models
 
 @admin.register(models.ShortenedURL)
 class ShortenedURLAdmin(admin.ModelAdmin):  # pyright: ignore[reportMissingTypeArgument]
-    raw_id_fields = [
-        "owner",
-        "requests",
-    ]
-    list_display = ["alias", "url_display", "owner"]
-    readonly_fields = ["inserted_at", "updated_at"]
+    raw_id_fields = ["owner"]
+    list_display = ["alias", "url_display", "owner", "view_count"]
+    readonly_fields = ["inserted_at", "updated_at", "view_count"]
 
     def url_display(self, obj):
         return (obj.url or "")[:100]
 
 
 @admin.register(models.UploadedFile)
-class ShortenedURLAdmin(admin.ModelAdmin):  # pyright: ignore[reportMissingTypeArgument]
-    raw_id_fields = ["owner", "requests"]
-    list_display = ["alias", "ext", "file", "owner"]
-    readonly_fields = ["inserted_at", "updated_at"]
+class UploadedFileAdmin(admin.ModelAdmin):  # pyright: ignore[reportMissingTypeArgument]
+    raw_id_fields = ["owner"]
+    list_display = [
+        "alias",
+        "ext",
+        "file",
+        "blob",
+        "size",
+        "content_type",
+        "owner",
+        "view_count",
+    ]
+    readonly_fields = [
+        "inserted_at",
+        "updated_at",
+        "view_count",
+        "blob",
+        "size",
+        "content_type",
+        "checksum",
+    ]
+
+
+@admin.register(models.FileBlob)
+class FileBlobAdmin(admin.ModelAdmin):  # pyright: ignore[reportMissingTypeArgument]
+    list_display = ["digest", "file", "refcount"]
+    readonly_fields = ["digest", "file", "refcount", "inserted_at"]
+
+
+@admin.register(models.APIToken)
+class APITokenAdmin(admin.ModelAdmin):  # pyright: ignore[reportMissingTypeArgument]
+    raw_id_fields = ["user"]
+    list_display = ["user", "name", "inserted_at"]
+    # created with the create_api_token command, which shows the key.
+    readonly_fields = ["key_hash", "inserted_at"]
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,135 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Max
+from request.models import Request
+
+from core.utils import attribution
+
+
+def read_checkpoint(path: str) -> int:
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path: str, last_id: int) -> None:
+    partial = f"{path}.partial"
+    with open(partial, "w") as f:
+        f.write(f"{last_id}\n")
+    os.replace(partial, path)
+
+
+class Command(BaseCommand):
+    help = (
+        "Links the logged requests that were never attributed to the shortened "
+        "URLs and files they hit. The requests are read by id in ranges of "
+        "--chunk-size ids, optionally spread over --workers processes. The "
+        "last id done (below which every range is done) is written to "
+        "--checkpoint, where a later run resumes from. View counts are left "
+        "alone, use --rebuild-counters or run rebuild_view_counters after."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--start-id",
+            type=int,
+            help="Start after this request id instead of the checkpoint's.",
+        )
+        parser.add_argument(
+            "--end-id",
+            type=int,
+            help="Stop at this request id, the last one by default.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=50_000,
+            help="Number of request ids per range.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="File keeping the last request id done.",
+        )
+        parser.add_argument(
+            "--rebuild-counters",
+            action="store_true",
+            help="Run rebuild_view_counters when done.",
+        )
+
+    def handle(
+        self,
+        *args,
+        start_id,
+        end_id,
+        chunk_size,
+        batch_size,
+        workers,
+        checkpoint,
+        rebuild_counters,
+        **options,
+    ):
+        if start_id is None:
+            start_id = read_checkpoint(checkpoint) if checkpoint else 0
+        if end_id is None:
+            end_id = Request.objects.aggregate(last=Max("pk"))["last"] or 0
+        ranges = [
+            (start, min(start + chunk_size, end_id))
+            for start in range(start_id, end_id, chunk_size)
+        ]
+        starts = [start for start, _ in ranges]
+        ends = [end for _, end in ranges]
+
+        if workers > 1:
+            # the forked workers open their own connections.
+            connections.close_all()
+            pool = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("fork")
+            )
+            results = pool.map(
+                attribution.backfill_range, starts, ends, repeat(batch_size)
+            )
+        else:
+            pool = None
+            results = map(attribution.backfill_range, starts, ends, repeat(batch_size))
+
+        total_read = total_written = 0
+        try:
+            # in order, so every range up to ``end`` is done.
+            for end, (read, written) in zip(ends, results):
+                total_read += read
+                total_written += written
+                if checkpoint:
+                    write_checkpoint(checkpoint, end)
+                self.stdout.write(
+                    f"Up to request {end}: {read} requests, {written} links"
+                )
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Attributed {total_read} requests ({start_id} < id <= {end_id}), "
+                f"{total_written} links"
+            )
+        )
+        if rebuild_counters:
+            call_command("rebuild_view_counters", stdout=self.stdout)
@@ -0,0 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from core.models import UploadedFile
+from core.utils import alias_cache
+from core.utils.file_metadata import FileMetadata, read_file_metadata
+
+
+def read_metadata(instance: UploadedFile) -> FileMetadata | None:
+    stored_file = instance.stored_file
+    try:
+        with stored_file.storage.open(stored_file.name) as file:
+            return read_file_metadata(file, instance.filename())
+    except FileNotFoundError:
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Records the size, sniffed content type and sha256 checksum of the "
+        "uploaded files that don't have them yet (uploaded before they were "
+        "recorded at upload time). The files are read by a pool of --workers "
+        "threads, the rows are updated in batches of --batch-size."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Number of files read at the same time.",
+        )
+
+    def handle(self, *args, batch_size, workers, **options):
+        files = (
+            UploadedFile.objects.filter(
+                Q(size__isnull=True)
+                | Q(content_type__isnull=True)
+                | Q(checksum__isnull=True)
+            )
+            .select_related("blob")
+            .order_by("pk")
+        )
+        updated = missing = 0
+        last_pk = 0
+        with ThreadPoolExecutor(workers) as pool:
+            while batch := list(files.filter(pk__gt=last_pk)[:batch_size]):
+                last_pk = batch[-1].pk
+                # only the reads run in the pool, the rows are written here.
+                rows = []
+                for instance, metadata in zip(batch, pool.map(read_metadata, batch)):
+                    if metadata is None:
+                        self.stderr.write(f"The file of {instance.pk} is missing")
+                        missing += 1
+                        continue
+                    instance.size, instance.content_type, instance.checksum = metadata
+                    rows.append(instance)
+                with transaction.atomic():
+                    UploadedFile.objects.bulk_update(
+                        rows, ["size", "content_type", "checksum"]
+                    )
+                    # the checksum is the ETag of the files without a blob.
+                    alias_cache.uploaded_files.invalidate_many_on_commit(
+                        [alias_cache.file_key(instance) for instance in rows]
+                    )
+                updated += len(rows)
+                self.stdout.write(f"Up to file {last_pk}: {updated} updated")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Recorded the metadata of {updated} files"
+                + (f", {missing} missing" if missing else "")
+            )
+        )
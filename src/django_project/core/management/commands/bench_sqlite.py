@@ -0,0 +1,136 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = """
+CREATE TABLE url (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    alias TEXT NOT NULL UNIQUE,
+    url TEXT NOT NULL
+);
+"""
+
+
+def connect(path: str, profile: str) -> sqlite3.Connection:
+    """
+    A connection set up the way django's sqlite backend sets it up with
+    ``DB_PROFILE=profile``.
+    """
+    if profile == "default":
+        return sqlite3.connect(path, isolation_level=None)
+    connection = sqlite3.connect(
+        path,
+        isolation_level=None,
+        timeout=settings.SQLITE_PRAGMAS["busy_timeout"] / 1000,
+    )
+    for name, value in settings.SQLITE_PRAGMAS.items():
+        connection.execute(f"PRAGMA {name}={value}")
+    return connection
+
+
+def worker(path, profile, seconds, write_ratio, rows, results):
+    begin = "BEGIN IMMEDIATE" if profile == "production" else "BEGIN"
+    connection = None
+    reads = writes = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        # without CONN_MAX_AGE every request opens its own connection.
+        if connection is None or profile == "default":
+            if connection is not None:
+                connection.close()
+            connection = connect(path, profile)
+        try:
+            if random.random() < write_ratio:
+                # read then write, like create_with_alias and the counters.
+                connection.execute(begin)
+                try:
+                    connection.execute(
+                        "SELECT count(*) FROM url WHERE alias = ?",
+                        (os.urandom(6).hex(),),
+                    ).fetchone()
+                    connection.execute(
+                        "INSERT INTO url (alias, url) VALUES (?, ?)",
+                        (os.urandom(6).hex(), "https://example.org/"),
+                    )
+                    connection.execute("COMMIT")
+                except BaseException:
+                    connection.execute("ROLLBACK")
+                    raise
+                writes += 1
+            else:
+                connection.execute(
+                    "SELECT url FROM url WHERE id = ?",
+                    (random.randint(1, rows),),
+                ).fetchone()
+                reads += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put((reads, writes, errors))
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures concurrent read/write throughput of a scratch SQLite "
+        "database with the default and production DB_PROFILE settings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+        )
+        parser.add_argument(
+            "--seconds",
+            type=float,
+            default=5,
+        )
+        parser.add_argument(
+            "--write-ratio",
+            type=float,
+            default=0.1,
+        )
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=100_000,
+        )
+
+    def handle(self, *args, workers, seconds, write_ratio, rows, **options):
+        for profile in ["default", "production"]:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "bench.sqlite3")
+                connection = connect(path, profile)
+                connection.executescript(SCHEMA)
+                connection.executemany(
+                    "INSERT INTO url (alias, url) VALUES (?, ?)",
+                    ((f"a{i}", "https://example.org/") for i in range(rows)),
+                )
+                connection.close()
+
+                results = multiprocessing.Queue()
+                processes = [
+                    multiprocessing.Process(
+                        target=worker,
+                        args=(path, profile, seconds, write_ratio, rows, results),
+                    )
+                    for _ in range(workers)
+                ]
+                for process in processes:
+                    process.start()
+                totals = [sum(x) for x in zip(*(results.get() for _ in processes))]
+                for process in processes:
+                    process.join()
+
+            reads, writes, errors = totals
+            self.stdout.write(
+                f"{profile:>10}: {reads / seconds:>9.0f} reads/s "
+                f"{writes / seconds:>7.0f} writes/s "
+                f"{errors:>6} locked errors"
+            )
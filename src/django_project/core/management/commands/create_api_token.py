@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import APIToken
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates an API token for a user and prints its key, which is not "
+        "stored and can't be shown again. Scripts send it to the JSON "
+        "endpoints as an 'Authorization: Bearer <key>' header."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument(
+            "--name",
+            default="",
+            help="What the token is used for.",
+        )
+
+    def handle(self, *args, username, name, **options):
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {username}")
+        _, key = APIToken.create(user, name)
+        self.stdout.write(key)
@@ -0,0 +1,64 @@
+from itertools import batched
+
+from django.core import serializers
+from django.core.management.base import BaseCommand
+
+from core.utils import jsonl
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports the users, shortened URLs, uploaded files (metadata only, "
+        "not MEDIA_ROOT) and their click history as JSONL, gzip compressed "
+        "when the output ends with .gz. The lines use django's serialization "
+        "format, see import_jsonl. An interrupted export is resumed with "
+        "--offset set to the last reported count, into a new file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "output",
+            help="Output file, - for stdout.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+        )
+        parser.add_argument(
+            "--offset",
+            type=int,
+            default=0,
+            help="Number of records to skip, as reported by an earlier run.",
+        )
+        parser.add_argument(
+            "--no-clicks",
+            action="store_true",
+            help="Leave out the requests and view counts.",
+        )
+
+    def handle(self, *args, output, batch_size, offset, no_clicks, **options):
+        progress = jsonl.Progress(self.stderr.write, offset, batch_size * 10)
+        skip = offset
+        stream = jsonl.open_jsonl(output, "w")
+        try:
+            for model in jsonl.export_models(clicks=not no_clicks):
+                queryset = model._base_manager.order_by("pk")
+                if skip:
+                    # resumes in the model where the previous run stopped.
+                    count = queryset.count()
+                    queryset = queryset[skip:]
+                    skip = max(skip - count, 0)
+                fields = jsonl.exported_fields(model)
+                for chunk in batched(
+                    queryset.iterator(chunk_size=batch_size), batch_size
+                ):
+                    serializers.serialize("jsonl", chunk, stream=stream, fields=fields)
+                    progress.add(len(chunk))
+        finally:
+            if output != "-":
+                stream.close()
+        progress.report()
+        self.stderr.write(
+            self.style.SUCCESS(f"Exported {progress.count - offset} records")
+        )
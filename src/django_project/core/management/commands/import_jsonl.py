@@ -0,0 +1,177 @@
+from collections import defaultdict
+from itertools import groupby, islice
+
+from django.core import serializers
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import IntegrityError, connections, router, transaction
+
+from core.models import AliasSequence, ShortenedURL, UploadedFile
+from core.utils import alias_cache, alias_filter, jsonl, trending
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports a JSONL (or .gz) export of export_jsonl, keeping the primary "
+        "keys. Records are inserted with bulk_create, one transaction per "
+        "batch; an interrupted import is resumed with --offset set to the "
+        "last reported count. The tables have to be empty unless --merge (or "
+        "--offset) is given: records identical to an existing row are then "
+        "skipped, the alias sequences keep the highest value, and any other "
+        "record whose primary key or unique fields are taken stops the import. "
+        "Each model goes to the database the routers send it to."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "input",
+            help="Input file, - for stdin.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+        )
+        parser.add_argument(
+            "--offset",
+            type=int,
+            default=0,
+            help="Number of records to skip, as reported by an earlier run.",
+        )
+        parser.add_argument(
+            "--merge",
+            action="store_true",
+            help="Import into tables that already have rows.",
+        )
+
+    def handle(self, *args, input, batch_size, offset, merge, **options):
+        if not merge and not offset:
+            self.check_empty()
+        progress = jsonl.Progress(self.stderr.write, offset, batch_size * 10)
+        self.inserted = self.skipped = 0
+        imported_models = set()
+        stream = jsonl.open_jsonl(input, "r")
+        try:
+            records = serializers.deserialize(
+                "jsonl",
+                islice(stream, offset, None),
+            )
+            for model, objects in groupby(
+                (record.object for record in records), key=type
+            ):
+                imported_models.add(model)
+                while chunk := list(islice(objects, batch_size)):
+                    self.insert(model, chunk, progress.count)
+                    progress.add(len(chunk))
+        finally:
+            if input != "-":
+                stream.close()
+
+        # the primary keys were set explicitly, the sequences of the
+        # databases having them have to catch up.
+        by_database = defaultdict(list)
+        for model in imported_models:
+            by_database[router.db_for_write(model)].append(model)
+        for database, models in by_database.items():
+            connection = connections[database]
+            statements = connection.ops.sequence_reset_sql(no_style(), models)
+            if statements:
+                with connection.cursor() as cursor:
+                    for sql in statements:
+                        cursor.execute(sql)
+        trending.invalidate()
+        # the imported rows may be older than what the filters have seen.
+        alias_filter.request_rebuild()
+
+        progress.report()
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"Imported {self.inserted} records, "
+                f"skipped {self.skipped} already present"
+            )
+        )
+
+    def check_empty(self):
+        for model in jsonl.export_models():
+            # the migrations may have created sequences, merged anyway.
+            if model is not AliasSequence and model._base_manager.exists():
+                raise CommandError(
+                    f"{model._meta.label} already has rows, pass --merge to "
+                    "import into it anyway."
+                )
+
+    def insert(self, model, objects, position):
+        if model is AliasSequence:
+            self.merge_sequences(objects)
+            self.inserted += len(objects)
+            return
+        present = self.present(model, objects, position)
+        objects = [obj for obj in objects if obj.pk not in present]
+        try:
+            with (
+                transaction.atomic(using=router.db_for_write(model)),
+                jsonl.explicit_timestamps(model),
+            ):
+                model._base_manager.bulk_create(objects)
+        except IntegrityError as e:
+            raise CommandError(
+                f"A {model._meta.label} record conflicts with an existing row "
+                f"({e}), nothing was imported past record {position}."
+            )
+        self.inserted += len(objects)
+        self.skipped += len(present)
+        # bulk_create sends no post_save, drops the negative cache entries.
+        if model is ShortenedURL:
+            alias_cache.shortened_urls.invalidate_many(
+                [alias_cache.url_key(obj) for obj in objects]
+            )
+        elif model is UploadedFile:
+            alias_cache.uploaded_files.invalidate_many(
+                [alias_cache.file_key(obj) for obj in objects]
+            )
+
+    def present(self, model, objects, position) -> set:
+        """
+        The primary keys of ``objects`` already in the database with the same
+        values, from an earlier import. Any other row with one of their
+        primary keys is a conflict, the records referencing it would end up
+        attached to it.
+        """
+        existing = model._base_manager.in_bulk([obj.pk for obj in objects])
+        fields = jsonl.exported_fields(model)
+
+        def exported(obj) -> str:
+            # as exported, the datetimes only keep their milliseconds.
+            return serializers.serialize("json", [obj], fields=fields)
+
+        present, conflicts = set(), []
+        for obj in objects:
+            if obj.pk not in existing:
+                continue
+            if exported(obj) == exported(existing[obj.pk]):
+                present.add(obj.pk)
+            else:
+                conflicts.append(obj.pk)
+        if conflicts:
+            raise CommandError(
+                f"{len(conflicts)} {model._meta.label} records have the primary "
+                f"key of a different row ({conflicts[:10]}), nothing was "
+                f"imported past record {position}."
+            )
+        return present
+
+    def merge_sequences(self, objects):
+        """
+        Keeps the highest ``next_value`` of each sequence, an existing lower
+        one would hand out the imported aliases again.
+        """
+        with transaction.atomic(using=router.db_for_write(AliasSequence)):
+            for obj in objects:
+                sequence, created = AliasSequence.objects.get_or_create(
+                    name=obj.name,
+                    defaults={"next_value": obj.next_value},
+                )
+                if not created:
+                    AliasSequence.objects.filter(
+                        pk=sequence.pk, next_value__lt=obj.next_value
+                    ).update(next_value=obj.next_value)
@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.utils import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Prunes the logged requests older than --days days, a day at a time: "
+        "their per path counts are rolled up into RequestDailyPathCount, they "
+        "are archived with their attribution rows to "
+        "<archive dir>/YYYY/MM/requests-YYYY-MM-DD.jsonl.gz (which "
+        "import_jsonl can load back), then deleted in batches. Interrupted "
+        "runs are picked up where they stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=getattr(settings, "REQUEST_RETENTION_DAYS", 90),
+            help="Number of days of requests to keep.",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            default=getattr(settings, "REQUEST_ARCHIVE_DIR", None),
+        )
+        parser.add_argument(
+            "--no-archive",
+            action="store_true",
+            help="Delete the requests without archiving them.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.05,
+            help="Seconds to wait between two deleted batches.",
+        )
+
+    def handle(
+        self,
+        *args,
+        days,
+        archive_dir,
+        no_archive,
+        batch_size,
+        pause,
+        **options,
+    ):
+        if not archive_dir and not no_archive:
+            self.stderr.write(self.style.ERROR("Set --archive-dir or --no-archive"))
+            return
+
+        cutoff = timezone.localdate() - timedelta(days=days)
+        total = 0
+        for day in retention.prunable_days(cutoff):
+            if not retention.day_requests(day).exists():
+                continue
+            paths = retention.roll_up_day(day)
+            archived = None
+            if not no_archive:
+                archived = retention.archive_day(day, archive_dir, batch_size)
+            deleted = retention.delete_day(day, batch_size, pause)
+            total += deleted
+            self.stdout.write(
+                f"{day}: {deleted} requests deleted"
+                + (f", {paths} paths rolled up" if paths else "")
+                + (f", archived to {archived}" if archived else "")
+            )
+        cache.delete("all_request_counts")
+        self.stdout.write(
+            self.style.SUCCESS(f"Pruned {total} requests older than {cutoff}")
+        )
@@ -0,0 +1,94 @@
+from collections import defaultdict
+from datetime import date
+from itertools import batched
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from request.models import Request
+
+from core.models import ShortenedURL, UploadedFile, daily_view_count_model
+from core.utils import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the view_count totals and the daily view counts of shortened "
+        "URLs and uploaded files from their attributed requests. The daily "
+        "counts of the days pruned by prune_requests are kept as they are."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+        )
+
+    def handle(self, *args, batch_size, **options):
+        rolled_up_until = retention.rolled_up_until()
+        for model in [ShortenedURL, UploadedFile]:
+            field = model._meta.get_field("requests")
+            through = field.remote_field.through
+            fk = f"{field.m2m_field_name()}_id"
+            request_field = field.m2m_reverse_field_name()
+            daily_model = daily_view_count_model(model)
+
+            # two queries per batch instead of a join, the requests may be
+            # in another database (see core.routers).
+            daily_counts: dict[tuple[int, date], int] = defaultdict(int)
+            references = through.objects.values_list(fk, f"{request_field}_id")
+            for batch in batched(
+                references.iterator(chunk_size=batch_size), batch_size
+            ):
+                times = dict(
+                    Request.objects.filter(
+                        pk__in=[request_id for _, request_id in batch]
+                    ).values_list("pk", "time")
+                )
+                for pk, request_id in batch:
+                    if request_id not in times:
+                        continue
+                    day = timezone.localdate(times[request_id])
+                    if rolled_up_until is None or day >= rolled_up_until:
+                        daily_counts[pk, day] += 1
+
+            # the requests of the pruned days are gone, not their counts.
+            pruned = daily_model.objects.none()
+            rebuilt = daily_model.objects.all()
+            if rolled_up_until is not None:
+                pruned = daily_model.objects.filter(day__lt=rolled_up_until)
+                rebuilt = rebuilt.filter(day__gte=rolled_up_until)
+            totals: dict[int, int] = defaultdict(int)
+            for pk, total in (
+                pruned.values("instance")
+                .annotate(total=Sum("count"))
+                .values_list("instance", "total")
+            ):
+                totals[pk] += total
+            rows = []
+            for (pk, day), count in daily_counts.items():
+                totals[pk] += count
+                rows.append(daily_model(instance_id=pk, day=day, count=count))
+
+            by_total: dict[int, list[int]] = defaultdict(list)
+            for pk, total in totals.items():
+                by_total[total].append(pk)
+
+            with transaction.atomic():
+                model.objects.update(view_count=0)
+                for total, pks in by_total.items():
+                    for i in range(0, len(pks), batch_size):
+                        model.objects.filter(pk__in=pks[i : i + batch_size]).update(
+                            view_count=total
+                        )
+                rebuilt.delete()
+                daily_model.objects.bulk_create(rows, batch_size=batch_size)
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{model._meta.verbose_name_plural}: {sum(totals.values())} "
+                    f"views over {len(totals)} objects, {len(rows)} daily counts"
+                )
+            )
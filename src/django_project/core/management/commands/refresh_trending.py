@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils import alias_cache, trending
+
+
+class Command(BaseCommand):
+    help = (
+        "Materializes the home page trending lists, meant to be run "
+        "periodically (e.g. from cron) so web workers never have to. The "
+        "snapshot is stored in the django cache, which has to be shared with "
+        "the web workers (CACHE_URL)."
+    )
+
+    def handle(self, *args, **options):
+        if alias_cache.cache_is_local():
+            raise CommandError(
+                "The django cache is local to this process, the web workers "
+                "would never see the snapshot. Set CACHE_URL to a shared cache."
+            )
+        if not trending.acquire_refresh_lock():
+            self.stdout.write(self.style.WARNING("A refresh is already running."))
+            return
+        try:
+            snapshot = trending.build_snapshot()
+        finally:
+            trending.release_refresh_lock()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(snapshot['urls'])} trending URLs, "
+                f"{len(snapshot['files'])} trending files"
+            )
+        )
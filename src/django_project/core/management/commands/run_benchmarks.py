@@ -0,0 +1,270 @@
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+from datetime import UTC, datetime
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Count
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from django.urls import reverse
+
+from core.models import ShortenedURL, UploadedFile, alias_allocator
+from core.utils import alias_cache, attribution, benchmark
+
+from .seed_benchmark_data import USERNAME_PREFIX
+
+User = get_user_model()
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the core views against freshly seeded test databases of "
+        "each --sizes number of links (with 1/10 as many files and 5 times "
+        "as many logged requests) and writes the p50/p95/p99 latencies and "
+        "throughput as JSON, optionally compared to a --baseline run. The "
+        "asgi transport doesn't work with manage.py's gevent monkey patching, "
+        "run it with `python -m django run_benchmarks`."
+    )
+
+    scenarios = [
+        "home",
+        "redirect",
+        "file",
+        "url_list",
+        "file_list",
+        "upload",
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="1000,10000",
+            help="Comma separated dataset sizes.",
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=200,
+        )
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=20,
+        )
+        parser.add_argument(
+            "--transport",
+            choices=list(benchmark.TRANSPORTS),
+            default="client",
+        )
+        parser.add_argument(
+            "--scenarios",
+            default=",".join(self.scenarios),
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+        )
+        parser.add_argument(
+            "--output",
+            help="JSON results file, stdout by default.",
+        )
+        parser.add_argument(
+            "--baseline",
+            help="JSON results of an earlier run to compare to.",
+        )
+
+    def handle(
+        self,
+        *args,
+        sizes,
+        iterations,
+        warmup,
+        transport,
+        scenarios,
+        seed,
+        output,
+        baseline,
+        **options,
+    ):
+        sizes = [int(size) for size in sizes.split(",")]
+        scenarios = scenarios.split(",")
+        results = {
+            "meta": {
+                "timestamp": datetime.now(UTC).isoformat(),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "transport": transport,
+                "iterations": iterations,
+                "seed": seed,
+                "db_profile": getattr(settings, "DB_PROFILE", "default"),
+                "async_redirect_views": getattr(
+                    settings, "ASYNC_REDIRECT_VIEWS", False
+                ),
+            },
+            "results": [],
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            for alias in connections:
+                test_settings = connections[alias].settings_dict["TEST"]
+                if connections[alias].vendor == "sqlite":
+                    # in memory databases lock whole tables between threads.
+                    test_settings["NAME"] = os.path.join(directory, f"{alias}.sqlite3")
+            old_config = setup_databases(
+                verbosity=0,
+                interactive=False,
+                aliases=set(connections),
+                serialized_aliases=set(),
+            )
+            try:
+                with override_settings(
+                    DEBUG=False,
+                    MEDIA_ROOT=os.path.join(directory, "media"),
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                ):
+                    for size in sizes:
+                        results["results"] += self.run_size(
+                            size, scenarios, iterations, warmup, transport, seed
+                        )
+                    attribution.buffer.flush()
+            finally:
+                teardown_databases(old_config, verbosity=0)
+
+        data = json.dumps(results, indent=2)
+        if output:
+            with open(output, "w") as f:
+                f.write(data + "\n")
+        else:
+            self.stdout.write(data)
+        if baseline:
+            with open(baseline) as f:
+                self.compare(json.load(f), results)
+
+    def reset(self, size: int, seed: int) -> None:
+        for database in connections:
+            call_command("flush", database=database, interactive=False, verbosity=0)
+        cache.clear()
+        alias_allocator.reset()
+        alias_cache.shortened_urls.local.clear()
+        alias_cache.uploaded_files.local.clear()
+        call_command(
+            "seed_benchmark_data",
+            users=max(size // 100, 1),
+            links=size,
+            files=max(size // 10, 1),
+            requests=size * 5,
+            seed=seed,
+            verbosity=0,
+            stdout=self.stderr,
+        )
+
+    def calls(self, scenario: str, rng: random.Random, count: int, owner):
+        links = list(ShortenedURL.objects.values_list("alias", flat=True))
+        files = [
+            alias + (ext or "")
+            for alias, ext in UploadedFile.objects.values_list("alias", "ext")
+        ]
+        link_pages = max(ShortenedURL.objects.filter(owner=owner).count() // 3, 1)
+        file_pages = max(UploadedFile.objects.filter(owner=owner).count() // 3, 1)
+        # reversed, so they follow BASE_URL_PATH.
+        url_list = reverse("core:url_shortener")
+        file_list = reverse("core:file_hosting")
+        for n in range(count):
+            match scenario:
+                case "home":
+                    yield benchmark.Call("GET", reverse("core:home"))
+                case "redirect":
+                    yield benchmark.Call(
+                        "GET",
+                        reverse("core:url_shortener_url", args=[rng.choice(links)]),
+                    )
+                case "file":
+                    yield benchmark.Call(
+                        "GET", reverse("core:file_redirect", args=[rng.choice(files)])
+                    )
+                case "url_list":
+                    page = rng.randint(1, link_pages)
+                    yield benchmark.Call("GET", f"{url_list}?page={page}")
+                case "file_list":
+                    page = rng.randint(1, file_pages)
+                    yield benchmark.Call("GET", f"{file_list}?page={page}")
+                case "upload":
+                    yield benchmark.Call(
+                        "POST",
+                        file_list,
+                        {
+                            "file": SimpleUploadedFile(
+                                f"upload-{n}.bin", rng.randbytes(16 * 1024)
+                            )
+                        },
+                    )
+                case _:
+                    raise ValueError(f"Unknown scenario: {scenario}")
+
+    def run_size(self, size, scenarios, iterations, warmup, transport_name, seed):
+        self.reset(size, seed)
+        # the user with the most links, so the lists have pages to go through.
+        owner = (
+            User.objects.filter(username__startswith=USERNAME_PREFIX)
+            .annotate(links=Count("shortenedurl"))
+            .order_by("-links")
+            .first()
+        )
+        transport = benchmark.TRANSPORTS[transport_name]()
+        results = []
+        try:
+            transport.login(owner)
+            for scenario in scenarios:
+                rng = random.Random(f"{seed}:{size}:{scenario}")
+                transport.measure(list(self.calls(scenario, rng, warmup, owner)))
+                summary = transport.measure(
+                    list(self.calls(scenario, rng, iterations, owner))
+                )
+                results.append({"size": size, "scenario": scenario, **summary})
+                self.stderr.write(
+                    f"{size:>8} {scenario:<10} p50 {summary['p50_ms']:>8.2f}ms "
+                    f"p95 {summary['p95_ms']:>8.2f}ms p99 {summary['p99_ms']:>8.2f}ms "
+                    f"{summary['throughput_rps']:>8.1f} req/s"
+                    + (f" {summary['errors']} errors" if summary["errors"] else "")
+                )
+        finally:
+            transport.close()
+        return results
+
+    def compare(self, baseline, results) -> None:
+        previous = {(r["size"], r["scenario"]): r for r in baseline["results"]}
+        self.stderr.write(f"compared to {baseline['meta'].get('git_revision')}:")
+        for result in results["results"]:
+            before = previous.get((result["size"], result["scenario"]))
+            if not before:
+                continue
+            changes = " ".join(
+                f"{key} {(result[key] / before[key] - 1) * 100:+.1f}%"
+                for key in ["p50_ms", "p95_ms", "p99_ms", "throughput_rps"]
+                if before[key]
+            )
+            self.stderr.write(f"{result['size']:>8} {result['scenario']:<10} {changes}")
@@ -0,0 +1,122 @@
+import random
+from datetime import timedelta
+from itertools import accumulate, batched
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from request.models import Request
+
+from core.models import ShortenedURL, UploadedFile, bulk_create_with_aliases
+from core.utils import attribution
+
+User = get_user_model()
+
+USERNAME_PREFIX = "bench-"
+PASSWORD = "bench"
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds synthetic users (bench-<n>, password 'bench'), shortened "
+        "URLs, uploaded files and logged requests spread over the last "
+        "--days days, for benchmarks. The same --seed gives the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--links", type=int, default=1000)
+        parser.add_argument("--files", type=int, default=100)
+        parser.add_argument("--requests", type=int, default=10_000)
+        parser.add_argument("--days", type=int, default=30)
+        parser.add_argument("--file-size", type=int, default=1024)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(
+        self,
+        *args,
+        users,
+        links,
+        files,
+        requests,
+        days,
+        file_size,
+        seed,
+        batch_size,
+        **options,
+    ):
+        rng = random.Random(seed)
+        # hashed once, the hasher is made to be slow.
+        password = make_password(PASSWORD)
+        first = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+        owners = User.objects.bulk_create(
+            [
+                User(username=f"{USERNAME_PREFIX}{n}", password=password)
+                for n in range(first, first + users)
+            ],
+            batch_size=batch_size,
+        )
+
+        created_links: list[ShortenedURL] = []
+        for batch in batched(range(links), batch_size):
+            created_links += bulk_create_with_aliases(
+                [
+                    ShortenedURL(
+                        url=f"https://example.org/{seed}/{n}",
+                        owner=rng.choice(owners),
+                        is_public=rng.random() < 0.5,
+                    )
+                    for n in batch
+                ]
+            )
+
+        content = rng.randbytes(file_size)
+        created_files: list[UploadedFile] = []
+        for batch in batched(range(files), batch_size):
+            created_files += bulk_create_with_aliases(
+                [
+                    UploadedFile(
+                        file=ContentFile(content, name=f"bench-{n}.bin"),
+                        ext=".bin",
+                        owner=rng.choice(owners),
+                        is_public=rng.random() < 0.5,
+                    )
+                    for n in batch
+                ],
+                start_length=8,
+            )
+
+        # a few popular objects get most of the hits, like the real ones.
+        targets = [obj.view_path for obj in created_links + created_files]
+        cum_weights = list(accumulate(1 / (rank + 1) for rank in range(len(targets))))
+        now = timezone.now()
+        logged_count = 0
+        for batch in batched(range(requests if targets else 0), batch_size):
+            logged = Request.objects.bulk_create(
+                [
+                    Request(
+                        path=path,
+                        time=now - timedelta(seconds=rng.uniform(0, days * 86400)),
+                        ip=f"10.0.{rng.randrange(256)}.{rng.randrange(256)}",
+                        response=302,
+                        user_agent="seed_benchmark_data",
+                    )
+                    for path in rng.choices(
+                        targets, cum_weights=cum_weights, k=len(batch)
+                    )
+                ]
+            )
+            attribution.attribute_clicks(
+                [attribution.Click(r.path, r.pk, r.time) for r in logged]
+            )
+            logged_count += len(logged)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {len(owners)} users, {len(created_links)} links, "
+                f"{len(created_files)} files and {logged_count} requests"
+            )
+        )
@@ -0,0 +1,193 @@
+import os
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import UploadedFile, resharded_filename
+from core.utils import alias_cache
+
+# the depths --cleanup looks for leftovers of.
+MAX_DEPTH = 4
+
+
+def remove_empty_dirs(path: str, root: str) -> None:
+    directory = os.path.dirname(path)
+    while directory != root and directory.startswith(root):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return
+        directory = os.path.dirname(directory)
+
+
+def default_grace() -> float:
+    """
+    How long the old paths may still be served: a worker's local copy of
+    the alias entry lives up to ``local_timeout``, plus its copy in the
+    django cache when that one is local and wasn't invalidated by this
+    process, plus the time clients cache the file redirects.
+    """
+    aliases = alias_cache.uploaded_files
+    grace = aliases.local_timeout
+    if alias_cache.cache_is_local():
+        grace += aliases.timeout
+    return grace + getattr(settings, "FILE_CACHE_MAX_AGE", 0)
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the uploaded files to the FILE_HOSTING_SHARD_DEPTH (or --depth) "
+        "directory layout. Each file is hard linked to its new path and the "
+        "rows are updated in batches, the old paths of a batch are only "
+        "unlinked --grace seconds after it, once no worker can still serve "
+        "them from its cache. "
+        "Deduplicated files (under blobs/) are left alone. Interrupted runs "
+        "can be run again, --cleanup unlinks the old paths they left behind."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--depth",
+            type=int,
+            default=getattr(settings, "FILE_HOSTING_SHARD_DEPTH", 0),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+        )
+        parser.add_argument(
+            "--grace",
+            type=float,
+            help="Seconds to keep the old paths of a batch, by default as "
+            "long as the alias caches and clients may keep them.",
+        )
+        parser.add_argument(
+            "--cleanup",
+            action="store_true",
+            help="Also unlink the old paths left by interrupted runs.",
+        )
+
+    def handle(self, *args, depth, batch_size, grace, cleanup, **options):
+        if grace is None:
+            grace = default_grace()
+        if depth > MAX_DEPTH:
+            raise CommandError(f"--depth can't be more than {MAX_DEPTH}")
+        try:
+            root = default_storage.path("uploaded_files")
+        except NotImplementedError:
+            raise CommandError("The files have to be on a local file system")
+
+        files = (
+            UploadedFile.objects.filter(blob__isnull=True)
+            .exclude(file="")
+            .order_by("pk")
+            .values_list("pk", "alias", "ext", "file")
+        )
+        # (deadline, old paths) of the batches whose grace isn't over.
+        pending: deque[tuple[float, list[str]]] = deque()
+        moved = 0
+        last_pk = 0
+        while batch := list(files.filter(pk__gt=last_pk)[:batch_size]):
+            last_pk = batch[-1][0]
+            if paths := self.move_batch(batch, depth):
+                pending.append((time.monotonic() + grace, paths))
+                moved += len(paths)
+            self.unlink_old_paths(pending, root)
+            self.stdout.write(f"Up to file {last_pk}: {moved} moved")
+
+        if pending and grace:
+            self.stdout.write(
+                f"Waiting up to {grace}s before unlinking the last old paths"
+            )
+        self.unlink_old_paths(pending, root, wait=True)
+        cleaned = self.cleanup(files, root) if cleanup else 0
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Moved {moved} files to depth {depth}"
+                + (f", {cleaned} old paths cleaned up" if cleanup else "")
+            )
+        )
+
+    def move_batch(self, batch, depth: int) -> list[str]:
+        """
+        Links the files of ``batch`` to their new paths and points the rows
+        to them, returns the old paths to unlink.
+        """
+        links = []
+        for pk, alias, ext, name in batch:
+            new_name = resharded_filename(name, depth)
+            if new_name == name:
+                continue
+            old_path = default_storage.path(name)
+            new_path = default_storage.path(new_name)
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            try:
+                os.link(old_path, new_path)
+            except FileExistsError:
+                if not os.path.samefile(old_path, new_path):
+                    self.stderr.write(f"{new_path} exists, skipping file {pk}")
+                    continue
+            except FileNotFoundError:
+                self.stderr.write(f"{old_path} is missing, skipping file {pk}")
+                continue
+            links.append((pk, alias + (ext or ""), name, new_name))
+
+        moved = []
+        now = timezone.now()
+        with transaction.atomic():
+            for pk, _, name, new_name in links:
+                # only if it wasn't changed (or deleted) in the meantime.
+                if UploadedFile.objects.filter(pk=pk, file=name).update(
+                    file=new_name, updated_at=now
+                ):
+                    moved.append(default_storage.path(name))
+                else:
+                    new_path = default_storage.path(new_name)
+                    transaction.on_commit(lambda path=new_path: os.unlink(path))
+            alias_cache.uploaded_files.invalidate_many_on_commit(
+                [key for _, key, _, _ in links]
+            )
+        return moved
+
+    def unlink_old_paths(self, pending, root: str, wait: bool = False) -> None:
+        """
+        Unlinks the old paths of the batches whose grace is over, or of all
+        of them with ``wait``, sleeping until they are. An interrupted run
+        leaves the others to --cleanup.
+        """
+        while pending and (wait or pending[0][0] <= time.monotonic()):
+            deadline, paths = pending.popleft()
+            if wait:
+                time.sleep(max(deadline - time.monotonic(), 0))
+            for path in paths:
+                os.unlink(path)
+                remove_empty_dirs(path, root)
+
+    def cleanup(self, files, root: str) -> int:
+        """
+        Unlinks the other layouts' paths that are links to the current files.
+        """
+        cleaned = 0
+        for _, _, _, name in files.iterator(chunk_size=2000):
+            path = default_storage.path(name)
+            for other_depth in range(MAX_DEPTH + 1):
+                old_name = resharded_filename(name, other_depth)
+                if old_name == name:
+                    continue
+                old_path = default_storage.path(old_name)
+                try:
+                    if not os.path.samefile(old_path, path):
+                        continue
+                except FileNotFoundError:
+                    continue
+                os.unlink(old_path)
+                remove_empty_dirs(old_path, root)
+                cleaned += 1
+        return cleaned
@@ -0,0 +1,59 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpRequest
+
+from ..utils import budgets
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """
+    Logs the requests whose view ran more queries, or took longer, than its
+    budget in ``core.utils.budgets``. The response is left alone.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def check(self, request: HttpRequest, stats: budgets.QueryStats, started: float):
+        match = request.resolver_match
+        if match is None:
+            return
+        ms = (time.perf_counter() - started) * 1000
+        budget = budgets.over_budget(match.view_name, stats, ms)
+        if budget:
+            logger.warning(
+                "%s over budget: %d queries (budget %d, %.1fms in queries), "
+                "%.1fms (budget %s)",
+                match.view_name,
+                stats.queries,
+                budget.queries,
+                stats.duration * 1000,
+                ms,
+                "none" if budget.ms is None else f"{budget.ms}ms",
+                extra={"request": request},
+            )
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with budgets.track_queries() as stats:
+            response = self.get_response(request)
+        self.check(request, stats, started)
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        started = time.perf_counter()
+        with budgets.track_queries() as stats:
+            response = await self.get_response(request)
+        self.check(request, stats, started)
+        return response
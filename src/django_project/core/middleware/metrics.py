@@ -0,0 +1,64 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpRequest, HttpResponse
+
+from ..utils import budgets
+from ..utils.metrics import metrics
+
+REDIRECT_VIEWS = {
+    "core:url_shortener_url": "url",
+    "core:file_redirect": "file",
+}
+
+
+class MetricsMiddleware:
+    """
+    Records the latency and query count of every request by URL name, and
+    the responses of the redirect views, for ``/metrics``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def record(
+        self,
+        request: HttpRequest,
+        response: HttpResponse,
+        queries: budgets.QueryStats,
+        started: float,
+    ) -> None:
+        match = request.resolver_match
+        view = match.view_name if match else ""
+        metrics.observe(
+            "request_duration_seconds", time.perf_counter() - started, view=view
+        )
+        if queries.queries:
+            metrics.inc("db_queries_total", queries.queries, view=view)
+        if view in REDIRECT_VIEWS:
+            metrics.inc(
+                "redirects_total",
+                kind=REDIRECT_VIEWS[view],
+                status=str(response.status_code),
+            )
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with budgets.track_queries() as queries:
+            response = self.get_response(request)
+        self.record(request, response, queries, started)
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        started = time.perf_counter()
+        with budgets.track_queries() as queries:
+            response = await self.get_response(request)
+        self.record(request, response, queries, started)
+        return response
@@ -1,3 +1,4 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import HttpRequest
 from ipware import get_client_ip
 
@@ -8,13 +9,28 @@ class RealIPMiddleware:
         "::1",
     }
 
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
-    def __call__(self, request: HttpRequest):
+    def set_real_ip(self, request: HttpRequest):
         if request.META["REMOTE_ADDR"] in self.TRUSTED_PROXIES:
             ip, _ = get_client_ip(request)
             request.META["REMOTE_ADDR_DEFAULT"] = request.META["REMOTE_ADDR"]
             request.META["REMOTE_ADDR"] = ip
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.set_real_ip(request)
         response = self.get_response(request)
         return response
+
+    async def __acall__(self, request: HttpRequest):
+        self.set_real_ip(request)
+        response = await self.get_response(request)
+        return response
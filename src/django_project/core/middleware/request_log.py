@@ -0,0 +1,37 @@
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from request.middleware import RequestMiddleware
+
+logger = logging.getLogger(__name__)
+
+
+class DeferredRequestMiddleware(RequestMiddleware):
+    """
+    django-request's ``RequestMiddleware``, except that under ASGI the
+    request is logged after the response was handed back, in a background
+    task, instead of holding the response until the INSERT is done.
+    """
+
+    _tasks: set[asyncio.Task] = set()
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        task = asyncio.create_task(self._alog(request, response))
+        # keep a reference until it's done, the loop only holds weak ones.
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return response
+
+    async def _alog(self, request, response):
+        await sync_to_async(self._log, thread_sensitive=False)(request, response)
+
+    def _log(self, request, response):
+        try:
+            self.process_response(request, response)
+        except Exception:
+            logger.exception("Failed to log request %s", request.path)
+        finally:
+            close_old_connections()
@@ -0,0 +1,129 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.utils.text import slugify
+
+from ..utils import budgets, timing
+
+logger = logging.getLogger(__name__)
+
+# only one profiler can be active in a process.
+_profile_lock = threading.Lock()
+
+
+class ServerTimingMiddleware:
+    """
+    Adds a ``Server-Timing`` header with the queries, alias/trending cache
+    hits and misses, template render time and total time of the request,
+    and logs them as JSON for ``SERVER_TIMING_LOG_SAMPLE_RATE`` of the
+    requests. Sync requests of superusers sending the
+    ``SERVER_TIMING_PROFILE_HEADER`` are profiled, the cProfile stats are
+    dumped to ``SERVER_TIMING_PROFILE_DIR``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        timing.install_template_timer()
+
+    def wants_profile(self, request: HttpRequest) -> bool:
+        header = getattr(settings, "SERVER_TIMING_PROFILE_HEADER", "X-Profile")
+        if not request.headers.get(header):
+            return False
+        user = getattr(request, "user", None)
+        return user is not None and user.is_superuser
+
+    def profile(self, request: HttpRequest) -> HttpResponse:
+        if not _profile_lock.acquire(blocking=False):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        finally:
+            _profile_lock.release()
+
+        directory = getattr(settings, "SERVER_TIMING_PROFILE_DIR", None)
+        directory = directory or tempfile.gettempdir()
+        os.makedirs(directory, exist_ok=True)
+        name = (
+            f"{datetime.now():%Y%m%d-%H%M%S}-{slugify(request.path) or 'root'}"
+            f"-{os.getpid()}.prof"
+        )
+        profiler.dump_stats(os.path.join(directory, name))
+        logger.info("Profiled %s to %s", request.path, name)
+        response["X-Profile-File"] = name
+        return response
+
+    def finish(
+        self,
+        request: HttpRequest,
+        response: HttpResponse,
+        queries: budgets.QueryStats,
+        timings: timing.RequestTimings,
+        started: float,
+    ) -> None:
+        total = time.perf_counter() - started
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={queries.duration * 1000:.1f};desc="{queries.queries} queries"',
+                f'cache;desc="{timings.cache_hits} hits, '
+                f'{timings.cache_misses} misses"',
+                f"tpl;dur={timings.template_duration * 1000:.1f}",
+                f"total;dur={total * 1000:.1f}",
+            ]
+        )
+        if random.random() < getattr(settings, "SERVER_TIMING_LOG_SAMPLE_RATE", 0):
+            match = request.resolver_match
+            logger.info(
+                json.dumps(
+                    {
+                        "method": request.method,
+                        "path": request.path,
+                        "view": match.view_name if match else None,
+                        "status": response.status_code,
+                        "queries": queries.queries,
+                        "db_ms": round(queries.duration * 1000, 3),
+                        "cache_hits": timings.cache_hits,
+                        "cache_misses": timings.cache_misses,
+                        "template_ms": round(timings.template_duration * 1000, 3),
+                        "total_ms": round(total * 1000, 3),
+                    }
+                )
+            )
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with budgets.track_queries() as queries, timing.track_request() as timings:
+            if self.wants_profile(request):
+                response = self.profile(request)
+            else:
+                response = self.get_response(request)
+        self.finish(request, response, queries, timings, started)
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        started = time.perf_counter()
+        with budgets.track_queries() as queries, timing.track_request() as timings:
+            response = await self.get_response(request)
+        self.finish(request, response, queries, timings, started)
+        return response
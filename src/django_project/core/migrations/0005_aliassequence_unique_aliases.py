@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:42
+
+from django.db import migrations, models
+from django.db.models import Count
+
+from core.utils.url_shortener import generate_alias
+
+
+def realias_duplicates(apps, schema_editor):
+    """
+    Duplicated aliases already fail to resolve, keep the oldest row on the
+    alias and move the others to a new one so the constraints can be added.
+    """
+    for model_name, fields, length in [
+        ("ShortenedURL", ["alias"], 3),
+        ("UploadedFile", ["alias", "ext"], 8),
+    ]:
+        model = apps.get_model("core", model_name)
+        duplicates = (
+            model.objects.values(*fields)
+            .annotate(count=Count("id"))
+            .filter(count__gt=1)
+        )
+        for duplicate in duplicates:
+            lookup = {field: duplicate[field] for field in fields}
+            for instance in model.objects.filter(**lookup).order_by("id")[1:]:
+                alias = generate_alias(length)
+                while model.objects.filter(alias=alias).exists():
+                    alias = generate_alias(length)
+                instance.alias = alias
+                instance.save(update_fields=["alias"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0004_shortenedurl_requests_uploadedfile_requests"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AliasSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                ("next_value", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(realias_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="shortenedurl",
+            constraint=models.UniqueConstraint(
+                fields=("alias",), name="unique_shortenedurl_alias"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="uploadedfile",
+            constraint=models.UniqueConstraint(
+                fields=("alias", "ext"), name="unique_uploadedfile_alias_ext"
+            ),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0005_aliassequence_unique_aliases"),
+        ("request", "0008_alter_request_response_choices"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShortenedURLDailyViewCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("count", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="UploadedFileDailyViewCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("count", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="shortenedurl",
+            name="view_count",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="uploadedfile",
+            name="view_count",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="shortenedurl",
+            index=models.Index(
+                fields=["is_public", "-view_count"], name="shortenedurl_trending_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="uploadedfile",
+            index=models.Index(
+                fields=["is_public", "-view_count"], name="uploadedfile_trending_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="shortenedurldailyviewcount",
+            name="instance",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="daily_view_counts",
+                to="core.shortenedurl",
+            ),
+        ),
+        migrations.AddField(
+            model_name="uploadedfiledailyviewcount",
+            name="instance",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="daily_view_counts",
+                to="core.uploadedfile",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="shortenedurldailyviewcount",
+            index=models.Index(fields=["day"], name="shortenedurl_daily_day_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="shortenedurldailyviewcount",
+            constraint=models.UniqueConstraint(
+                fields=("instance", "day"), name="unique_shortenedurl_daily_view_count"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="uploadedfiledailyviewcount",
+            index=models.Index(fields=["day"], name="uploadedfile_daily_day_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="uploadedfiledailyviewcount",
+            constraint=models.UniqueConstraint(
+                fields=("instance", "day"), name="unique_uploadedfile_daily_view_count"
+            ),
+        ),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0007_fileblob"),
+        ("request", "0008_alter_request_response_choices"),
+    ]
+
+    operations = [
+        # the through tables stay, they only get a model of their own.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="ShortenedURLRequest",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        (
+                            "request",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="+",
+                                to="request.request",
+                            ),
+                        ),
+                        (
+                            "shortenedurl",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                to="core.shortenedurl",
+                            ),
+                        ),
+                    ],
+                    options={
+                        "db_table": "core_shortenedurl_requests",
+                        "unique_together": {("shortenedurl", "request")},
+                    },
+                ),
+                migrations.CreateModel(
+                    name="UploadedFileRequest",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        (
+                            "request",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="+",
+                                to="request.request",
+                            ),
+                        ),
+                        (
+                            "uploadedfile",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                to="core.uploadedfile",
+                            ),
+                        ),
+                    ],
+                    options={
+                        "db_table": "core_uploadedfile_requests",
+                        "unique_together": {("uploadedfile", "request")},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name="shortenedurl",
+                    name="requests",
+                    field=models.ManyToManyField(
+                        blank=True,
+                        through="core.ShortenedURLRequest",
+                        to="request.request",
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="uploadedfile",
+                    name="requests",
+                    field=models.ManyToManyField(
+                        blank=True,
+                        through="core.UploadedFileRequest",
+                        to="request.request",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="shortenedurlrequest",
+            name="request",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to="request.request",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="uploadedfilerequest",
+            name="request",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to="request.request",
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0008_request_references"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RequestDailyPathCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("path", models.CharField(max_length=255)),
+                ("day", models.DateField()),
+                ("count", models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["day"], name="request_daily_day_idx")],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("path", "day"), name="unique_request_daily_path_count"
+                    )
+                ],
+            },
+        ),
+    ]
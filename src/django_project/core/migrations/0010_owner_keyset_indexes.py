@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0009_request_daily_path_count"),
+        ("request", "0008_alter_request_response_choices"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="shortenedurl",
+            index=models.Index(
+                fields=["owner", "inserted_at", "id"],
+                name="shortenedurl_owner_keyset_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="uploadedfile",
+            index=models.Index(
+                fields=["owner", "inserted_at", "id"],
+                name="uploadedfile_owner_keyset_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0012_api_token"),
+        ("request", "0008_alter_request_response_choices"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="shortenedurl",
+            index=models.Index(fields=["updated_at"], name="shortenedurl_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="uploadedfile",
+            index=models.Index(fields=["updated_at"], name="uploadedfile_updated_idx"),
+        ),
+    ]
@@ -1,15 +1,22 @@
+import hashlib
 import os
+import secrets
+import threading
 import typing as t
 import uuid
 from collections.abc import Sequence
 
 import request
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.urls import reverse
 from request.models import Request
 
-from .utils.url_shortener import available_chars, generate_alias
+from .utils import alias_filter
+from .utils.file_metadata import FileMetadata, read_file_metadata
+from .utils.url_shortener import sequence_to_alias
 
 User = get_user_model()
 
@@ -18,9 +25,11 @@ class StatisticsModelMixin(models.Model):
     class Meta:
         abstract = True
 
-    requests = models.ManyToManyField(
-        Request,
-        blank=True,
+    # denormalized count of the subclasses' ``requests`` (see
+    # ``RequestReferenceMixin``), kept up to date by the click
+    # attribution, see ``DailyViewCountMixin`` for the per day counts.
+    view_count = models.PositiveBigIntegerField(
+        default=0,
     )
 
 
@@ -54,6 +63,11 @@ class ShortenedURL(
 ):
     alias = models.TextField()
     url = models.TextField()
+    requests = models.ManyToManyField(
+        Request,
+        through="ShortenedURLRequest",
+        blank=True,
+    )
     owner = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
@@ -70,6 +84,30 @@ class ShortenedURL(
         default=False,
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["alias"],
+                name="unique_shortenedurl_alias",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["is_public", "-view_count"],
+                name="shortenedurl_trending_idx",
+            ),
+            # the keyset pagination of the owner's list.
+            models.Index(
+                fields=["owner", "inserted_at", "id"],
+                name="shortenedurl_owner_keyset_idx",
+            ),
+            # the catch-up of the alias filters.
+            models.Index(
+                fields=["updated_at"],
+                name="shortenedurl_updated_idx",
+            ),
+        ]
+
     def visibility(self):
         if self.is_public:
             return "Public"
@@ -78,11 +116,30 @@ class ShortenedURL(
 
     @classmethod
     def create(cls, url: str, owner: User | None = None, is_public=False):
-        return cls.objects.create(
-            alias=get_alias(cls),
-            url=url,
-            owner=owner,
-            is_public=is_public,
+        return create_with_alias(
+            cls(
+                url=url,
+                owner=owner,
+                is_public=is_public,
+            )
+        )
+
+    @classmethod
+    def create_many(
+        cls,
+        urls: list[str],
+        owner: User | None = None,
+        is_public=False,
+    ) -> list["ShortenedURL"]:
+        return bulk_create_with_aliases(
+            [
+                cls(
+                    url=url,
+                    owner=owner,
+                    is_public=is_public,
+                )
+                for url in urls
+            ]
         )
 
     def url_display(self) -> str:
@@ -99,8 +156,113 @@ class ShortenedURL(
         return {"alias": self.alias}
 
 
+def shard_dirs(name: str, depth: int | None = None) -> list[str]:
+    """
+    The ``FILE_HOSTING_SHARD_DEPTH`` levels of two characters of ``name``
+    its directory goes under, so none gets millions of entries.
+    """
+    if depth is None:
+        depth = getattr(settings, "FILE_HOSTING_SHARD_DEPTH", 0)
+    return [name[i : i + 2] for i in range(0, depth * 2, 2)]
+
+
 def uploaded_filename(_instance, filename):
-    return "/".join(["uploaded_files", uuid.uuid4().hex, filename])
+    directory = uuid.uuid4().hex
+    return "/".join(["uploaded_files", *shard_dirs(directory), directory, filename])
+
+
+def resharded_filename(name: str, depth: int) -> str:
+    """
+    Where the ``uploaded_filename`` ``name`` goes with ``depth`` shard levels,
+    names it didn't make stay where they are.
+    """
+    parts = name.split("/")
+    if len(parts) < 3 or parts[0] != "uploaded_files":
+        return name
+    *_, directory, filename = parts
+    if len(directory) != 32:
+        return name
+    return "/".join(
+        ["uploaded_files", *shard_dirs(directory, depth), directory, filename]
+    )
+
+
+def blob_filename(instance: "FileBlob", filename):
+    _, ext = os.path.splitext(filename)
+    digest = instance.digest
+    return "/".join(["blobs", digest[:2], digest[2:4], digest + ext])
+
+
+def uploaded_file_metadata(file) -> FileMetadata:
+    """
+    The ``metadata`` the upload handler recorded, read from ``file`` when it
+    didn't come through it.
+    """
+    metadata = getattr(file, "metadata", None)
+    if metadata is None:
+        metadata = read_file_metadata(file, file.name)
+        file.seek(0)
+        file.sha256 = metadata.checksum
+    return metadata
+
+
+def file_sha256(file) -> str:
+    digest = getattr(file, "sha256", None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()
+
+
+class FileBlob(models.Model):
+    """
+    A file stored once under its sha256 digest and shared by every
+    ``UploadedFile`` with the same content (see
+    ``FILE_HOSTING_CONTENT_ADDRESSED``). ``refcount`` counts those, the blob
+    (and, through django_cleanup, its file) is deleted with the last one.
+    """
+
+    digest = models.CharField(
+        max_length=64,
+        unique=True,
+    )
+    file = models.FileField(upload_to=blob_filename)
+    refcount = models.PositiveIntegerField(
+        default=0,
+    )
+    inserted_at = models.DateTimeField(
+        auto_now_add=True,
+    )
+
+    def __str__(self):
+        return f"{self.digest} ({self.refcount})"
+
+    @classmethod
+    def acquire(cls, file, digest: str) -> "FileBlob":
+        with transaction.atomic():
+            if cls.objects.filter(digest=digest).update(refcount=F("refcount") + 1):
+                return cls.objects.get(digest=digest)
+            blob = cls(digest=digest, refcount=1)
+            try:
+                with transaction.atomic():
+                    blob.file.save(file.name, file, save=False)
+                    blob.save(force_insert=True)
+                return blob
+            except IntegrityError:
+                # the same content was uploaded concurrently.
+                blob.file.delete(save=False)
+            cls.objects.filter(digest=digest).update(refcount=F("refcount") + 1)
+            return cls.objects.get(digest=digest)
+
+    @classmethod
+    def release(cls, pk: int) -> None:
+        with transaction.atomic():
+            cls.objects.filter(pk=pk).update(refcount=F("refcount") - 1)
+            for blob in cls.objects.filter(pk=pk, refcount__lte=0):
+                blob.delete()
 
 
 class UploadedFile(
@@ -113,7 +275,42 @@ class UploadedFile(
         null=True,
         blank=True,
     )
-    file = models.FileField(upload_to=uploaded_filename)
+    # empty when the content lives in ``blob``, see ``stored_file``.
+    file = models.FileField(
+        upload_to=uploaded_filename,
+        blank=True,
+    )
+    blob = models.ForeignKey(
+        FileBlob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="uploaded_files",
+    )
+    original_name = models.TextField(
+        null=True,
+        blank=True,
+    )
+    # recorded at upload time (or by backfill_file_metadata), so rendering a
+    # list doesn't stat the storage for every row. The checksum is a sha256.
+    size = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+    )
+    content_type = models.TextField(
+        null=True,
+        blank=True,
+    )
+    checksum = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+    )
+    requests = models.ManyToManyField(
+        Request,
+        through="UploadedFileRequest",
+        blank=True,
+    )
     owner = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
@@ -130,6 +327,30 @@ class UploadedFile(
         default=False,
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["alias", "ext"],
+                name="unique_uploadedfile_alias_ext",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["is_public", "-view_count"],
+                name="uploadedfile_trending_idx",
+            ),
+            # the keyset pagination of the owner's list.
+            models.Index(
+                fields=["owner", "inserted_at", "id"],
+                name="uploadedfile_owner_keyset_idx",
+            ),
+            # the catch-up of the alias filters.
+            models.Index(
+                fields=["updated_at"],
+                name="uploadedfile_updated_idx",
+            ),
+        ]
+
     def visibility(self):
         if self.is_public:
             return "Public"
@@ -144,22 +365,36 @@ class UploadedFile(
         is_public=False,
     ):
         _, ext = os.path.splitext(file.name)
-        return cls.objects.create(
-            alias=get_alias(cls, 8),
+        metadata = uploaded_file_metadata(file)
+        instance = cls(
             ext=ext,
-            file=file,
             owner=owner,
             is_public=is_public,
+            size=metadata.size,
+            content_type=metadata.content_type,
+            checksum=metadata.checksum,
         )
+        if getattr(settings, "FILE_HOSTING_CONTENT_ADDRESSED", False):
+            instance.original_name = os.path.basename(file.name)
+            with transaction.atomic():
+                instance.blob = FileBlob.acquire(file, file_sha256(file))
+                return create_with_alias(instance, start_length=8)
+        instance.file = file
+        return create_with_alias(instance, start_length=8)
+
+    @property
+    def stored_file(self):
+        return self.blob.file if self.blob_id else self.file
 
     def alias_filename(self):
         return self.alias + self.ext
 
     def filename(self):
-        return os.path.basename(self.file.url)
+        return self.original_name or os.path.basename(self.file.name)
 
     def file_size_mb(self):
-        return round(self.file.size / 1024 / 1024, 4)
+        size = self.stored_file.size if self.size is None else self.size
+        return round(size / 1024 / 1024, 4)
 
     @property
     @t.override
@@ -172,11 +407,334 @@ class UploadedFile(
         return {"alias_filename": self.alias_filename()}
 
 
+class RequestReferenceMixin(models.Model):
+    """
+    A row of ``StatisticsModelMixin.requests``.
+
+    The logged requests may live in another database (see ``core.routers``),
+    so they are only referenced by id: no foreign key constraint and deleting
+    them leaves these rows alone.
+    """
+
+    request = models.ForeignKey(
+        Request,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+
+    class Meta:
+        abstract = True
+
+
+class ShortenedURLRequest(RequestReferenceMixin):
+    shortenedurl = models.ForeignKey(
+        ShortenedURL,
+        on_delete=models.CASCADE,
+    )
+
+    class Meta:
+        db_table = "core_shortenedurl_requests"
+        unique_together = [("shortenedurl", "request")]
+
+
+class UploadedFileRequest(RequestReferenceMixin):
+    uploadedfile = models.ForeignKey(
+        UploadedFile,
+        on_delete=models.CASCADE,
+    )
+
+    class Meta:
+        db_table = "core_uploadedfile_requests"
+        unique_together = [("uploadedfile", "request")]
+
+
+class DailyViewCountMixin(models.Model):
+    day = models.DateField()
+    count = models.PositiveBigIntegerField(
+        default=0,
+    )
+
+    class Meta:
+        abstract = True
+
+
+class ShortenedURLDailyViewCount(DailyViewCountMixin):
+    instance = models.ForeignKey(
+        ShortenedURL,
+        on_delete=models.CASCADE,
+        related_name="daily_view_counts",
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["instance", "day"],
+                name="unique_shortenedurl_daily_view_count",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["day"], name="shortenedurl_daily_day_idx"),
+        ]
+
+
+class UploadedFileDailyViewCount(DailyViewCountMixin):
+    instance = models.ForeignKey(
+        UploadedFile,
+        on_delete=models.CASCADE,
+        related_name="daily_view_counts",
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["instance", "day"],
+                name="unique_uploadedfile_daily_view_count",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["day"], name="uploadedfile_daily_day_idx"),
+        ]
+
+
+class RequestDailyPathCount(models.Model):
+    """
+    Number of logged requests per path and day, kept for the days whose
+    ``Request`` rows were pruned (see ``core.utils.retention``).
+    """
+
+    path = models.CharField(max_length=255)
+    day = models.DateField()
+    count = models.PositiveBigIntegerField(
+        default=0,
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["path", "day"],
+                name="unique_request_daily_path_count",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["day"], name="request_daily_day_idx"),
+        ]
+
+
+def daily_view_count_model(
+    model: type[StatisticsModelMixin],
+) -> type[DailyViewCountMixin]:
+    return model._meta.get_field("daily_view_counts").related_model
+
+
+class AliasSequence(models.Model):
+    """
+    Next unused alias sequence number per model.
+
+    Workers reserve numbers from it in blocks, so it is written once per
+    ``ALIAS_BLOCK_SIZE`` created objects rather than once per object.
+    """
+
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+    )
+    next_value = models.PositiveBigIntegerField(
+        default=0,
+    )
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
+def hash_api_token(key: str) -> str:
+    # the keys are random, a fast hash is enough.
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class APIToken(models.Model):
+    """
+    Authenticates the scripts calling the JSON endpoints, which send it as
+    ``Authorization: Bearer <key>`` instead of a session and a CSRF token.
+    Only the sha256 of the key is stored, the key itself is shown once.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="api_tokens",
+    )
+    name = models.TextField(
+        blank=True,
+    )
+    key_hash = models.CharField(
+        max_length=64,
+        unique=True,
+    )
+    inserted_at = models.DateTimeField(
+        auto_now_add=True,
+    )
+
+    def __str__(self):
+        return f"{self.user}: {self.name or self.pk}"
+
+    @classmethod
+    def create(cls, user, name: str = "") -> tuple["APIToken", str]:
+        """
+        Creates a token for ``user``, returns it with its key.
+        """
+        key = secrets.token_urlsafe(32)
+        return cls.objects.create(
+            user=user, name=name, key_hash=hash_api_token(key)
+        ), key
+
+    @classmethod
+    def authenticate(cls, authorization: str):
+        """
+        The active user of the token in an Authorization header, or None.
+        """
+        scheme, _, key = authorization.partition(" ")
+        if scheme.lower() != "bearer" or not key.strip():
+            return None
+        token = (
+            cls.objects.select_related("user")
+            .filter(key_hash=hash_api_token(key.strip()), user__is_active=True)
+            .first()
+        )
+        return token.user if token else None
+
+
+class AliasAllocator:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._blocks: dict[str, range] = {}
+
+    @property
+    def block_size(self) -> int:
+        return getattr(settings, "ALIAS_BLOCK_SIZE", 64)
+
+    def _reserve(self, model: type[models.Model], count: int) -> range:
+        name = model._meta.label_lower
+        with transaction.atomic():
+            # update first so the write lock is taken before reading.
+            updated = AliasSequence.objects.filter(name=name).update(
+                next_value=F("next_value") + count
+            )
+            if not updated:
+                # one time seed, so aliases keep the length today's row
+                # count would give them.
+                AliasSequence.objects.get_or_create(
+                    name=name,
+                    defaults={"next_value": model.objects.count()},
+                )
+                AliasSequence.objects.filter(name=name).update(
+                    next_value=F("next_value") + count
+                )
+            end = AliasSequence.objects.values_list("next_value", flat=True).get(
+                name=name
+            )
+        return range(end - count, end)
+
+    def sequences(self, model: type[models.Model], count: int = 1) -> list[int]:
+        name = model._meta.label_lower
+        with self._lock:
+            block = self._blocks.get(name, range(0))
+            if len(block) >= count:
+                self._blocks[name] = block[count:]
+                return list(block[:count])
+            reserved = self._reserve(model, max(count - len(block), self.block_size))
+            taken = list(block) + list(reserved[: count - len(block)])
+            self._blocks[name] = reserved[count - len(block) :]
+            return taken
+
+    def reset(self) -> None:
+        """
+        Forgets the reserved blocks, for when the sequences were reset.
+        """
+        with self._lock:
+            self._blocks.clear()
+
+    def aliases(
+        self,
+        model: type[models.Model],
+        start_length: int = 3,
+        count: int = 1,
+    ) -> list[str]:
+        secret = getattr(settings, "ALIAS_PERMUTATION_KEY", None) or settings.SECRET_KEY
+        return [
+            sequence_to_alias(
+                sequence,
+                secret,
+                model._meta.label_lower,
+                start_length,
+            )
+            for sequence in self.sequences(model, count)
+        ]
+
+
+alias_allocator = AliasAllocator()
+
+
 def get_alias(model: type[UploadedFile] | type[ShortenedURL], start_length=3) -> str:
-    current_length = start_length
-    while model.objects.count() / (len(available_chars) ** current_length) >= 0.3:
-        current_length += 1
-    alias = generate_alias(current_length)
-    while model.objects.filter(alias=alias).exists():
-        alias = generate_alias(current_length)
-    return alias
+    return alias_allocator.aliases(model, start_length)[0]
+
+
+def create_with_alias[M: (ShortenedURL, UploadedFile)](
+    instance: M,
+    start_length: int = 3,
+) -> M:
+    """
+    Inserts ``instance`` under a freshly allocated alias.
+
+    Allocated aliases never collide with each other, only with rows created
+    before the allocator existed; the unique constraint catches those and the
+    next alias is tried.
+    """
+    for _ in range(getattr(settings, "ALIAS_MAX_ATTEMPTS", 10) - 1):
+        instance.alias = get_alias(type(instance), start_length)
+        try:
+            with transaction.atomic():
+                instance.save(force_insert=True)
+            return instance
+        except IntegrityError:
+            continue
+    instance.alias = get_alias(type(instance), start_length)
+    instance.save(force_insert=True)
+    return instance
+
+
+def bulk_create_with_aliases[M: (ShortenedURL, UploadedFile)](
+    instances: list[M],
+    start_length: int = 3,
+    batch_size: int = 500,
+) -> list[M]:
+    """
+    ``create_with_alias`` for many instances: the aliases are allocated in
+    one pass, checked against the existing rows ``batch_size`` at a time and
+    the instances inserted with ``bulk_create``, all in one transaction.
+    """
+    if not instances:
+        return instances
+    model = type(instances[0])
+    with transaction.atomic():
+        pending = instances
+        for _ in range(getattr(settings, "ALIAS_MAX_ATTEMPTS", 10)):
+            aliases = alias_allocator.aliases(model, start_length, len(pending))
+            for instance, alias in zip(pending, aliases):
+                instance.alias = alias
+            taken: set[str] = set()
+            for i in range(0, len(aliases), batch_size):
+                taken.update(
+                    model.objects.filter(
+                        alias__in=aliases[i : i + batch_size]
+                    ).values_list("alias", flat=True)
+                )
+            pending = [instance for instance in pending if instance.alias in taken]
+            if not pending:
+                break
+        else:
+            raise IntegrityError("Could not allocate free aliases.")
+        model.objects.bulk_create(instances, batch_size=batch_size)
+        # bulk_create sends no post_save.
+        transaction.on_commit(alias_filter.touch_stamp)
+    return instances
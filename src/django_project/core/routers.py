@@ -0,0 +1,47 @@
+from django.db import DEFAULT_DB_ALIAS
+
+REQUEST_LOG_DATABASE = "request_log"
+
+
+class RequestLogRouter:
+    """
+    Keeps django-request's ``Request`` log in the ``request_log`` database,
+    so logging every hit never waits on (or holds) the lock of the database
+    links and files are written to.
+
+    The rows attributing requests to objects stay with the objects and only
+    reference the requests by id, see ``RequestReferenceMixin``.
+    """
+
+    app_labels = {"request"}
+
+    def is_routed(self, model) -> bool:
+        return model._meta.app_label in self.app_labels
+
+    def db_for_model(self, model, hints):
+        if self.is_routed(model):
+            return REQUEST_LOG_DATABASE
+        # e.g. Request.user, django would look it up where the request is.
+        instance = hints.get("instance")
+        if instance is not None and self.is_routed(instance):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self.db_for_model(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_model(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Request.user, the attribution rows and the admin only use the ids.
+        if self.is_routed(obj1) or self.is_routed(obj2):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REQUEST_LOG_DATABASE:
+            return app_label in self.app_labels
+        if app_label in self.app_labels:
+            return False
+        return None
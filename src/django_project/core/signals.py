@@ -1,15 +1,64 @@
-from django.db.models.signals import post_save
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from request.models import Request
 
-from .utils.statistics import resolve_url_path_to_db_instance
+from .models import FileBlob, ShortenedURL, UploadedFile
+from .utils import alias_cache, attribution, budgets, trending
 
 
 @receiver(post_save, sender=Request)
 def add_request_to_m2m_field(sender, instance, created, **kwargs):
-    if not created:
+    # errors (e.g. the 404s of scanners probing aliases) aren't views.
+    if not created or instance.response >= 400:
         return
-    m = resolve_url_path_to_db_instance(instance.path)
-    if not m:
+    attribution.buffer.enqueue(instance.path, instance.pk, instance.time)
+
+
+@receiver(pre_save, sender=ShortenedURL)
+def invalidate_previous_url_alias(sender, instance, raw, **kwargs):
+    if raw or instance._state.adding:
+        return
+    previous = sender.objects.filter(pk=instance.pk).first()
+    if previous and alias_cache.url_key(previous) != alias_cache.url_key(instance):
+        alias_cache.shortened_urls.invalidate_on_commit(alias_cache.url_key(previous))
+
+
+@receiver(pre_save, sender=UploadedFile)
+def invalidate_previous_file_alias(sender, instance, raw, **kwargs):
+    if raw or instance._state.adding:
         return
-    m.requests.add(instance)
+    previous = sender.objects.filter(pk=instance.pk).first()
+    if previous and alias_cache.file_key(previous) != alias_cache.file_key(instance):
+        alias_cache.uploaded_files.invalidate_on_commit(alias_cache.file_key(previous))
+
+
+@receiver(post_save, sender=ShortenedURL)
+@receiver(post_delete, sender=ShortenedURL)
+def invalidate_url_alias(sender, instance, **kwargs):
+    alias_cache.shortened_urls.invalidate_on_commit(alias_cache.url_key(instance))
+
+
+@receiver(post_save, sender=UploadedFile)
+@receiver(post_delete, sender=UploadedFile)
+def invalidate_file_alias(sender, instance, **kwargs):
+    alias_cache.uploaded_files.invalidate_on_commit(alias_cache.file_key(instance))
+
+
+@receiver(post_delete, sender=ShortenedURL)
+@receiver(post_delete, sender=UploadedFile)
+def invalidate_trending(sender, instance, **kwargs):
+    # keeps deleted objects from being listed until the next refresh.
+    if instance.is_public:
+        trending.invalidate()
+
+
+@receiver(post_delete, sender=UploadedFile)
+def release_file_blob(sender, instance, **kwargs):
+    if instance.blob_id:
+        FileBlob.release(instance.blob_id)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    budgets.install_query_recorder(connection)
@@ -1,3 +1,1041 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import tempfile
+import warnings
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError
+from django.http import Http404, QueryDict
+from django.test import AsyncRequestFactory, Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from request.models import Request
+
+from . import models, urls, views
+from .management.commands import shard_uploaded_files
+from .utils import (
+    alias_cache,
+    alias_filter,
+    attribution,
+    budgets,
+    common,
+    delivery,
+    file_metadata,
+    jsonl,
+    metrics_files,
+    retention,
+    trending,
+    uploads,
+    url_shortener,
+)
+
+User = get_user_model()
+
+
+@override_settings(ALIAS_BLOCK_SIZE=8)
+class AliasAllocatorTests(TestCase):
+    def setUp(self):
+        models.alias_allocator.reset()
+        self.addCleanup(models.alias_allocator.reset)
+
+    def sequence(self) -> int:
+        return models.AliasSequence.objects.get(
+            name=models.ShortenedURL._meta.label_lower
+        ).next_value
+
+    def test_aliases_are_unique(self):
+        aliases = models.alias_allocator.aliases(models.ShortenedURL, count=500)
+        aliases += [models.get_alias(models.ShortenedURL) for _ in range(100)]
+        self.assertEqual(len(set(aliases)), 600)
+
+    def test_sequence_is_reserved_in_blocks(self):
+        models.get_alias(models.ShortenedURL)
+        self.assertEqual(self.sequence(), 8)
+        for _ in range(7):
+            models.get_alias(models.ShortenedURL)
+        self.assertEqual(self.sequence(), 8)
+        models.get_alias(models.ShortenedURL)
+        self.assertEqual(self.sequence(), 16)
+        # a bigger request than a block reserves what it needs.
+        models.alias_allocator.aliases(models.ShortenedURL, count=20)
+        self.assertEqual(self.sequence(), 16 + 13)
+
+    def test_aliases_grow_once_a_length_fills_up(self):
+        capacity = int(len(url_shortener.available_chars) ** 3 * 0.3)
+        self.assertEqual(url_shortener.alias_slot(capacity - 1), (3, capacity - 1))
+        self.assertEqual(url_shortener.alias_slot(capacity), (4, 0))
+        models.AliasSequence.objects.create(
+            name=models.ShortenedURL._meta.label_lower, next_value=capacity - 1
+        )
+        first, second = models.alias_allocator.aliases(models.ShortenedURL, count=2)
+        self.assertEqual((len(first), len(second)), (3, 4))
+
+    def test_create_with_alias_skips_taken_aliases(self):
+        taken = models.alias_allocator.aliases(models.ShortenedURL, count=2)
+        models.alias_allocator.reset()
+        models.AliasSequence.objects.all().delete()
+        for alias in taken:
+            models.ShortenedURL.objects.create(alias=alias, url="https://example.org/")
+        # the seed starts at the row count, make it reuse the taken ones.
+        models.AliasSequence.objects.create(
+            name=models.ShortenedURL._meta.label_lower, next_value=0
+        )
+        url = models.ShortenedURL.create("https://example.org/new")
+        self.assertNotIn(url.alias, taken)
+        self.assertEqual(models.ShortenedURL.objects.count(), 3)
+
+    @override_settings(ALIAS_MAX_ATTEMPTS=2)
+    def test_create_with_alias_gives_up(self):
+        taken = models.alias_allocator.aliases(models.ShortenedURL, count=2)
+        models.alias_allocator.reset()
+        models.AliasSequence.objects.filter().update(next_value=0)
+        for alias in taken:
+            models.ShortenedURL.objects.create(alias=alias, url="https://example.org/")
+        with self.assertRaises(IntegrityError):
+            models.ShortenedURL.create("https://example.org/new")
+
+
+@override_settings(ATTRIBUTION_BUFFERED=False, FILE_HOSTING_MAX_SIZE=1024)
+class UploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("upload", password="upload")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def upload(self, content: bytes, name: str = "upload.txt"):
+        return self.client.post(
+            reverse("core:file_hosting"),
+            {"file": SimpleUploadedFile(name, content)},
+        )
+
+    def test_uploads_over_the_limit_are_rejected(self):
+        response = self.upload(b"x" * 2048)
+        self.assertContains(response, "File too large")
+        self.assertFalse(models.UploadedFile.objects.exists())
+
+    def test_uploads_within_the_limit_are_stored(self):
+        response = self.upload(b"x" * 512)
+        self.assertNotContains(response, "File too large")
+        self.assertEqual(
+            models.UploadedFile.objects.get().stored_file.read(), b"x" * 512
+        )
+
+    def test_handler_stops_past_the_limit(self):
+        # whatever the Content-Length, which was checked against it before.
+        handler = uploads.FileHostingUploadHandler(max_size=10)
+        handler.new_file("file", "upload.txt", "text/plain", None)
+        self.addCleanup(handler.upload_interrupted)
+        handler.receive_data_chunk(b"x" * 8, 0)
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(b"x" * 8, 8)
+        self.assertTrue(handler.too_large)
+        # the partial upload is gone already.
+        self.assertFalse(os.path.exists(handler.file.temporary_file_path()))
+
+
+@override_settings(FILE_HOSTING_CONTENT_ADDRESSED=True)
+class FileBlobTests(TestCase):
+    def upload(self, content: bytes, name: str) -> models.UploadedFile:
+        return models.UploadedFile.create(SimpleUploadedFile(name, content), None)
+
+    def test_identical_uploads_share_a_blob(self):
+        first = self.upload(b"same", "first.txt")
+        second = self.upload(b"same", "second.txt")
+        other = self.upload(b"other", "first.txt")
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertNotEqual(first.blob_id, other.blob_id)
+        self.assertEqual(models.FileBlob.objects.get(pk=first.blob_id).refcount, 2)
+        self.assertEqual(second.filename(), "second.txt")
+
+    def test_blob_is_deleted_with_its_last_file(self):
+        first = self.upload(b"same", "first.txt")
+        second = self.upload(b"same", "second.txt")
+        blob = models.FileBlob.objects.get(pk=first.blob_id)
+        first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(models.FileBlob.objects.filter(pk=blob.pk).exists())
+        self.assertFalse(blob.file.storage.exists(blob.file.name))
+
+
+@override_settings(ATTRIBUTION_BUFFERED=False, FILE_DELIVERY_MODE="direct")
+class ConditionalRequestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.url = models.ShortenedURL.create("https://example.org/", None)
+        cls.file = models.UploadedFile.create(
+            SimpleUploadedFile("digits.txt", b"0123456789"), None
+        )
+
+    def setUp(self):
+        alias_cache.shortened_urls.local.clear()
+        alias_cache.uploaded_files.local.clear()
+        self.paths = [
+            reverse("core:url_shortener_url", args=[self.url.alias]),
+            reverse("core:file_redirect", args=[self.file.alias_filename()]),
+        ]
+
+    def test_matching_etag_is_not_modified(self):
+        for path in self.paths:
+            with self.subTest(path):
+                etag = self.client.get(path)["ETag"]
+                response = self.client.get(path, headers={"If-None-Match": etag})
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+
+    def test_other_etag_is_sent_again(self):
+        for path in self.paths:
+            with self.subTest(path):
+                response = self.client.get(path, headers={"If-None-Match": '"other"'})
+                self.assertIn(response.status_code, (200, 302))
+
+    def test_etag_changes_with_the_target(self):
+        path = self.paths[0]
+        etag = self.client.get(path)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.url.url = "https://example.org/changed"
+            self.url.save()
+        response = self.client.get(path, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 302)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_outdated_if_range_sends_the_whole_file(self):
+        path = self.paths[1]
+        response = self.client.get(
+            path, headers={"Range": "bytes=2-4", "If-Range": '"other"'}
+        )
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        response = self.client.get(
+            path, headers={"Range": "bytes=2-4", "If-Range": etag}
+        )
+        self.assertEqual(response.status_code, 206)
+
+
+@override_settings(ATTRIBUTION_BUFFERED=False, FILE_DELIVERY_MODE="direct")
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.url = models.ShortenedURL.create("https://example.org/", None)
+        cls.file = models.UploadedFile.create(
+            SimpleUploadedFile("digits.txt", b"0123456789"), None
+        )
+        cls.content = os.urandom(200 * 1024)
+        cls.large_file = models.UploadedFile.create(
+            SimpleUploadedFile("large.bin", cls.content), None
+        )
+
+    def setUp(self):
+        # manage.py's gevent patching runs sync_to_async in the event loop's
+        # thread, where the database can't be used: the lookups are cached
+        # by the sync path first.
+        self.factory = AsyncRequestFactory()
+        alias_cache.shortened_urls.get(self.url.alias)
+        alias_cache.shortened_urls.get("missing")
+        alias_cache.uploaded_files.get(self.file.alias_filename())
+        alias_cache.uploaded_files.get(self.large_file.alias_filename())
+
+    async def test_url_redirect(self):
+        request = self.factory.get("/")
+        response = await views.url_shortener_url_async(request, self.url.alias)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response["Location"], self.url.url)
+
+    async def test_file(self):
+        request = self.factory.get("/")
+        response = await views.file_redirect_async(request, self.file.alias_filename())
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("ETag", response)
+
+    async def test_missing_alias(self):
+        with self.assertRaises(Http404):
+            await views.url_shortener_url_async(self.factory.get("/"), "missing")
+
+    async def test_file_is_streamed(self):
+        request = self.factory.get("/", headers={"Range": "bytes=1000-"})
+        response = await views.file_redirect_async(
+            request, self.large_file.alias_filename()
+        )
+        self.assertEqual(response.status_code, 206)
+        # a sync iterator would be read into a list first, with a warning.
+        self.assertTrue(response.is_async)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            chunks = [chunk async for chunk in response]
+        response.close()
+        self.assertEqual(len(chunks[0]), delivery.AsyncFileResponse.block_size)
+        self.assertEqual(b"".join(chunks), self.content[1000:])
+
+
+@override_settings(
+    # the request log is written after the view, outside of its budget.
+    MIDDLEWARE=[
+        middleware
+        for middleware in settings.MIDDLEWARE
+        if middleware != "core.middleware.request_log.DeferredRequestMiddleware"
+    ],
+    ATTRIBUTION_BUFFERED=False,
+    # the register view is a 404 otherwise.
+    ENABLE_REGISTRATION=True,
+)
+class ViewBudgetTests(TestCase):
+    """
+    Runs every view of ``core.urls`` and checks it stays within the query
+    budget of ``core.utils.budgets``.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("budget", password="budget")
+        cls.url = models.ShortenedURL.create("https://example.org/", cls.user, True)
+        cls.file = models.UploadedFile.create(
+            SimpleUploadedFile("budget.txt", b"budget"), cls.user, True
+        )
+
+    def setUp(self):
+        cache.clear()
+        # built by the first request otherwise, see the home budget.
+        trending.build_snapshot()
+        alias_cache.shortened_urls.local.clear()
+        alias_cache.uploaded_files.local.clear()
+        self.client.force_login(self.user)
+
+    def requests(self, name: str):
+        """
+        The requests exercising the view named ``name``.
+        """
+        alias_filename = self.file.alias_filename()
+        match name:
+            case "url_shortener_url" | "url_shortener_url_delete":
+                yield "get", reverse(f"core:{name}", args=[self.url.alias]), {}
+            case "file_redirect" | "file_delete":
+                yield "get", reverse(f"core:{name}", args=[alias_filename]), {}
+            case "url_shortener":
+                yield "get", reverse("core:url_shortener"), {}
+                yield (
+                    "post",
+                    reverse("core:url_shortener"),
+                    {"data": {"url": "https://example.org/new"}},
+                )
+            case "url_shortener_batch":
+                yield (
+                    "post",
+                    reverse("core:url_shortener_batch"),
+                    {
+                        "data": json.dumps({"urls": ["https://example.org/1"] * 10}),
+                        "content_type": "application/json",
+                    },
+                )
+            case "file_hosting":
+                yield "get", reverse("core:file_hosting"), {}
+                yield (
+                    "post",
+                    reverse("core:file_hosting"),
+                    {"data": {"file": SimpleUploadedFile("new.txt", b"new")}},
+                )
+            case _:
+                yield "get", reverse(f"core:{name}"), {}
+
+    def test_every_view_has_a_budget(self):
+        for pattern in urls.urlpatterns:
+            with self.subTest(pattern.name):
+                self.assertIsNotNone(budgets.get_budget(f"core:{pattern.name}"))
+
+    def test_views_stay_within_their_query_budget(self):
+        for pattern in urls.urlpatterns:
+            view_name = f"core:{pattern.name}"
+            budget = budgets.get_budget(view_name)
+            for method, path, kwargs in self.requests(pattern.name):
+                with self.subTest(view_name, method=method):
+                    with budgets.track_queries() as stats:
+                        response = getattr(self.client, method)(path, **kwargs)
+                    self.assertLess(response.status_code, 400)
+                    self.assertLessEqual(stats.queries, budget.queries)
+
+
+class PruneRequestsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.url = models.ShortenedURL.create("https://example.org/", None)
+        path = reverse("core:url_shortener_url", args=[cls.url.alias])
+        with mock.patch.object(attribution.buffer, "enqueue"):
+            requests = [
+                Request.objects.create(path=path, response=302, ip="127.0.0.1")
+                for _ in range(3)
+            ]
+        cls.url.requests.add(*requests)
+        cls.day = timezone.localdate() - timedelta(days=100)
+        Request.objects.update(time=retention.day_bounds(cls.day)[0])
+
+    def prune(self) -> str:
+        stdout = io.StringIO()
+        call_command("prune_requests", no_archive=True, batch_size=2, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_prunes_the_old_requests(self):
+        self.assertIn("3 requests deleted, 1 paths rolled up", self.prune())
+        self.assertFalse(Request.objects.exists())
+        self.assertFalse(self.url.requests.exists())
+        self.assertEqual(
+            models.RequestDailyPathCount.objects.get(day=self.day).count, 3
+        )
+
+    def test_resumes_a_half_deleted_batch(self):
+        retention.roll_up_day(self.day)
+        # interrupted between the attribution rows and the requests.
+        models.ShortenedURL.requests.through.objects.all().delete()
+        self.assertIn("3 requests deleted", self.prune())
+        self.assertFalse(Request.objects.exists())
+        self.assertEqual(
+            models.RequestDailyPathCount.objects.get(day=self.day).count, 3
+        )
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.urls = [
+            models.ShortenedURL.create(f"https://example.org/{n}", None)
+            for n in range(7)
+        ]
+        # ties are broken by the id.
+        models.ShortenedURL.objects.update(inserted_at=timezone.now())
+        cls.query = models.ShortenedURL.objects.all()
+
+    def page(self, query: str = "") -> common.KeysetPage:
+        cursor = QueryDict(query).get("cursor")
+        return common.get_keyset_page(self.query, cursor, page_size=3)
+
+    def pks(self, page: common.KeysetPage) -> list[int]:
+        return [obj.pk for obj in page.object_list]
+
+    def test_next_pages(self):
+        expected = [obj.pk for obj in reversed(self.urls)]
+        first = self.page()
+        self.assertEqual(self.pks(first), expected[:3])
+        self.assertEqual((first.has_previous(), first.has_next()), (False, True))
+        second = self.page(first.next_query)
+        self.assertEqual(self.pks(second), expected[3:6])
+        self.assertEqual((second.has_previous(), second.has_next()), (True, True))
+        last = self.page(second.next_query)
+        self.assertEqual(self.pks(last), expected[6:])
+        self.assertEqual((last.has_previous(), last.has_next()), (True, False))
+
+    def test_previous_pages(self):
+        expected = [obj.pk for obj in reversed(self.urls)]
+        last = self.page(self.page(self.page().next_query).next_query)
+        second = self.page(last.previous_query)
+        self.assertEqual(self.pks(second), expected[3:6])
+        self.assertEqual((second.has_previous(), second.has_next()), (True, True))
+        first = self.page(second.previous_query)
+        self.assertEqual(self.pks(first), expected[:3])
+        self.assertEqual((first.has_previous(), first.has_next()), (False, True))
+
+    def test_invalid_cursors_get_the_first_page(self):
+        first = self.pks(self.page())
+        for cursor in [
+            "garbage",
+            common.encode_cursor("sideways", (timezone.now(), 1)),
+        ]:
+            with self.subTest(cursor):
+                self.assertEqual(self.pks(self.page(f"cursor={cursor}")), first)
+
+    def test_deleted_last_row(self):
+        expected = [obj.pk for obj in reversed(self.urls)]
+        second = self.page(self.page().next_query)
+        self.urls[0].delete()
+        # the last page was only that row, the page before it is shown.
+        last = self.page(second.next_query)
+        self.assertEqual(self.pks(last), expected[3:6])
+        self.assertEqual(last.has_next(), False)
+
+
+@override_settings(ATTRIBUTION_BUFFERED=False)
+class FileMetadataTests(TestCase):
+    PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("metadata", password="metadata")
+
+    def test_sniffed_content_types(self):
+        for head, name, content_type in [
+            (self.PNG, "image.txt", "image/png"),
+            (b"PK\x03\x04", "report.docx", mimetypes.guess_type("report.docx")[0]),
+            (b"PK\x03\x04", "archive", "application/zip"),
+            (b"plain text", "notes", "text/plain"),
+            (b"\x00\x01\x02", "data", "application/octet-stream"),
+        ]:
+            with self.subTest(name):
+                self.assertEqual(
+                    file_metadata.sniff_content_type(head, name), content_type
+                )
+
+    def test_recorded_at_upload(self):
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse("core:file_hosting"),
+            {"file": SimpleUploadedFile("image.txt", self.PNG, "text/plain")},
+        )
+        uploaded = models.UploadedFile.objects.get()
+        self.assertEqual(
+            (uploaded.size, uploaded.content_type, uploaded.checksum),
+            (len(self.PNG), "image/png", hashlib.sha256(self.PNG).hexdigest()),
+        )
+
+    def test_backfill(self):
+        uploaded = models.UploadedFile.create(
+            SimpleUploadedFile("notes.txt", b"notes"), None
+        )
+        models.UploadedFile.objects.update(size=None, content_type=None, checksum=None)
+        call_command("backfill_file_metadata", stdout=io.StringIO())
+        uploaded.refresh_from_db()
+        self.assertEqual(
+            (uploaded.size, uploaded.content_type, uploaded.checksum),
+            (5, "text/plain", hashlib.sha256(b"notes").hexdigest()),
+        )
+
+
+@override_settings(ATTRIBUTION_BUFFERED=False)
+class AttributionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.url = models.ShortenedURL.create("https://example.org/", None, True)
+
+    def setUp(self):
+        alias_cache.shortened_urls.local.clear()
+
+    def click(self) -> attribution.Click:
+        path = reverse("core:url_shortener_url", args=[self.url.alias])
+        request = Request.objects.create(path=path, response=302, ip="127.0.0.1")
+        return attribution.Click(path, request.pk, request.time)
+
+    def test_clicks_attributed_twice_count_once(self):
+        click = self.click()
+        self.assertEqual(attribution.attribute_clicks([click, click]), 0)
+        self.url.refresh_from_db()
+        self.assertEqual(self.url.view_count, 1)
+        self.assertEqual(self.url.requests.count(), 1)
+
+    def test_failed_batches_are_retried(self):
+        buffer = attribution.AttributionBuffer()
+        # not attributed on save, the buffer gets it.
+        with mock.patch.object(attribution.buffer, "enqueue"):
+            click = self.click()
+        buffer._queue.append(click)
+        with (
+            mock.patch.object(
+                attribution, "attribute_clicks", side_effect=OperationalError
+            ),
+            self.assertRaises(OperationalError),
+        ):
+            buffer.flush()
+        self.assertEqual(len(buffer), 1)
+        self.assertEqual(buffer.flush(), 1)
+        self.url.refresh_from_db()
+        self.assertEqual(self.url.view_count, 1)
+
+    @override_settings(ATTRIBUTION_MAX_ATTEMPTS=2)
+    def test_failing_batches_are_dropped(self):
+        buffer = attribution.AttributionBuffer()
+        buffer._queue.append(attribution.Click("/", 0, timezone.now()))
+        with mock.patch.object(
+            attribution, "attribute_clicks", side_effect=OperationalError
+        ):
+            with self.assertRaises(OperationalError):
+                buffer.flush()
+            with (
+                self.assertLogs(attribution.logger, "ERROR"),
+                self.assertRaises(OperationalError),
+            ):
+                buffer.flush()
+        self.assertEqual(len(buffer), 0)
+
+
+class TrendingTests(TestCase):
+    @override_settings(TRENDING_MODE="total")
+    def test_missing_snapshot_is_built_by_the_request(self):
+        cache.clear()
+        url = models.ShortenedURL.create("https://example.org/", None, True)
+        self.assertEqual(trending.get_snapshot()["urls"], [url])
+        self.assertIsNotNone(cache.get(trending.SNAPSHOT_KEY))
+        # the lock is released for the next refresh.
+        self.assertTrue(trending.acquire_refresh_lock())
+
+    @override_settings(TRENDING_MODE="total")
+    def test_missing_snapshot_is_empty_while_another_request_builds_it(self):
+        cache.clear()
+        models.ShortenedURL.create("https://example.org/", None, True)
+        self.assertTrue(trending.acquire_refresh_lock())
+        self.addCleanup(trending.release_refresh_lock)
+        self.assertEqual(trending.get_snapshot()["urls"], [])
+
+    def test_refresh_needs_a_shared_cache(self):
+        with self.assertRaises(CommandError):
+            call_command("refresh_trending")
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+                "LOCATION": "cache_table",
+            }
+        },
+        TRENDING_MODE="total",
+    )
+    def test_refresh_stores_the_snapshot_in_the_shared_cache(self):
+        call_command("createcachetable", verbosity=0)
+        url = models.ShortenedURL.create("https://example.org/", None, True)
+        call_command("refresh_trending", stdout=io.StringIO())
+        self.assertEqual(trending.get_snapshot()["urls"], [url])
+
+
+@override_settings(ATTRIBUTION_BUFFERED=False, FILE_DELIVERY_MODE="direct")
+class FileDeliveryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.file = models.UploadedFile.create(
+            SimpleUploadedFile("digits.txt", b"0123456789"), None
+        )
+
+    def setUp(self):
+        alias_cache.uploaded_files.local.clear()
+        self.path = reverse("core:file_redirect", args=[self.file.alias_filename()])
+
+    def get(self, **headers):
+        response = self.client.get(self.path, headers=headers)
+        return response, b"".join(getattr(response, "streaming_content", []))
+
+    def test_parse_range(self):
+        self.assertIsNone(delivery.parse_range(None, 10))
+        self.assertIsNone(delivery.parse_range("bytes=0-1,4-5", 10))
+        self.assertEqual(delivery.parse_range("bytes=2-", 10), (2, 9))
+        self.assertEqual(delivery.parse_range("bytes=2-100", 10), (2, 9))
+        self.assertEqual(delivery.parse_range("bytes=-3", 10), (7, 9))
+        self.assertEqual(delivery.parse_range("bytes=-30", 10), (0, 9))
+        # last-pos below first-pos, the header is ignored.
+        self.assertIsNone(delivery.parse_range("bytes=5-3", 10))
+        self.assertIsNone(delivery.parse_range("bytes=15-3", 10))
+        for header, size in [
+            ("bytes=10-", 10),
+            ("bytes=10-20", 10),
+            ("bytes=-0", 10),
+            ("bytes=-5", 0),
+        ]:
+            with (
+                self.subTest(header, size=size),
+                self.assertRaises(delivery.RangeNotSatisfiable),
+            ):
+                delivery.parse_range(header, size)
+
+    def test_whole_file(self):
+        response, content = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(content, b"0123456789")
+
+    def test_partial_content(self):
+        response, content = self.get(Range="bytes=2-4")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 2-4/10")
+        self.assertEqual(content, b"234")
+
+    def test_range_not_satisfiable(self):
+        response, _ = self.get(Range="bytes=20-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+    def test_invalid_range_is_ignored(self):
+        response, content = self.get(Range="bytes=5-3")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content, b"0123456789")
+
+
+@override_settings(ATTRIBUTION_BUFFERED=False, URL_SHORTENER_BATCH_MAX_SIZE=5)
+class URLShortenerBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("batch", password="batch")
+        _, cls.key = models.APIToken.create(cls.user, "tests")
+
+    def post(self, data, client=None, **headers):
+        return (client or self.client).post(
+            reverse("core:url_shortener_batch"),
+            data if isinstance(data, str) else json.dumps(data),
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def test_results_keep_the_order_of_the_urls(self):
+        self.client.force_login(self.user)
+        urls = ["https://example.org/1", "nope", "https://example.org/2", 3]
+        results = self.post({"urls": urls}).json()["results"]
+        self.assertEqual([result["url"] for result in results], urls)
+        self.assertEqual(
+            ["shortened_url" in result for result in results],
+            [True, False, True, False],
+        )
+        self.assertEqual(results[1]["error"], "Invalid URL")
+        created = models.ShortenedURL.objects.filter(owner=self.user)
+        self.assertEqual(
+            sorted(created.values_list("url", flat=True)), [urls[0], urls[2]]
+        )
+        self.assertFalse(created.filter(is_public=True).exists())
+
+    def test_invalid_requests(self):
+        self.client.force_login(self.user)
+        for data in [
+            "{",
+            [],
+            {"urls": "https://example.org/"},
+            {"urls": ["https://example.org/"] * 6},
+            {"urls": ["https://example.org/"], "is_public": "false"},
+            {"urls": ["https://example.org/"], "is_public": 1},
+        ]:
+            with self.subTest(data):
+                self.assertEqual(self.post(data).status_code, 400)
+        self.assertFalse(models.ShortenedURL.objects.exists())
+
+    def test_anonymous_requests_are_rejected(self):
+        self.assertEqual(self.post({"urls": []}).status_code, 403)
+
+    def test_token_authentication(self):
+        client = Client(enforce_csrf_checks=True)
+        response = self.post(
+            {"urls": ["https://example.org/"], "is_public": True},
+            client,
+            Authorization=f"Bearer {self.key}",
+        )
+        self.assertEqual(response.status_code, 200)
+        created = models.ShortenedURL.objects.get()
+        self.assertEqual((created.owner, created.is_public), (self.user, True))
+
+        response = self.post({"urls": []}, client, Authorization="Bearer nope")
+        self.assertEqual(response.status_code, 401)
+
+    def test_sessions_need_a_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        self.assertEqual(self.post({"urls": []}, client).status_code, 403)
+
+
+@override_settings(ATTRIBUTION_BUFFERED=False)
+class JSONLTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # so the sequences are written, not taken from earlier blocks.
+        models.alias_allocator.reset()
+        cls.user = User.objects.create_user("jsonl", password="jsonl")
+        cls.url = models.ShortenedURL.create("https://example.org/", cls.user, True)
+        cls.file = models.UploadedFile.create(
+            SimpleUploadedFile("jsonl.txt", b"jsonl"), cls.user
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "export.jsonl.gz")
+
+    def rows(self) -> dict[str, list[dict]]:
+        def values(queryset) -> list[dict]:
+            # django's JSON encoder keeps the milliseconds of datetimes.
+            return [
+                {
+                    key: value.replace(microsecond=value.microsecond // 1000 * 1000)
+                    if isinstance(value, datetime)
+                    else value
+                    for key, value in row.items()
+                }
+                for row in queryset.values()
+            ]
+
+        return {
+            "urls": values(models.ShortenedURL.objects.all()),
+            "files": values(models.UploadedFile.objects.all()),
+            "sequences": list(
+                models.AliasSequence.objects.values("name", "next_value")
+            ),
+        }
+
+    def test_round_trip(self):
+        call_command("export_jsonl", self.path, stderr=io.StringIO())
+        exported = self.rows()
+        models.ShortenedURL.objects.all().delete()
+        models.UploadedFile.objects.all().delete()
+        models.AliasSequence.objects.update(next_value=0)
+
+        # the users are still there.
+        call_command("import_jsonl", self.path, merge=True, stderr=io.StringIO())
+        self.assertEqual(self.rows(), exported)
+
+    def test_import_keeps_the_highest_sequences(self):
+        call_command("export_jsonl", self.path, stderr=io.StringIO())
+        exported = self.rows()
+        models.AliasSequence.objects.update(next_value=1000)
+        call_command("import_jsonl", self.path, merge=True, stderr=io.StringIO())
+        self.assertEqual(
+            set(models.AliasSequence.objects.values_list("next_value", flat=True)),
+            {1000},
+        )
+        # the rows already there are skipped.
+        self.assertEqual(self.rows()["urls"], exported["urls"])
+
+    def test_import_needs_empty_tables(self):
+        call_command("export_jsonl", self.path, stderr=io.StringIO())
+        with self.assertRaisesMessage(CommandError, "--merge"):
+            call_command("import_jsonl", self.path, stderr=io.StringIO())
+
+    def test_merge_stops_at_conflicting_rows(self):
+        call_command("export_jsonl", self.path, stderr=io.StringIO())
+        models.ShortenedURL.objects.update(url="https://example.org/other")
+        with self.assertRaisesMessage(CommandError, "core.ShortenedURL"):
+            call_command("import_jsonl", self.path, merge=True, stderr=io.StringIO())
+        self.assertEqual(
+            models.ShortenedURL.objects.get().url, "https://example.org/other"
+        )
+
+    def test_merge_stops_at_taken_aliases(self):
+        call_command("export_jsonl", self.path, stderr=io.StringIO())
+        models.ShortenedURL.objects.update(id=self.url.pk + 1)
+        with self.assertRaisesMessage(CommandError, "core.ShortenedURL"):
+            call_command("import_jsonl", self.path, merge=True, stderr=io.StringIO())
+        self.assertEqual(models.ShortenedURL.objects.get().pk, self.url.pk + 1)
+
+
+class MetricsFilesTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, pid: int, started: int, count: float) -> None:
+        metrics_files.write_snapshot(
+            metrics_files.snapshot_path(self.directory, pid, started),
+            {
+                "pid": pid,
+                "started": started,
+                "counters": [("redirects_total", (), count)],
+                "gauges": [("attribution_queue_depth", (), 3)],
+                "histograms": [("request_duration_seconds", (), [1, 0], 0.5)],
+            },
+        )
+
+    def test_reused_pids_keep_their_own_files(self):
+        self.write(os.getpid(), 1, 2)
+        self.write(os.getpid(), 2, 3)
+        totals = metrics_files.add_up(self.directory)
+        self.assertEqual(totals.counters["redirects_total", ()], 5)
+        self.assertEqual(totals.gauges["attribution_queue_depth", ()], 6)
+
+    def test_exited_processes_are_folded(self):
+        self.write(os.getpid(), 1, 2)
+        self.write(999_999_999, 1, 3)
+        metrics_files.mark_process_dead(999_999_999, self.directory)
+        self.write(999_999_998, 1, 4)
+        metrics_files.mark_process_dead(999_999_998, self.directory)
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            sorted([metrics_files.EXITED, f"{os.getpid()}-1.json"]),
+        )
+        totals = metrics_files.add_up(self.directory)
+        self.assertEqual(totals.counters["redirects_total", ()], 9)
+        # only the live process' gauges.
+        self.assertEqual(totals.gauges["attribution_queue_depth", ()], 3)
+        self.assertEqual(
+            totals.histograms["request_duration_seconds", ()], [[3, 0], 1.5]
+        )
+
+
+@override_settings(ALIAS_FILTER=True, ATTRIBUTION_BUFFERED=False)
+class AliasFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.url = models.ShortenedURL.create("https://example.org/", None)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        stamp = override_settings(
+            ALIAS_FILTER_STAMP=os.path.join(directory.name, "stamp")
+        )
+        stamp.enable()
+        self.addCleanup(stamp.disable)
+        self.filter = alias_filter.AliasFilter("url", alias_cache.shortened_url_keys)
+        self.filter.build()
+
+    def test_bloom_filter(self):
+        bloom = alias_filter.BloomFilter(1024, 500)
+        for n in range(500):
+            bloom.add(f"key-{n}")
+        self.assertTrue(all(f"key-{n}" in bloom for n in range(500)))
+        false_positives = sum(f"other-{n}" in bloom for n in range(10_000))
+        self.assertLess(false_positives / 10_000, bloom.false_positive_rate * 2)
+
+    def test_missing_aliases_are_rejected(self):
+        self.assertIs(self.filter.rejects("missing"), True)
+        self.assertIs(self.filter.rejects(self.url.alias), False)
+
+    def test_missing_aliases_skip_the_database(self):
+        with (
+            mock.patch.object(alias_cache.shortened_urls, "filter", self.filter),
+            self.assertNumQueries(0),
+        ):
+            self.assertIsNone(alias_cache.shortened_urls.get("missing"))
+
+    def test_created_aliases_are_caught_up(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            created = models.ShortenedURL.create("https://example.org/new", None)
+        self.assertIsNone(self.filter.rejects(created.alias))
+        self.filter.catch_up()
+        self.assertIs(self.filter.rejects(created.alias), False)
+
+    def test_renamed_aliases_are_caught_up(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.url.alias = "renamed"
+            self.url.save()
+        self.assertIsNone(self.filter.rejects("renamed"))
+        self.filter.catch_up()
+        self.assertIs(self.filter.rejects("renamed"), False)
+
+    def test_rebuild_requests(self):
+        # an imported row, neither newer nor recently updated.
+        older = models.ShortenedURL.create("https://example.org/older", None)
+        models.ShortenedURL.create("https://example.org/newer", None)
+        self.filter.build()
+        older.delete()
+        older.alias = "imported"
+        with jsonl.explicit_timestamps(models.ShortenedURL):
+            models.ShortenedURL.objects.bulk_create([older])
+        alias_filter.request_rebuild()
+        with mock.patch.object(self.filter, "_start_build") as start_build:
+            self.assertIs(self.filter.rejects("imported"), False)
+        start_build.assert_called_once()
+        self.filter.build()
+        self.assertIs(self.filter.rejects("imported"), False)
+        self.assertIs(self.filter.rejects("missing"), True)
+
+
+@override_settings(ATTRIBUTION_BUFFERED=False)
+class BackfillAttributionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.url = models.ShortenedURL.create("https://example.org/", None)
+        path = reverse("core:url_shortener_url", args=[cls.url.alias])
+        # logged but never attributed.
+        with mock.patch.object(attribution.buffer, "enqueue"):
+            cls.requests = [
+                Request.objects.create(path=path, response=302, ip="127.0.0.1")
+                for _ in range(4)
+            ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = os.path.join(directory.name, "checkpoint")
+
+    def backfill(self, **options) -> str:
+        stdout = io.StringIO()
+        call_command(
+            "backfill_attribution",
+            chunk_size=2,
+            checkpoint=self.checkpoint,
+            stdout=stdout,
+            **options,
+        )
+        return stdout.getvalue()
+
+    def test_resumes_from_the_checkpoint(self):
+        first, second, *_ = self.requests
+        self.backfill(start_id=first.pk - 1, end_id=second.pk)
+        with open(self.checkpoint) as f:
+            self.assertEqual(int(f.read()), second.pk)
+        self.assertEqual(self.url.requests.count(), 2)
+
+        output = self.backfill()
+        self.assertIn("Attributed 2 requests", output)
+        self.assertIn(", 2 links", output)
+        self.assertEqual(self.url.requests.count(), 4)
+
+    def test_linked_requests_are_not_counted_again(self):
+        start_id = self.requests[0].pk - 1
+        self.assertIn(", 4 links", self.backfill(start_id=start_id))
+        self.assertIn(", 0 links", self.backfill(start_id=start_id))
+        self.assertEqual(self.url.requests.count(), 4)
+
+
+@override_settings(ATTRIBUTION_BUFFERED=False)
+class ShardUploadedFilesTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_root = override_settings(MEDIA_ROOT=directory.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.file = models.UploadedFile.create(
+            SimpleUploadedFile("shard.txt", b"shard"), None
+        )
+
+    def shard(self, depth: int) -> None:
+        call_command("shard_uploaded_files", depth=depth, grace=0, stdout=io.StringIO())
+
+    def test_files_are_moved_to_the_sharded_layout(self):
+        old_path = self.file.file.path
+        updated_at = self.file.updated_at
+        self.shard(2)
+        self.file.refresh_from_db()
+        self.assertEqual(
+            self.file.file.name, models.resharded_filename(self.file.file.name, 2)
+        )
+        self.assertEqual(self.file.file.name.count("/"), 4)
+        self.assertGreater(self.file.updated_at, updated_at)
+        self.assertFalse(os.path.exists(old_path))
+        with self.file.file.open() as f:
+            self.assertEqual(f.read(), b"shard")
+
+        # and back.
+        self.shard(0)
+        self.file.refresh_from_db()
+        self.assertEqual(self.file.file.name.count("/"), 2)
+
+    def test_old_paths_are_unlinked_batch_by_batch(self):
+        other = models.UploadedFile.create(SimpleUploadedFile("other.txt", b"2"), None)
+        old_paths = [self.file.file.path, other.file.path]
+        # every batch's grace is over by the next one.
+        clock = iter(range(0, 1000, 10))
+        with (
+            mock.patch.object(shard_uploaded_files.time, "monotonic", clock.__next__),
+            mock.patch.object(shard_uploaded_files.time, "sleep") as sleep,
+        ):
+            call_command(
+                "shard_uploaded_files",
+                depth=1,
+                batch_size=1,
+                grace=5,
+                stdout=io.StringIO(),
+            )
+        self.assertFalse(any(os.path.exists(path) for path in old_paths))
+        # unlinked along the way, nothing was left to wait for.
+        sleep.assert_not_called()
+
+    @override_settings(
+        ALIAS_CACHE_LOCAL_TIMEOUT=60, ALIAS_CACHE_TIMEOUT=3600, FILE_CACHE_MAX_AGE=30
+    )
+    def test_default_grace(self):
+        # the locmem entries of the other workers expire after their timeout.
+        self.assertEqual(shard_uploaded_files.default_grace(), 60 + 60 + 30)
+        with mock.patch.object(alias_cache, "cache_is_local", return_value=False):
+            self.assertEqual(shard_uploaded_files.default_grace(), 60 + 30)
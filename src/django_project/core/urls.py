@@ -1,7 +1,15 @@
+from django.conf import settings
 from django.urls import path
 
 from . import views
 
+if getattr(settings, "ASYNC_REDIRECT_VIEWS", False):
+    url_shortener_url_view = views.url_shortener_url_async
+    file_redirect_view = views.file_redirect_async
+else:
+    url_shortener_url_view = views.URLShortenerURLView.as_view()
+    file_redirect_view = views.file_redirect
+
 app_name = "core"
 urlpatterns = [
     path(
@@ -14,6 +22,11 @@ urlpatterns = [
         views.URLShortenerView.as_view(),
         name="url_shortener",
     ),
+    path(
+        "url-shortener/batch/",
+        views.URLShortenerBatchView.as_view(),
+        name="url_shortener_batch",
+    ),
     path(
         "file-hosting/",
         views.FileHostingView.as_view(),
@@ -21,7 +34,7 @@ urlpatterns = [
     ),
     path(
         f"s/<slug:alias>",
-        views.URLShortenerURLView.as_view(),
+        url_shortener_url_view,
         name="url_shortener_url",
     ),
     path(
@@ -31,7 +44,7 @@ urlpatterns = [
     ),
     path(
         f"f/<str:alias_filename>",
-        views.file_redirect,
+        file_redirect_view,
         name="file_redirect",
     ),
     path(
@@ -55,3 +68,11 @@ urlpatterns = [
         name="about_user",
     ),
 ]
+if getattr(settings, "METRICS", False):
+    urlpatterns.append(
+        path(
+            "metrics",
+            views.metrics_view,
+            name="metrics",
+        )
+    )
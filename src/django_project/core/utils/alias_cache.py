@@ -0,0 +1,477 @@
+import os
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+from collections.abc import Collection, Iterable
+from datetime import datetime
+from itertools import batched
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.db.models.functions import Concat
+from django.http import Http404
+
+from ..models import ShortenedURL, StatisticsModelMixin, UploadedFile
+from . import alias_filter, timing
+
+# Stored in both tiers for aliases that do not exist.
+MISSING = "__missing__"
+# Part of the shared cache keys, bump it when the cached dicts change shape.
+CACHE_VERSION = 3
+
+
+class ResolvedURL(t.TypedDict):
+    pk: int
+    url: str
+    is_public: bool
+    updated_at: datetime
+
+
+class ResolvedFile(t.TypedDict):
+    pk: int
+    file: str
+    digest: str | None
+    original_name: str | None
+    updated_at: datetime
+
+
+def cache_is_local() -> bool:
+    """
+    Whether the django cache lives in this process (locmem), where the
+    other workers can neither see nor invalidate its entries.
+    """
+    return isinstance(caches["default"], LocMemCache)
+
+
+class LRUCache:
+    """
+    Bounded, thread safe, in-process cache with per entry expiry.
+    """
+
+    def __init__(self, max_size: int, timeout: float):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data: OrderedDict[str, tuple[float, t.Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: t.Any = None) -> t.Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: t.Any, timeout: float | None = None) -> None:
+        if self.max_size <= 0:
+            return
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class AliasCache[T]:
+    """
+    Resolves an alias key to a small dict describing its target.
+
+    Lookups go through an in-process LRU first, then the django cache and
+    only then the database. Nonexistent aliases are cached too (with a short
+    timeout) so repeated probes for them don't reach the database either.
+    With ``ALIAS_FILTER``, the aliases the bloom ``filter`` rejects don't
+    even get there (nor in the caches).
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        query: t.Callable[[str], QuerySet],
+        to_resolved: t.Callable[[dict[str, t.Any]], T] = lambda row: row,
+        keys: t.Callable[[int], QuerySet] | None = None,
+        query_many: t.Callable[[Collection[str]], Iterable[tuple[str, dict]]]
+        | None = None,
+    ):
+        self.kind = kind
+        self.query = query
+        # ``query_many(keys)``: (key, row) of the existing ones among keys.
+        self.query_many = query_many
+        self.to_resolved = to_resolved
+        self.filter = alias_filter.AliasFilter(kind, keys) if keys else None
+        self.local = LRUCache(
+            getattr(settings, "ALIAS_CACHE_LOCAL_SIZE", 10_000),
+            self.local_timeout,
+        )
+        self.stats = {
+            "local_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "negative_hits": 0,
+            "filter_rejections": 0,
+        }
+
+    @property
+    def local_timeout(self) -> int:
+        return getattr(settings, "ALIAS_CACHE_LOCAL_TIMEOUT", 60)
+
+    @property
+    def timeout(self) -> int:
+        timeout = getattr(settings, "ALIAS_CACHE_TIMEOUT", 3600)
+        if cache_is_local():
+            # nothing but the local timeout bounds a stale entry there.
+            return min(timeout, self.local_timeout)
+        return timeout
+
+    @property
+    def negative_timeout(self) -> int:
+        return getattr(settings, "ALIAS_CACHE_NEGATIVE_TIMEOUT", 30)
+
+    def cache_key(self, key: str) -> str:
+        return f"alias_cache:{CACHE_VERSION}:{self.kind}:{key}"
+
+    def _hit(self, tier: str, value: t.Any) -> T | None:
+        timing.record_cache(hit=True)
+        if value == MISSING:
+            self.stats["negative_hits"] += 1
+            return None
+        self.stats[tier] += 1
+        return value
+
+    def _rejected(self, rejected: bool | None) -> bool:
+        if not rejected:
+            return False
+        self.stats["filter_rejections"] += 1
+        return True
+
+    def rejects(self, key: str) -> bool:
+        if self.filter is None or not alias_filter.enabled():
+            return False
+        rejected = self.filter.rejects(key)
+        if rejected is None:
+            self.filter.catch_up()
+            rejected = self.filter.rejects(key)
+        return self._rejected(rejected)
+
+    async def arejects(self, key: str) -> bool:
+        if self.filter is None or not alias_filter.enabled():
+            return False
+        rejected = self.filter.rejects(key)
+        if rejected is None:
+            await sync_to_async(self.filter.catch_up)()
+            rejected = self.filter.rejects(key)
+        return self._rejected(rejected)
+
+    def _store_local(self, key: str, value: t.Any) -> None:
+        if value == MISSING:
+            self.local.set(key, MISSING, self.negative_timeout)
+        else:
+            self.local.set(key, value)
+
+    def get(self, key: str) -> T | None:
+        value = self.local.get(key)
+        if value is not None:
+            return self._hit("local_hits", value)
+
+        value = cache.get(self.cache_key(key))
+        if value is not None:
+            self._store_local(key, value)
+            return self._hit("shared_hits", value)
+
+        if self.rejects(key):
+            return None
+        self.stats["misses"] += 1
+        timing.record_cache(hit=False)
+        value = self.load(key)
+        if value is None:
+            self._store_local(key, MISSING)
+            cache.set(self.cache_key(key), MISSING, self.negative_timeout)
+        else:
+            self._store_local(key, value)
+            cache.set(self.cache_key(key), value, self.timeout)
+        return value
+
+    async def aget(self, key: str) -> T | None:
+        value = self.local.get(key)
+        if value is not None:
+            return self._hit("local_hits", value)
+
+        value = await cache.aget(self.cache_key(key))
+        if value is not None:
+            self._store_local(key, value)
+            return self._hit("shared_hits", value)
+
+        if await self.arejects(key):
+            return None
+        self.stats["misses"] += 1
+        timing.record_cache(hit=False)
+        value = await self.aload(key)
+        if value is None:
+            self._store_local(key, MISSING)
+            await cache.aset(self.cache_key(key), MISSING, self.negative_timeout)
+        else:
+            self._store_local(key, value)
+            await cache.aset(self.cache_key(key), value, self.timeout)
+        return value
+
+    def load(self, key: str) -> T | None:
+        row = self.query(key).first()
+        return None if row is None else self.to_resolved(row)
+
+    async def aload(self, key: str) -> T | None:
+        row = await self.query(key).afirst()
+        return None if row is None else self.to_resolved(row)
+
+    def peek_many(self, keys: Iterable[str]) -> dict[str, T | None]:
+        """
+        The cached entries among ``keys``, without querying the database:
+        None for the aliases known not to exist, unknown ones are left out.
+        """
+        found: dict[str, T | None] = {}
+        unknown = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is None:
+                unknown.append(key)
+            else:
+                found[key] = None if value == MISSING else value
+        if unknown:
+            shared = cache.get_many([self.cache_key(key) for key in unknown])
+            for key in unknown:
+                value = shared.get(self.cache_key(key))
+                if value is not None:
+                    self._store_local(key, value)
+                    found[key] = None if value == MISSING else value
+        return found
+
+    def get_many(
+        self,
+        keys: Iterable[str],
+        cached: bool = True,
+        store: bool = True,
+        batch_size: int = 500,
+    ) -> dict[str, T]:
+        """
+        ``get`` for many keys at once: the ones not in the caches (or all of
+        them, without ``cached``, which skips the filter too) are loaded with
+        one query per ``batch_size`` and, with ``store``, cached for the next
+        time.
+        """
+        keys = set(keys)
+        found = self.peek_many(keys) if cached else {}
+        unknown = [
+            key
+            for key in keys
+            if key not in found and not (cached and self.rejects(key))
+        ]
+        for batch in batched(unknown, batch_size):
+            loaded = self.load_many(batch)
+            if store:
+                values = {key: loaded.get(key, MISSING) for key in batch}
+                for key, value in values.items():
+                    self._store_local(key, value)
+                cache.set_many(
+                    {
+                        self.cache_key(key): value
+                        for key, value in values.items()
+                        if value != MISSING
+                    },
+                    self.timeout,
+                )
+                cache.set_many(
+                    {
+                        self.cache_key(key): MISSING
+                        for key, value in values.items()
+                        if value == MISSING
+                    },
+                    self.negative_timeout,
+                )
+            found.update(loaded)
+        return {key: value for key, value in found.items() if value is not None}
+
+    def load_many(self, keys: Collection[str]) -> dict[str, T]:
+        if self.query_many is None:
+            loaded = ((key, self.load(key)) for key in keys)
+            return {key: value for key, value in loaded if value is not None}
+        return {key: self.to_resolved(row) for key, row in self.query_many(keys)}
+
+    def get_or_404(self, key: str) -> T:
+        value = self.get(key)
+        if value is None:
+            raise Http404(f"No {self.kind} matches the given alias.")
+        return value
+
+    async def aget_or_404(self, key: str) -> T:
+        value = await self.aget(key)
+        if value is None:
+            raise Http404(f"No {self.kind} matches the given alias.")
+        return value
+
+    def invalidate(self, key: str) -> None:
+        self.local.delete(key)
+        cache.delete(self.cache_key(key))
+        if self.filter is not None:
+            self.filter.add(key)
+        alias_filter.touch_stamp()
+
+    def invalidate_on_commit(self, key: str) -> None:
+        # drop it right away and once more after commit, so a concurrent
+        # reader can't re-cache the pre-commit state for the full timeout.
+        self.invalidate(key)
+        transaction.on_commit(lambda: self.invalidate(key))
+
+    def invalidate_many(self, keys: list[str]) -> None:
+        for key in keys:
+            self.local.delete(key)
+        cache.delete_many([self.cache_key(key) for key in keys])
+        if self.filter is not None:
+            for key in keys:
+                self.filter.add(key)
+        alias_filter.touch_stamp()
+
+    def invalidate_many_on_commit(self, keys: list[str]) -> None:
+        self.invalidate_many(keys)
+        transaction.on_commit(lambda: self.invalidate_many(keys))
+
+    def hit_ratio(self) -> float:
+        hits = (
+            self.stats["local_hits"]
+            + self.stats["shared_hits"]
+            + self.stats["negative_hits"]
+        )
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+def shortened_url_query(alias: str) -> QuerySet:
+    return ShortenedURL.objects.filter(alias=alias).values(
+        "pk", "url", "is_public", "updated_at"
+    )
+
+
+def uploaded_file_query(alias_filename: str) -> QuerySet:
+    alias, ext = os.path.splitext(alias_filename)
+    return UploadedFile.objects.filter(alias=alias, ext=ext).values(
+        "pk",
+        "file",
+        "blob__file",
+        "blob__digest",
+        "checksum",
+        "original_name",
+        "updated_at",
+    )
+
+
+def shortened_urls_query(aliases: Collection[str]) -> Iterable[tuple[str, dict]]:
+    for row in ShortenedURL.objects.filter(alias__in=aliases).values(
+        "pk", "url", "is_public", "updated_at", "alias"
+    ):
+        yield row.pop("alias"), row
+
+
+def uploaded_files_query(
+    alias_filenames: Collection[str],
+) -> Iterable[tuple[str, dict]]:
+    wanted = set(alias_filenames)
+    for row in UploadedFile.objects.filter(
+        alias__in={os.path.splitext(key)[0] for key in wanted}
+    ).values(
+        "pk",
+        "file",
+        "blob__file",
+        "blob__digest",
+        "checksum",
+        "original_name",
+        "updated_at",
+        "alias",
+        "ext",
+    ):
+        key = row.pop("alias") + (row.pop("ext") or "")
+        if key in wanted:
+            yield key, row
+
+
+def changed_since(after: int, since: datetime | None) -> Q:
+    changed = Q(pk__gt=after)
+    if since is not None:
+        changed |= Q(updated_at__gte=since)
+    return changed
+
+
+def shortened_url_keys(after: int, since: datetime | None = None) -> QuerySet:
+    return (
+        ShortenedURL.objects.filter(changed_since(after, since))
+        .order_by("pk")
+        .values_list("pk", "alias")
+    )
+
+
+def uploaded_file_keys(after: int, since: datetime | None = None) -> QuerySet:
+    return (
+        UploadedFile.objects.filter(changed_since(after, since))
+        .order_by("pk")
+        .values_list("pk", Concat("alias", "ext"))
+    )
+
+
+def to_resolved_file(row: dict[str, t.Any]) -> ResolvedFile:
+    blob_file = row.pop("blob__file")
+    if blob_file:
+        row["file"] = blob_file
+    checksum = row.pop("checksum")
+    row["digest"] = row.pop("blob__digest") or checksum
+    return row  # pyright: ignore[reportReturnType]
+
+
+def url_key(instance: ShortenedURL) -> str:
+    return instance.alias
+
+
+def file_key(instance: UploadedFile) -> str:
+    return instance.alias + (instance.ext or "")
+
+
+shortened_urls: AliasCache[ResolvedURL] = AliasCache(
+    "url",
+    shortened_url_query,
+    keys=shortened_url_keys,
+    query_many=shortened_urls_query,
+)
+uploaded_files: AliasCache[ResolvedFile] = AliasCache(
+    "file",
+    uploaded_file_query,
+    to_resolved_file,
+    keys=uploaded_file_keys,
+    query_many=uploaded_files_query,
+)
+
+
+def for_model(model: type[StatisticsModelMixin]) -> AliasCache:
+    return uploaded_files if model is UploadedFile else shortened_urls
+
+
+def get_stats() -> dict[str, dict[str, int]]:
+    return {
+        "url": dict(shortened_urls.stats),
+        "file": dict(uploaded_files.stats),
+    }
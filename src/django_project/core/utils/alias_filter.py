@@ -0,0 +1,241 @@
+import hashlib
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+import typing as t
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import QuerySet
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# rows saved before a catch-up but committed after it are picked up by the
+# next one, as long as their transaction was shorter than this.
+CATCH_UP_MARGIN = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """
+    Set membership in ``size`` bytes: no false negatives, false positives
+    at ``false_positive_rate``.
+    """
+
+    def __init__(self, size: int, capacity: int):
+        self.bits = bytearray(size)
+        self.size = size * 8
+        # the optimal number of hashes for ``capacity`` keys.
+        self.hashes = max(1, min(16, round(self.size / max(capacity, 1) * math.log(2))))
+        self.count = 0
+
+    def _indexes(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8])
+        h2 = int.from_bytes(digest[8:]) | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for index in self._indexes(key):
+            self.bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(key)
+        )
+
+    @property
+    def false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+def enabled() -> bool:
+    return getattr(settings, "ALIAS_FILTER", False)
+
+
+def stamp_path() -> str:
+    return getattr(settings, "ALIAS_FILTER_STAMP", None) or os.path.join(
+        tempfile.gettempdir(), "webtoolkit-alias-filter.stamp"
+    )
+
+
+def rebuild_stamp_path() -> str:
+    return stamp_path() + ".rebuild"
+
+
+def _read(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _touch(path: str) -> None:
+    with open(path, "a"):
+        pass
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+def read_stamp() -> int:
+    return _read(stamp_path())
+
+
+def read_rebuild_stamp() -> int:
+    return _read(rebuild_stamp_path())
+
+
+def touch_stamp() -> None:
+    """
+    Tells the filters of every worker process that aliases were created or
+    changed.
+    """
+    if enabled():
+        _touch(stamp_path())
+
+
+def request_rebuild() -> None:
+    """
+    Tells the filters of every worker process to rebuild, for rows whose
+    pk and updated_at don't tell they are new (e.g. imported ones).
+    """
+    if enabled():
+        _touch(rebuild_stamp_path())
+
+
+class AliasFilter:
+    """
+    Bloom filter of the existing alias keys of one kind, so lookups of
+    aliases that definitely don't exist are answered without the database.
+
+    It's built in a background thread on first use and rebuilt every
+    ``ALIAS_FILTER_REBUILD_INTERVAL`` seconds, which drops the deleted
+    aliases. Aliases created or renamed by other processes are picked up
+    through the ``ALIAS_FILTER_STAMP`` file they touch: when it changed, the
+    rows inserted or updated since are added before answering a miss. A
+    ``request_rebuild()`` has every filter rebuilt, misses aren't rejected
+    until then.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        keys: t.Callable[[int, datetime | None], QuerySet],
+    ):
+        # ``keys(after, since)``: (pk, key) of the rows with a greater pk or
+        # updated since ``since``, by pk.
+        self.kind = kind
+        self.keys = keys
+        self.bloom: BloomFilter | None = None
+        self.max_pk = 0
+        self.seen_stamp = 0
+        self.seen_rebuild_stamp = 0
+        self.caught_up_at: datetime | None = None
+        self.built_at = 0.0
+        self._build_lock = threading.Lock()
+        self._catch_up_lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return getattr(settings, "ALIAS_FILTER_SIZE", 1024 * 1024)
+
+    @property
+    def rebuild_interval(self) -> float:
+        return getattr(settings, "ALIAS_FILTER_REBUILD_INTERVAL", 3600)
+
+    def build(self) -> None:
+        stamp, rebuild_stamp = read_stamp(), read_rebuild_stamp()
+        started = timezone.now()
+        keys = self.keys(0, None)
+        # room for the aliases created until the next rebuild.
+        bloom = BloomFilter(self.size, keys.count() * 5 // 4 + 1000)
+        max_pk = 0
+        for max_pk, key in keys.iterator(chunk_size=10_000):
+            bloom.add(key)
+        self.bloom, self.max_pk, self.caught_up_at = bloom, max_pk, started
+        self.seen_stamp, self.seen_rebuild_stamp = stamp, rebuild_stamp
+        self.built_at = time.monotonic()
+        logger.info(
+            "Built the %s alias filter: %d aliases in %d bytes, %d hashes, "
+            "%.4f%% false positives",
+            self.kind,
+            bloom.count,
+            self.size,
+            bloom.hashes,
+            bloom.false_positive_rate * 100,
+        )
+
+    def _locked_build(self) -> None:
+        try:
+            self.build()
+        except Exception:
+            logger.exception("Failed to build the %s alias filter", self.kind)
+        finally:
+            self._build_lock.release()
+            close_old_connections()
+
+    def _ensure_built(self) -> None:
+        if self.bloom is not None and (
+            time.monotonic() - self.built_at < self.rebuild_interval
+        ):
+            return
+        self._start_build()
+
+    def _start_build(self) -> None:
+        if self._build_lock.acquire(blocking=False):
+            threading.Thread(
+                target=self._locked_build,
+                name=f"{self.kind}-alias-filter",
+                daemon=True,
+            ).start()
+
+    def catch_up(self) -> None:
+        """
+        Adds the rows inserted or updated since the filter was built or last
+        caught up.
+        """
+        if self.bloom is None or not self._catch_up_lock.acquire(blocking=False):
+            return
+        try:
+            stamp = read_stamp()
+            started = timezone.now()
+            bloom = self.bloom
+            since = self.caught_up_at and self.caught_up_at - CATCH_UP_MARGIN
+            for pk, key in self.keys(self.max_pk, since).iterator(chunk_size=10_000):
+                # the margin brings back rows already added.
+                if key not in bloom:
+                    bloom.add(key)
+                self.max_pk = max(self.max_pk, pk)
+            self.seen_stamp, self.caught_up_at = stamp, started
+        finally:
+            self._catch_up_lock.release()
+
+    def add(self, key: str) -> None:
+        if self.bloom is not None:
+            self.bloom.add(key)
+
+    def rejects(self, key: str) -> bool | None:
+        """
+        True when ``key`` definitely doesn't exist, None when that's only
+        known after ``catch_up()``.
+        """
+        self._ensure_built()
+        bloom = self.bloom
+        if bloom is None or key in bloom:
+            return False
+        if read_rebuild_stamp() != self.seen_rebuild_stamp:
+            self._start_build()
+            return False
+        if read_stamp() != self.seen_stamp:
+            return None
+        return True
+
+    @property
+    def false_positive_rate(self) -> float | None:
+        return self.bloom.false_positive_rate if self.bloom else None
@@ -0,0 +1,302 @@
+import atexit
+import logging
+import os
+import threading
+import typing as t
+from collections import Counter, defaultdict, deque
+from collections.abc import Iterable, Sequence
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Model
+from django.utils import timezone
+from request.models import Request
+
+from ..models import StatisticsModelMixin, daily_view_count_model
+from . import paths
+
+logger = logging.getLogger(__name__)
+
+
+class Click(t.NamedTuple):
+    path: str
+    request_id: int
+    time: datetime
+
+
+def increment_view_counts(
+    model: type[StatisticsModelMixin],
+    views: Iterable[tuple[int, date]],
+) -> None:
+    """
+    Adds ``(pk, day)`` views to the ``view_count`` totals and the daily
+    counts, with one UPDATE per distinct increment.
+    """
+    daily = Counter(views)
+    totals: Counter[int] = Counter()
+    for (pk, _), count in daily.items():
+        totals[pk] += count
+
+    by_increment: dict[int, list[int]] = defaultdict(list)
+    for pk, count in totals.items():
+        by_increment[count].append(pk)
+    for count, pks in by_increment.items():
+        model.objects.filter(pk__in=pks).update(view_count=F("view_count") + count)
+
+    daily_model = daily_view_count_model(model)
+    daily_model.objects.bulk_create(
+        [daily_model(instance_id=pk, day=day) for pk, day in daily],
+        ignore_conflicts=True,
+    )
+    daily_by_increment: dict[tuple[date, int], list[int]] = defaultdict(list)
+    for (pk, day), count in daily.items():
+        daily_by_increment[(day, count)].append(pk)
+    for (day, count), pks in daily_by_increment.items():
+        daily_model.objects.filter(day=day, instance_id__in=pks).update(
+            count=F("count") + count
+        )
+
+
+def through_rows(
+    model: type[StatisticsModelMixin],
+    hits: Iterable[tuple[int, int]],
+) -> list[Model]:
+    """
+    The through table rows linking ``(pk, request_id)`` pairs.
+    """
+    field = model._meta.get_field("requests")
+    through = field.remote_field.through
+    return [
+        through(
+            **{
+                f"{field.m2m_field_name()}_id": pk,
+                f"{field.m2m_reverse_field_name()}_id": request_id,
+            }
+        )
+        for pk, request_id in hits
+    ]
+
+
+def unlinked(
+    model: type[StatisticsModelMixin],
+    pairs: Iterable[tuple[int, int]],
+) -> set[tuple[int, int]]:
+    """
+    The ``(pk, request_id)`` pairs that have no through table row yet.
+    """
+    field = model._meta.get_field("requests")
+    through = field.remote_field.through
+    pairs = set(pairs)
+    linked = through.objects.filter(
+        **{f"{field.m2m_reverse_field_name()}_id__in": {r for _, r in pairs}}
+    ).values_list(
+        f"{field.m2m_field_name()}_id", f"{field.m2m_reverse_field_name()}_id"
+    )
+    return pairs - set(linked)
+
+
+def write_hits(
+    model: type[StatisticsModelMixin],
+    hits: Sequence[tuple[int, Click]],
+) -> int:
+    with transaction.atomic():
+        # only the new links count as views, a click attributed twice (e.g.
+        # a batch retried after a failure) is counted once.
+        new = unlinked(model, ((pk, click.request_id) for pk, click in hits))
+        new_hits = []
+        for pk, click in hits:
+            if (pk, click.request_id) in new:
+                new.remove((pk, click.request_id))
+                new_hits.append((pk, click))
+        rows = through_rows(model, ((pk, click.request_id) for pk, click in new_hits))
+        model.requests.through.objects.bulk_create(
+            rows,
+            batch_size=getattr(settings, "ATTRIBUTION_BATCH_SIZE", 500),
+            ignore_conflicts=True,
+        )
+        increment_view_counts(
+            model,
+            ((pk, timezone.localdate(click.time)) for pk, click in new_hits),
+        )
+    return len(rows)
+
+
+def attribute_clicks(clicks: Sequence[Click], store: bool = True) -> int:
+    """
+    Links logged requests to the objects they hit and updates their view
+    counts, returns the number of through table rows written.
+    """
+    classifier = paths.get_classifier()
+    resolved = classifier.resolve_many((click.path for click in clicks), store=store)
+    by_model: dict[type[StatisticsModelMixin], list[tuple[int, Click]]] = defaultdict(
+        list
+    )
+    for click in clicks:
+        target = resolved.get(click.path)
+        if target:
+            by_model[target[0]].append((target[1], click))
+
+    written = 0
+    for model, hits in by_model.items():
+        try:
+            written += write_hits(model, hits)
+        except IntegrityError:
+            # a cached pk of an object another process deleted since.
+            resolved = classifier.resolve_many(
+                {click.path for _, click in hits}, cached=False, store=store
+            )
+            written += write_hits(
+                model,
+                [
+                    (resolved[click.path][1], click)
+                    for _, click in hits
+                    if click.path in resolved
+                ],
+            )
+    return written
+
+
+def backfill_range(start: int, end: int, batch_size: int = 1000) -> tuple[int, int]:
+    """
+    Links the logged requests with ``start < id <= end`` to the objects they
+    hit, leaving the view counts to ``rebuild_view_counters``. Requests that
+    are already linked are skipped by the unique constraints, so a range can
+    be run again. Returns the numbers of requests read and links added.
+    """
+    classifier = paths.get_classifier()
+    requests = (
+        Request.objects.filter(pk__lte=end, response__lt=400)
+        .order_by("pk")
+        .values_list("pk", "path")
+    )
+    read = written = 0
+    # a batch at a time rather than a cursor kept open across the writes,
+    # on SQLite that reader would deadlock with the other workers' writes.
+    while batch := list(requests.filter(pk__gt=start)[:batch_size]):
+        start = batch[-1][0]
+        read += len(batch)
+        # straight from the database, and the keys of a backfill would only
+        # evict the ones of the live lookups from the caches.
+        resolved = classifier.resolve_many(
+            (path for _, path in batch), cached=False, store=False
+        )
+        hits: dict[type[StatisticsModelMixin], list[tuple[int, int]]] = defaultdict(
+            list
+        )
+        for request_id, path in batch:
+            target = resolved.get(path)
+            if target:
+                hits[target[0]].append((target[1], request_id))
+        for model, pairs in hits.items():
+            # the count leaves out the links that already exist.
+            rows = through_rows(model, unlinked(model, pairs))
+            model.requests.through.objects.bulk_create(
+                rows, batch_size=batch_size, ignore_conflicts=True
+            )
+            written += len(rows)
+    return read, written
+
+
+class AttributionBuffer:
+    """
+    Collects clicks in memory and attributes them in batches from a
+    background thread, every ``ATTRIBUTION_FLUSH_INTERVAL`` seconds or as
+    soon as ``ATTRIBUTION_BATCH_SIZE`` clicks are waiting.
+    """
+
+    def __init__(self):
+        self._queue: deque[Click] = deque()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._failures = 0
+
+    @property
+    def batch_size(self) -> int:
+        return getattr(settings, "ATTRIBUTION_BATCH_SIZE", 500)
+
+    @property
+    def max_attempts(self) -> int:
+        return getattr(settings, "ATTRIBUTION_MAX_ATTEMPTS", 5)
+
+    @property
+    def flush_interval(self) -> float:
+        return getattr(settings, "ATTRIBUTION_FLUSH_INTERVAL", 2.0)
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, path: str, request_id: int, time: datetime) -> None:
+        click = Click(path, request_id, time)
+        if not getattr(settings, "ATTRIBUTION_BUFFERED", True):
+            attribute_clicks([click])
+            return
+        self._queue.append(click)
+        self._ensure_started()
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_started(self) -> None:
+        # the pid check restarts the flusher in forked (preloaded) workers.
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            if self._pid is None:
+                atexit.register(self._flush_at_exit)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run,
+                name="attribution-flusher",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to attribute clicks")
+            finally:
+                close_old_connections()
+
+    def _flush_at_exit(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Failed to attribute clicks at exit")
+
+    def flush(self) -> int:
+        written = 0
+        with self._flush_lock:
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+                try:
+                    written += attribute_clicks(batch)
+                except Exception:
+                    self._failures += 1
+                    if self._failures < self.max_attempts:
+                        # back in front, for the next flush.
+                        self._queue.extendleft(reversed(batch))
+                    else:
+                        self._failures = 0
+                        logger.error(
+                            "Dropped %d clicks after %d failed attempts",
+                            len(batch),
+                            self.max_attempts,
+                        )
+                    raise
+                self._failures = 0
+        return written
+
+
+buffer = AttributionBuffer()
@@ -0,0 +1,182 @@
+import http.client
+import statistics
+import threading
+import time
+import typing as t
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from asgiref.sync import async_to_sync
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import AsyncClient, Client
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.urls import reverse
+
+
+class Call(t.NamedTuple):
+    method: t.Literal["GET", "POST"]
+    path: str
+    data: dict[str, t.Any] | None = None
+
+
+class Summary(t.TypedDict):
+    requests: int
+    errors: int
+    throughput_rps: float
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> Summary:
+    """
+    Latency percentiles (in milliseconds) and throughput of sequential
+    requests that took ``elapsed`` seconds in total.
+    """
+    ms = [latency * 1000 for latency in latencies]
+    if len(ms) > 1:
+        quantiles = statistics.quantiles(ms, n=100, method="inclusive")
+    else:
+        quantiles = ms * 99
+    return {
+        "requests": len(ms),
+        "errors": errors,
+        "throughput_rps": round(len(ms) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p50_ms": round(quantiles[49], 3),
+        "p95_ms": round(quantiles[94], 3),
+        "p99_ms": round(quantiles[98], 3),
+        "max_ms": round(max(ms), 3),
+    }
+
+
+def is_error(status: int) -> bool:
+    return status >= 400
+
+
+class Transport:
+    """
+    Sends the benchmark requests. The base class goes through django's test
+    ``Client``, so through the WSGI handler but without HTTP.
+    """
+
+    name = "client"
+
+    def __init__(self):
+        self.client = Client()
+
+    def login(self, user) -> None:
+        self.client.force_login(user)
+        # sets the csrftoken cookie, needed by the HTTP transport.
+        self.client.get(reverse("core:file_hosting"))
+
+    def send(self, call: Call) -> int:
+        if call.method == "POST":
+            return self.client.post(call.path, call.data).status_code
+        return self.client.get(call.path).status_code
+
+    def measure(self, calls: list[Call]) -> Summary:
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for call in calls:
+            call_started = time.perf_counter()
+            errors += is_error(self.send(call))
+            latencies.append(time.perf_counter() - call_started)
+        return summarize(latencies, errors, time.perf_counter() - started)
+
+    def close(self) -> None:
+        pass
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class WSGITransport(Transport):
+    """
+    Real HTTP requests to django's WSGI handler served by ``wsgiref`` in a
+    thread of this process.
+    """
+
+    name = "wsgi"
+
+    def __init__(self):
+        super().__init__()
+        self.server: WSGIServer = make_server(
+            "127.0.0.1",
+            0,
+            WSGIHandler(),
+            handler_class=QuietHandler,
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def headers(self) -> dict[str, str]:
+        cookies = "; ".join(
+            f"{name}={morsel.value}" for name, morsel in self.client.cookies.items()
+        )
+        headers = {"Host": "testserver", "Cookie": cookies}
+        if "csrftoken" in self.client.cookies:
+            headers["X-CSRFToken"] = self.client.cookies["csrftoken"].value
+        return headers
+
+    def send(self, call: Call) -> int:
+        connection = http.client.HTTPConnection(*self.server.server_address[:2])
+        headers = self.headers()
+        body = None
+        if call.method == "POST":
+            body = encode_multipart(BOUNDARY, call.data or {})
+            headers["Content-Type"] = MULTIPART_CONTENT
+        try:
+            connection.request(call.method, call.path, body, headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        finally:
+            connection.close()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ASGITransport(Transport):
+    """
+    Goes through django's ASGI handler with the ``AsyncClient``, all requests
+    of a scenario in one event loop.
+    """
+
+    name = "asgi"
+
+    def __init__(self):
+        super().__init__()
+        self.async_client = AsyncClient()
+
+    def login(self, user) -> None:
+        super().login(user)
+        self.async_client.cookies = self.client.cookies
+
+    async def ameasure(self, calls: list[Call]) -> Summary:
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for call in calls:
+            call_started = time.perf_counter()
+            if call.method == "POST":
+                response = await self.async_client.post(call.path, call.data)
+            else:
+                response = await self.async_client.get(call.path)
+            errors += is_error(response.status_code)
+            latencies.append(time.perf_counter() - call_started)
+        return summarize(latencies, errors, time.perf_counter() - started)
+
+    def measure(self, calls: list[Call]) -> Summary:
+        return async_to_sync(self.ameasure)(calls)
+
+
+TRANSPORTS: dict[str, type[Transport]] = {
+    transport.name: transport for transport in [Transport, WSGITransport, ASGITransport]
+}
@@ -0,0 +1,107 @@
+import time
+import typing as t
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+
+class Budget(t.NamedTuple):
+    queries: int
+    ms: float | None = None
+
+
+# per URL name, with cold caches. Logged in requests spend 2 of them loading
+# the session and the user. Lower a budget when its view gets cheaper,
+# raising one needs a good reason. Going over a budget is only logged, by
+# QueryBudgetMiddleware. There are no default latency (ms) budgets: they
+# depend on the machine and the database, VIEW_BUDGETS can set some for a
+# given deployment.
+BUDGETS: dict[str, Budget] = {
+    # once the trending snapshot is built, the first request after a cache
+    # flush builds it.
+    "core:home": Budget(queries=2),
+    "core:url_shortener": Budget(queries=7),
+    # grows with the number of URLs, this is for the 10k maximum.
+    "core:url_shortener_batch": Budget(queries=50),
+    "core:file_hosting": Budget(queries=7),
+    # none once the alias is cached.
+    "core:url_shortener_url": Budget(queries=1),
+    "core:url_shortener_url_delete": Budget(queries=6),
+    "core:file_redirect": Budget(queries=1),
+    "core:file_delete": Budget(queries=6),
+    "core:register": Budget(queries=2),
+    "core:login": Budget(queries=2),
+    "core:about_user": Budget(queries=4),
+    "core:metrics": Budget(queries=0),
+}
+
+
+def get_budget(view_name: str) -> Budget | None:
+    """
+    The budget of ``view_name``, ``VIEW_BUDGETS`` (``{view_name: (queries,
+    ms)}``) overrides the defaults.
+    """
+    overrides = getattr(settings, "VIEW_BUDGETS", {})
+    if view_name in overrides:
+        return Budget(*overrides[view_name])
+    return BUDGETS.get(view_name)
+
+
+class QueryStats:
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+
+# the stats of every track_queries() the current code runs in.
+_current: ContextVar[tuple[QueryStats, ...]] = ContextVar("query_stats", default=())
+
+
+def record_query(execute, sql, params, many, context):
+    current = _current.get()
+    if not current:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        for stats in current:
+            stats.queries += 1
+            stats.duration += duration
+
+
+def install_query_recorder(connection) -> None:
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """
+    Counts the queries run on any database in this context, including the
+    threads ``sync_to_async`` runs the sync code in.
+    """
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection)
+    stats = QueryStats()
+    token = _current.set(_current.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def over_budget(view_name: str, stats: QueryStats, ms: float) -> Budget | None:
+    """
+    The budget of ``view_name`` when the request exceeded it.
+    """
+    budget = get_budget(view_name)
+    if budget is None:
+        return None
+    if stats.queries > budget.queries or (budget.ms is not None and ms > budget.ms):
+        return budget
+    return None
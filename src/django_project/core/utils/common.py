@@ -1,9 +1,41 @@
+import base64
+import binascii
+import json
+from collections.abc import Mapping
+from datetime import datetime
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.core.paginator import Page, Paginator
-from django.db.models import Model
+from django.db.models import Model, Q, QuerySet
 
 from ..models import ShortenedURL, UploadedFile
 
 
+class OffsetPage(Page):
+    """
+    A ``Page`` with the query strings of itself and its neighbours, which
+    the templates use for both pagination modes.
+    """
+
+    @property
+    def query(self) -> str:
+        return urlencode({"page": self.number})
+
+    @property
+    def previous_query(self) -> str:
+        return urlencode({"page": self.previous_page_number()})
+
+    @property
+    def next_query(self) -> str:
+        return urlencode({"page": self.next_page_number()})
+
+
+class OffsetPaginator(Paginator):
+    def _get_page(self, *args, **kwargs):
+        return OffsetPage(*args, **kwargs)
+
+
 def get_paginated_items(
     query,
     page: int | None = None,
@@ -12,7 +44,7 @@ def get_paginated_items(
     page = page or 1
     if page < 0:
         return None
-    p = Paginator(
+    p = OffsetPaginator(
         query,
         page_size,
     )
@@ -21,6 +53,146 @@ def get_paginated_items(
     return p.page(page)
 
 
+# newest first, the id breaks the ties between rows inserted together.
+KEYSET_ORDERING = ["-inserted_at", "-id"]
+
+type Key = tuple[datetime, int]
+
+
+def encode_cursor(direction: str, key: Key) -> str:
+    data = json.dumps([direction, key[0].isoformat(), key[1]])
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, Key] | None:
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, inserted_at, pk = json.loads(data)
+        if direction not in ("after", "before"):
+            return None
+        return direction, (datetime.fromisoformat(inserted_at), int(pk))
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+class KeysetPage:
+    """
+    A page of rows ordered by ``KEYSET_ORDERING``, addressed by a cursor
+    (the key of a row and a direction) instead of a page number.
+    """
+
+    def __init__(
+        self,
+        object_list: list,
+        cursor: str | None,
+        has_previous: bool,
+        has_next: bool,
+    ):
+        self.object_list = object_list
+        self.cursor = cursor
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def has_previous(self) -> bool:
+        return self._has_previous
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    @property
+    def query(self) -> str:
+        return urlencode({"cursor": self.cursor}) if self.cursor else ""
+
+    @property
+    def previous_query(self) -> str:
+        first = self.object_list[0]
+        return urlencode(
+            {"cursor": encode_cursor("before", (first.inserted_at, first.pk))}
+        )
+
+    @property
+    def next_query(self) -> str:
+        last = self.object_list[-1]
+        return urlencode(
+            {"cursor": encode_cursor("after", (last.inserted_at, last.pk))}
+        )
+
+
+def get_keyset_page(
+    query: QuerySet,
+    cursor: str | None = None,
+    page_size: int = 5,
+) -> KeysetPage:
+    """
+    One index range scan per page, whatever its depth: the rows after (or
+    before) the cursor's key, plus one to know whether there are more.
+    """
+    decoded = decode_cursor(cursor) if cursor else None
+    if decoded is None:
+        items = list(query.order_by(*KEYSET_ORDERING)[: page_size + 1])
+        return KeysetPage(items[:page_size], None, False, len(items) > page_size)
+
+    direction, (inserted_at, pk) = decoded
+    if direction == "after":
+        items = list(
+            query.filter(
+                Q(inserted_at__lt=inserted_at) | Q(inserted_at=inserted_at, pk__lt=pk)
+            ).order_by(*KEYSET_ORDERING)[: page_size + 1]
+        )
+        if items:
+            return KeysetPage(items[:page_size], cursor, True, len(items) > page_size)
+        # e.g. the last row of the last page was deleted, the new last page.
+        items = list(query.order_by("inserted_at", "id")[: page_size + 1])
+        return KeysetPage(
+            items[:page_size][::-1], cursor, len(items) > page_size, False
+        )
+
+    items = list(
+        query.filter(
+            Q(inserted_at__gt=inserted_at) | Q(inserted_at=inserted_at, pk__gt=pk)
+        ).order_by("inserted_at", "id")[: page_size + 1]
+    )
+    if not items:
+        return get_keyset_page(query, None, page_size)
+    return KeysetPage(items[:page_size][::-1], cursor, len(items) > page_size, True)
+
+
+def get_list_page(
+    params: Mapping[str, str],
+    query: QuerySet,
+    page_size: int = 5,
+) -> Page | KeysetPage | None:
+    """
+    The page of ``query`` the ``page`` (or, with ``KEYSET_PAGINATION``,
+    ``cursor``) of the request's ``params`` points to.
+    """
+    if getattr(settings, "KEYSET_PAGINATION", False):
+        return get_keyset_page(query, params.get("cursor"), page_size)
+    try:
+        page = int(params.get("page", 1))
+    except (TypeError, ValueError):
+        page = None
+    return get_paginated_items(query.order_by(*KEYSET_ORDERING), page, page_size)
+
+
+def get_page_query(params: Mapping[str, str]) -> str:
+    """
+    The query string of the list page given by ``params``, where the delete
+    views send back to.
+    """
+    if getattr(settings, "KEYSET_PAGINATION", False):
+        cursor = params.get("cursor")
+        return urlencode({"cursor": cursor}) if cursor else ""
+    try:
+        page = int(params.get("page", 1))
+    except (TypeError, ValueError):
+        page = 1
+    return urlencode({"page": page})
+
+
 def get_latest_uploaded_files(is_public=True, count=10):
     return UploadedFile.objects.filter(
         is_public=is_public,
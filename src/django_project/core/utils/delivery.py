@@ -0,0 +1,254 @@
+import io
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpRequest,
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import redirect
+from django.utils.http import content_disposition_header
+
+from ..models import UploadedFile
+from .alias_cache import ResolvedFile
+from .http_cache import Validators, if_range_matches
+from .metrics import metrics
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Returns the ``(start, end)`` (inclusive) byte range requested by a Range
+    header, or None when the whole file should be sent. Multiple ranges are
+    not supported and answered with the whole file, as allowed by RFC 9110.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range, the last N bytes.
+        length = int(last)
+        # an empty file has no last bytes to send.
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        # an invalid range, to be ignored.
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+class RangeFile(io.RawIOBase):
+    """
+    Read only view of ``length`` bytes of ``file`` starting at ``start``.
+
+    ``fileno()`` is exposed and the underlying position is kept in sync, so
+    servers implementing ``wsgi.file_wrapper`` with sendfile (gunicorn) still
+    send it without copying it through python.
+    """
+
+    def __init__(self, file, start: int, length: int):
+        self.file = file
+        self.start = start
+        self.length = length
+        self.name = file.name
+        self.file.seek(start)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell() - self.start
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.tell()
+        elif whence == io.SEEK_END:
+            offset += self.length
+        offset = min(max(offset, 0), self.length)
+        self.file.seek(self.start + offset)
+        return offset
+
+    def read(self, size=-1):
+        remaining = self.length - self.tell()
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        return self.file.read(size)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+class AsyncFileResponse(FileResponse):
+    """
+    ``FileResponse`` streaming through an async iterator, for the async views.
+
+    Served by ASGI, django reads a sync iterator into a list before sending
+    anything, the whole file in memory. Here every chunk is read in a thread
+    instead, so the event loop isn't blocked either.
+    """
+
+    block_size = 64 * 1024
+
+    def _set_streaming_content(self, value):
+        if not hasattr(value, "read"):
+            return super()._set_streaming_content(value)
+        self.file_to_stream = value
+        self._resource_closers.append(value.close)
+        self.set_headers(value)
+        StreamingHttpResponse._set_streaming_content(self, self._read(value))
+
+    async def _read(self, file):
+        read = sync_to_async(file.read, thread_sensitive=False)
+        while chunk := await read(self.block_size):
+            yield chunk
+
+
+def get_storage():
+    return UploadedFile._meta.get_field("file").storage  # pyright: ignore[reportAttributeAccessIssue]
+
+
+def offload_response(header: str, value: str, filename: str) -> HttpResponse:
+    content_type, _ = mimetypes.guess_type(filename)
+    response = HttpResponse(content_type=content_type or "application/octet-stream")
+    response[header] = value
+    response["Content-Disposition"] = content_disposition_header(False, filename)
+    return response
+
+
+def file_response(
+    request: HttpRequest,
+    path: str,
+    filename: str,
+    validators: Validators | None = None,
+    response_class: type[FileResponse] = FileResponse,
+) -> HttpResponse:
+    try:
+        size = os.stat(path).st_size
+    except FileNotFoundError:
+        raise Http404("File not found.")
+    range_header = request.headers.get("Range")
+    if validators and not if_range_matches(request, validators):
+        # the client's partial copy is outdated, it needs the whole file.
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    try:
+        # closed by the response once sent.
+        file = open(path, "rb")  # noqa: SIM115
+    except FileNotFoundError:
+        raise Http404("File not found.")
+    if byte_range is None:
+        response = response_class(file, filename=filename)
+        metrics.inc("file_delivery_bytes_total", size)
+    else:
+        start, end = byte_range
+        metrics.inc("file_delivery_bytes_total", end - start + 1)
+        response = response_class(
+            RangeFile(file, start, end - start + 1),
+            filename=filename,
+            status=206,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def deliver(
+    request: HttpRequest,
+    target: ResolvedFile,
+    validators: Validators | None = None,
+    response_class: type[FileResponse] = FileResponse,
+) -> HttpResponse:
+    """
+    Sends an uploaded file according to ``FILE_DELIVERY_MODE``:
+
+    - ``redirect``: 302 to its MEDIA_URL.
+    - ``direct``: streamed by django, with Range support.
+    - ``x-accel-redirect``: offloaded to nginx, through the internal location
+      ``FILE_DELIVERY_ACCEL_PREFIX`` mapped to MEDIA_ROOT.
+    - ``x-sendfile``: offloaded to apache/lighttpd with its absolute path.
+    """
+    storage = get_storage()
+    mode = getattr(settings, "FILE_DELIVERY_MODE", "redirect")
+    filename = target["original_name"] or os.path.basename(target["file"])
+    metrics.inc("file_deliveries_total", mode=mode)
+    if mode == "redirect":
+        return redirect(request.build_absolute_uri(storage.url(target["file"])))
+    if mode == "direct":
+        return file_response(
+            request,
+            storage.path(target["file"]),
+            filename,
+            validators,
+            response_class,
+        )
+    if mode == "x-accel-redirect":
+        prefix = getattr(settings, "FILE_DELIVERY_ACCEL_PREFIX", "/protected-media/")
+        return offload_response(
+            "X-Accel-Redirect",
+            prefix.rstrip("/") + "/" + quote(target["file"]),
+            filename,
+        )
+    if mode == "x-sendfile":
+        return offload_response(
+            "X-Sendfile",
+            storage.path(target["file"]),
+            filename,
+        )
+    raise ValueError(f"Unknown FILE_DELIVERY_MODE: {mode}")
+
+
+async def adeliver(
+    request: HttpRequest,
+    target: ResolvedFile,
+    validators: Validators | None = None,
+) -> HttpResponse:
+    """
+    ``deliver`` for the async views. The ``direct`` mode opens the file in a
+    thread and streams it with ``AsyncFileResponse``, the others don't touch
+    the disk.
+    """
+    if getattr(settings, "FILE_DELIVERY_MODE", "redirect") != "direct":
+        return deliver(request, target, validators)
+    return await sync_to_async(deliver, thread_sensitive=False)(
+        request, target, validators, AsyncFileResponse
+    )
@@ -0,0 +1,86 @@
+import hashlib
+import mimetypes
+import typing as t
+
+# how many bytes of the content ``sniff_content_type`` looks at.
+SNIFF_SIZE = 512
+
+SIGNATURES: list[tuple[bytes, str]] = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"%PDF-", "application/pdf"),
+    (b"PK\x03\x04", "application/zip"),
+    (b"\x1f\x8b", "application/gzip"),
+    (b"BZh", "application/x-bzip2"),
+    (b"\xfd7zXZ\x00", "application/x-xz"),
+    (b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed"),
+    (b"\x28\xb5\x2f\xfd", "application/zstd"),
+    (b"OggS", "audio/ogg"),
+    (b"ID3", "audio/mpeg"),
+    (b"fLaC", "audio/flac"),
+    (b"\x1aE\xdf\xa3", "video/webm"),
+    (b"\x00asm", "application/wasm"),
+    (b"\x7fELF", "application/x-executable"),
+]
+
+RIFF_TYPES = {
+    b"WEBP": "image/webp",
+    b"WAVE": "audio/wav",
+    b"AVI ": "video/x-msvideo",
+}
+
+
+def sniff_content_type(head: bytes, name: str) -> str:
+    """
+    The MIME type of a content starting with ``head``: from its magic bytes
+    when they are known, else guessed from ``name`` (the zip based formats
+    keep theirs), never what the client claimed.
+    """
+    guessed, _ = mimetypes.guess_type(name)
+    if head[:4] == b"RIFF" and head[8:12] in RIFF_TYPES:
+        return RIFF_TYPES[head[8:12]]
+    if head[4:8] == b"ftyp":
+        # mp4, mov, m4a, heic... all ISO base media files.
+        if guessed and guessed.startswith(("video/", "audio/", "image/")):
+            return guessed
+        return "video/mp4"
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            if content_type == "application/zip" and guessed:
+                # docx, xlsx, jar, epub...
+                return guessed
+            return content_type
+    if guessed:
+        return guessed
+    if b"\x00" in head:
+        return "application/octet-stream"
+    try:
+        head.decode()
+    except UnicodeDecodeError as e:
+        # a multibyte character cut at the end of ``head`` is still text.
+        if e.start < len(head) - 3:
+            return "application/octet-stream"
+    return "text/plain"
+
+
+class FileMetadata(t.NamedTuple):
+    size: int
+    content_type: str
+    checksum: str
+
+
+def read_file_metadata(file, name: str) -> FileMetadata:
+    """
+    Reads ``file`` through once for its size, sniffed MIME type and sha256.
+    """
+    hasher = hashlib.sha256()
+    head = b""
+    size = 0
+    for chunk in file.chunks():
+        if len(head) < SNIFF_SIZE:
+            head += chunk[: SNIFF_SIZE - len(head)]
+        hasher.update(chunk)
+        size += len(chunk)
+    return FileMetadata(size, sniff_content_type(head, name), hasher.hexdigest())
@@ -0,0 +1,104 @@
+import hashlib
+import typing as t
+from datetime import datetime
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.shortcuts import redirect
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .alias_cache import ResolvedFile, ResolvedURL
+
+
+class Validators(t.NamedTuple):
+    etag: str
+    last_modified: int
+
+
+def hashed_etag(*parts: t.Any) -> str:
+    digest = hashlib.sha256(":".join(str(part) for part in parts).encode())
+    return quote_etag(digest.hexdigest()[:32])
+
+
+def timestamp(value: datetime) -> int:
+    return int(value.timestamp())
+
+
+def url_validators(target: ResolvedURL) -> Validators:
+    return Validators(
+        hashed_etag(target["pk"], target["updated_at"].isoformat(), target["url"]),
+        timestamp(target["updated_at"]),
+    )
+
+
+def file_validators(target: ResolvedFile) -> Validators:
+    # the content digest when it is known, so identical content shares it.
+    if target["digest"]:
+        etag = quote_etag(target["digest"])
+    else:
+        etag = hashed_etag(
+            target["pk"], target["updated_at"].isoformat(), target["file"]
+        )
+    return Validators(etag, timestamp(target["updated_at"]))
+
+
+def not_modified(request: HttpRequest, validators: Validators) -> HttpResponse | None:
+    """
+    The 304 (or 412) answering the request's preconditions, if any.
+    """
+    return get_conditional_response(
+        request,
+        etag=validators.etag,
+        last_modified=validators.last_modified,
+    )
+
+
+def if_range_matches(request: HttpRequest, validators: Validators) -> bool:
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    return if_range in (validators.etag, http_date(validators.last_modified))
+
+
+def patch_caching_headers(
+    response: HttpResponse,
+    validators: Validators,
+    max_age: int = 0,
+    immutable: bool = False,
+) -> HttpResponse:
+    """
+    Sets the validators and Cache-Control. Without a ``max_age`` clients
+    revalidate on every use, so each use still reaches (and is logged by)
+    the server, only answered with a cheap 304.
+    """
+    response["ETag"] = validators.etag
+    response["Last-Modified"] = http_date(validators.last_modified)
+    if max_age:
+        patch_cache_control(response, public=True, max_age=max_age)
+        if immutable:
+            patch_cache_control(response, immutable=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def cached_redirect(request: HttpRequest, target: ResolvedURL) -> HttpResponse:
+    """
+    Redirects to a shortened URL. Public ones become permanent, long lived
+    redirects with ``REDIRECT_PERMANENT_PUBLIC``, at the cost of not seeing
+    the clicks the browsers and CDNs answer from their cache.
+    """
+    validators = url_validators(target)
+    permanent = target["is_public"] and getattr(
+        settings, "REDIRECT_PERMANENT_PUBLIC", False
+    )
+    if permanent:
+        max_age = getattr(settings, "REDIRECT_PERMANENT_MAX_AGE", 3600 * 24 * 365)
+    else:
+        max_age = getattr(settings, "REDIRECT_CACHE_MAX_AGE", 0)
+
+    response = not_modified(request, validators) or redirect(
+        target["url"], permanent=permanent
+    )
+    return patch_caching_headers(response, validators, max_age, immutable=permanent)
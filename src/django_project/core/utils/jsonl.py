@@ -0,0 +1,116 @@
+import contextlib
+import gzip
+import io
+import sys
+import time
+import typing as t
+
+from django.contrib.auth import get_user_model
+from django.db import models
+from request.models import Request
+
+from ..models import (
+    AliasSequence,
+    FileBlob,
+    RequestDailyPathCount,
+    ShortenedURL,
+    ShortenedURLDailyViewCount,
+    UploadedFile,
+    UploadedFileDailyViewCount,
+)
+
+
+def export_models(clicks: bool = True) -> list[type[models.Model]]:
+    """
+    The models dumped by ``export_jsonl``, in an order where every row only
+    references rows of models listed before it.
+    """
+    exported: list[type[models.Model]] = [
+        get_user_model(),
+        AliasSequence,
+        FileBlob,
+        ShortenedURL,
+        UploadedFile,
+    ]
+    if clicks:
+        exported += [
+            Request,
+            RequestDailyPathCount,
+            ShortenedURL.requests.through,
+            UploadedFile.requests.through,
+            ShortenedURLDailyViewCount,
+            UploadedFileDailyViewCount,
+        ]
+    return exported
+
+
+def exported_fields(model: type[models.Model]) -> list[str]:
+    # many to many relations are exported as rows of their through model.
+    return [
+        field.name for field in model._meta.concrete_fields if not field.primary_key
+    ]
+
+
+@contextlib.contextmanager
+def explicit_timestamps(model: type[models.Model]) -> t.Iterator[None]:
+    """
+    Turns off the ``auto_now`` and ``auto_now_add`` of ``model``'s fields, so
+    ``bulk_create`` keeps the imported values instead of the current time.
+    """
+    fields = [
+        field
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]  # pyright: ignore[reportAttributeAccessIssue]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False  # pyright: ignore[reportAttributeAccessIssue]
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add  # pyright: ignore[reportAttributeAccessIssue]
+
+
+def open_jsonl(path: str, mode: t.Literal["r", "w"]) -> t.TextIO:
+    """
+    Opens a JSONL file for reading or writing, gzip compressed when its name
+    ends with ``.gz``. ``-`` is stdin or stdout.
+    """
+    if path == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(
+            gzip.open(path, mode + "b"),  # pyright: ignore[reportArgumentType]
+            encoding="utf-8",
+        )
+    return open(path, mode, encoding="utf-8")
+
+
+class Progress:
+    """
+    Counts processed records and reports them, with the throughput, every
+    ``every`` records. The reported count is the checkpoint to resume from.
+    """
+
+    def __init__(self, write: t.Callable[[str], t.Any], offset: int, every: int):
+        self.write = write
+        self.offset = offset
+        self.every = every
+        self.count = offset
+        self.started = time.monotonic()
+        self.last_report = offset
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return (self.count - self.offset) / elapsed if elapsed else 0.0
+
+    def add(self, count: int) -> None:
+        self.count += count
+        if self.count - self.last_report >= self.every:
+            self.report()
+
+    def report(self) -> None:
+        self.last_report = self.count
+        self.write(f"{self.count} records ({self.rate:.0f} records/s)")
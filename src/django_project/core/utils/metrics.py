@@ -0,0 +1,236 @@
+import atexit
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+import typing as t
+from collections import defaultdict
+
+from django.conf import settings
+
+from . import alias_cache, attribution, metrics_files, trending
+from .metrics_files import Labels, Snapshot
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "webtoolkit_"
+# seconds, like prometheus_client's defaults.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "request_duration_seconds": ("histogram", "Request latency by URL name."),
+    "redirects_total": ("counter", "Short URL and file redirect responses."),
+    "db_queries_total": ("counter", "Database queries by URL name."),
+    "uploads_total": ("counter", "Completed file uploads."),
+    "upload_bytes_total": ("counter", "Bytes of the completed file uploads."),
+    "upload_seconds_total": ("counter", "Time spent receiving the uploads."),
+    "file_deliveries_total": ("counter", "Uploaded files sent, by delivery mode."),
+    "file_delivery_bytes_total": ("counter", "Bytes of files streamed by django."),
+    "alias_cache_lookups_total": ("counter", "Alias cache lookups by result."),
+    "trending_cache_lookups_total": ("counter", "Trending snapshot lookups."),
+    "attribution_queue_depth": ("gauge", "Clicks waiting to be attributed."),
+    "alias_filter_false_positive_rate": (
+        "gauge",
+        "Estimated false positive rate of the alias bloom filters.",
+    ),
+}
+
+
+def labels_key(labels: dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+class Metrics:
+    """
+    The counters and histograms of this process, written as JSON to
+    ``METRICS_DIR/<pid>-<start time>.json`` every ``METRICS_WRITE_INTERVAL`` seconds by a
+    background thread, so ``/metrics`` can add up every worker's. Recording
+    only touches memory.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: defaultdict[tuple[str, Labels], float] = defaultdict(float)
+        self._histograms: dict[tuple[str, Labels], list] = {}
+        self._start_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._process: tuple[int, int] | None = None
+
+    @property
+    def directory(self) -> str:
+        return metrics_files.get_directory()
+
+    @property
+    def process(self) -> tuple[int, int]:
+        """
+        The pid and start time (ms) of this process, forks get their own.
+        """
+        if self._process is None or self._process[0] != os.getpid():
+            self._process = (os.getpid(), int(time.time() * 1000))
+        return self._process
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = (name, labels_key(labels))
+        with self._lock:
+            self._counters[key] += amount
+        self._ensure_started()
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, labels_key(labels))
+        index = bisect.bisect_left(BUCKETS, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+            histogram[0][index] += 1
+            histogram[1] += value
+        self._ensure_started()
+
+    def snapshot(self) -> Snapshot:
+        with self._lock:
+            counters = [(*key, value) for key, value in self._counters.items()]
+            histograms = [
+                (*key, list(counts), total)
+                for key, (counts, total) in self._histograms.items()
+            ]
+        # the stats these modules keep anyway, nothing to record for them.
+        for kind, stats in alias_cache.get_stats().items():
+            for result, value in stats.items():
+                counters.append(
+                    (
+                        "alias_cache_lookups_total",
+                        labels_key({"kind": kind, "result": result}),
+                        value,
+                    )
+                )
+        for result in ["hits", "misses"]:
+            counters.append(
+                (
+                    "trending_cache_lookups_total",
+                    labels_key({"result": result}),
+                    trending.stats[result],
+                )
+            )
+        gauges = [("attribution_queue_depth", (), len(attribution.buffer))]
+        for aliases in [alias_cache.shortened_urls, alias_cache.uploaded_files]:
+            rate = aliases.filter.false_positive_rate if aliases.filter else None
+            if rate is not None:
+                gauges.append(
+                    (
+                        "alias_filter_false_positive_rate",
+                        labels_key({"kind": aliases.kind}),
+                        rate,
+                    )
+                )
+        pid, started = self.process
+        return {
+            "pid": pid,
+            "started": started,
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": histograms,
+        }
+
+    def write(self) -> None:
+        snapshot = self.snapshot()
+        metrics_files.write_snapshot(
+            metrics_files.snapshot_path(
+                self.directory, snapshot["pid"], snapshot["started"]
+            ),
+            snapshot,
+        )
+
+    def _ensure_started(self) -> None:
+        # the pid check restarts the writer in forked (preloaded) workers.
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        if not getattr(settings, "METRICS", False):
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            if self._pid is None:
+                atexit.register(self._write_at_exit)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run,
+                name="metrics-writer",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(getattr(settings, "METRICS_WRITE_INTERVAL", 5.0))
+            try:
+                self.write()
+            except Exception:
+                logger.exception("Failed to write the metrics")
+
+    def _write_at_exit(self) -> None:
+        try:
+            self.write()
+        except Exception:
+            logger.exception("Failed to write the metrics at exit")
+
+
+metrics = Metrics()
+
+
+def format_labels(labels: t.Iterable[t.Sequence[str]]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\""))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def render() -> str:
+    """
+    Every worker's metrics added up, in the Prometheus text exposition
+    format. The counters of workers that exited are kept, their gauges are
+    not, see ``metrics_files.mark_process_dead``.
+    """
+    metrics.write()
+    totals = metrics_files.add_up(metrics.directory)
+    counters, gauges, histograms = totals.counters, totals.gauges, totals.histograms
+
+    samples: defaultdict[str, list[str]] = defaultdict(list)
+    for (name, labels), value in sorted(counters.items()) + sorted(gauges.items()):
+        samples[name].append(
+            f"{PREFIX}{name}{format_labels(labels)} {format_value(value)}"
+        )
+    for (name, labels), (counts, total) in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip([*BUCKETS, math.inf], counts):
+            cumulative += count
+            bucket_labels = [*labels, ("le", format_value(bound))]
+            samples[name].append(
+                f"{PREFIX}{name}_bucket{format_labels(bucket_labels)} {cumulative}"
+            )
+        samples[name].append(
+            f"{PREFIX}{name}_sum{format_labels(labels)} {format_value(total)}"
+        )
+        samples[name].append(
+            f"{PREFIX}{name}_count{format_labels(labels)} {cumulative}"
+        )
+
+    lines = []
+    for name, (kind, description) in HELP.items():
+        lines.append(f"# HELP {PREFIX}{name} {description}")
+        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+        lines += samples.pop(name, [])
+    for extra in samples.values():
+        lines += extra
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,143 @@
+import glob
+import json
+import os
+import tempfile
+import typing as t
+from collections import defaultdict
+
+from django.conf import settings
+
+# only depends on the settings, so the gunicorn master can import it without
+# setting django up.
+
+type Labels = tuple[tuple[str, str], ...]
+
+# the counters and histograms of the workers that exited.
+EXITED = "exited.json"
+
+
+class Snapshot(t.TypedDict):
+    pid: int
+    # process start time (ms), pids get reused.
+    started: int
+    # [name, labels, value]
+    counters: list[tuple[str, Labels, float]]
+    gauges: list[tuple[str, Labels, float]]
+    # [name, labels, per bucket counts (+Inf last), sum]
+    histograms: list[tuple[str, Labels, list[int], float]]
+
+
+def get_directory() -> str:
+    return getattr(settings, "METRICS_DIR", None) or os.path.join(
+        tempfile.gettempdir(), "webtoolkit-metrics"
+    )
+
+
+def snapshot_path(directory: str, pid: int, started: int) -> str:
+    return os.path.join(directory, f"{pid}-{started}.json")
+
+
+def write_snapshot(path: str, snapshot: Snapshot) -> None:
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        "w", dir=directory, suffix=".tmp", delete=False
+    ) as f:
+        json.dump(snapshot, f)
+    os.replace(f.name, path)
+
+
+def read_snapshots(paths: t.Iterable[str]) -> list[Snapshot]:
+    snapshots = []
+    for path in paths:
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            # replaced or removed while reading.
+            continue
+    return snapshots
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Totals:
+    """
+    The metrics of several snapshots added up.
+    """
+
+    def __init__(self):
+        self.counters: defaultdict[tuple[str, Labels], float] = defaultdict(float)
+        self.gauges: defaultdict[tuple[str, Labels], float] = defaultdict(float)
+        self.histograms: dict[tuple[str, Labels], list] = {}
+
+    def add(self, snapshot: Snapshot, gauges: bool = True) -> None:
+        for name, labels, value in snapshot["counters"]:
+            self.counters[name, tuple(map(tuple, labels))] += value
+        if gauges:
+            for name, labels, value in snapshot["gauges"]:
+                self.gauges[name, tuple(map(tuple, labels))] += value
+        for name, labels, counts, total in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            histogram = self.histograms.setdefault(key, [[0] * len(counts), 0.0])
+            histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+            histogram[1] += total
+
+    def snapshot(self, pid: int = 0, started: int = 0) -> Snapshot:
+        return {
+            "pid": pid,
+            "started": started,
+            "counters": [(*key, value) for key, value in self.counters.items()],
+            "gauges": [(*key, value) for key, value in self.gauges.items()],
+            "histograms": [
+                (*key, counts, total)
+                for key, (counts, total) in self.histograms.items()
+            ],
+        }
+
+
+def add_up(directory: str) -> Totals:
+    """
+    The metrics of every process, the gauges of the live ones only.
+    """
+    totals = Totals()
+    for snapshot in read_snapshots(glob.glob(os.path.join(directory, "*.json"))):
+        totals.add(snapshot, gauges=bool(snapshot["pid"]) and is_alive(snapshot["pid"]))
+    return totals
+
+
+def mark_process_dead(pid: int, directory: str | None = None) -> None:
+    """
+    Folds the counters and histograms of the exited process ``pid`` into
+    ``EXITED``, so they keep counting, and removes its files. Its gauges are
+    dropped. Meant for gunicorn's ``child_exit`` hook, which the master runs
+    for one worker at a time.
+    """
+    directory = directory or get_directory()
+    paths = glob.glob(os.path.join(directory, f"{pid}-*.json"))
+    if not paths:
+        return
+    exited = os.path.join(directory, EXITED)
+    totals = Totals()
+    for snapshot in read_snapshots([exited, *paths]):
+        totals.add(snapshot, gauges=False)
+    write_snapshot(exited, totals.snapshot())
+    for path in paths:
+        os.unlink(path)
+
+
+def clear(directory: str | None = None) -> None:
+    """
+    Removes every snapshot, for when the server starts.
+    """
+    directory = directory or get_directory()
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.unlink(path)
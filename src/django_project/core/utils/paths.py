@@ -0,0 +1,124 @@
+import functools
+import re
+import typing as t
+from collections.abc import Iterable
+
+from django.conf import settings
+
+from ..models import ShortenedURL, StatisticsModelMixin, UploadedFile
+from . import alias_cache
+
+# the views whose paths are attributed, with the model their key points to.
+ALIAS_VIEWS: dict[str, type[StatisticsModelMixin]] = {
+    "url_shortener_url": ShortenedURL,
+    "file_redirect": UploadedFile,
+}
+
+PARAMETER_RE = re.compile(r"<(?:[^>:]+:)?([^>]+)>")
+
+
+class AliasRoute(t.NamedTuple):
+    prefix: str
+    suffix: str
+    key: re.Pattern[str]
+    model: type[StatisticsModelMixin]
+
+
+class PathClassifier:
+    """
+    Tells the paths of the alias views apart from all the others with a
+    prefix check and a regex match of the rest, where ``resolve()`` walks
+    every URL pattern.
+    """
+
+    def __init__(self, routes: Iterable[AliasRoute]):
+        self.routes = list(routes)
+
+    @classmethod
+    def from_urls(cls) -> "PathClassifier":
+        from .. import urls
+
+        base_url_path = getattr(settings, "BASE_URL_PATH", "")
+        base = f"/{base_url_path}/" if base_url_path else "/"
+        routes = []
+        for pattern in urls.urlpatterns:
+            model = ALIAS_VIEWS.get(pattern.name)
+            if model is None:
+                continue
+            route = str(pattern.pattern)
+            match = PARAMETER_RE.search(route)
+            if match is None:
+                continue
+            converter = pattern.pattern.converters[match[1]]
+            routes.append(
+                AliasRoute(
+                    base + route[: match.start()],
+                    route[match.end() :],
+                    re.compile(converter.regex),
+                    model,
+                )
+            )
+        return cls(routes)
+
+    def classify(self, path: str) -> tuple[type[StatisticsModelMixin], str] | None:
+        """
+        The model and alias key ``path`` points to, None for any other path.
+        """
+        for route in self.routes:
+            if not path.startswith(route.prefix) or not path.endswith(route.suffix):
+                continue
+            key = path[len(route.prefix) : len(path) - len(route.suffix)]
+            if route.key.fullmatch(key):
+                return route.model, key
+        return None
+
+    def classify_many(
+        self,
+        paths: Iterable[str],
+    ) -> dict[type[StatisticsModelMixin], dict[str, str]]:
+        """
+        The alias keys of ``paths`` by model, as ``{path: key}``.
+        """
+        by_model: dict[type[StatisticsModelMixin], dict[str, str]] = {}
+        for path in set(paths):
+            target = self.classify(path)
+            if target:
+                by_model.setdefault(target[0], {})[path] = target[1]
+        return by_model
+
+    def resolve(
+        self,
+        path: str,
+        cached: bool = True,
+    ) -> tuple[type[StatisticsModelMixin], int] | None:
+        """
+        The model and primary key of the object ``path`` points to.
+        """
+        resolved = self.resolve_many([path], cached=cached)
+        return resolved.get(path)
+
+    def resolve_many(
+        self,
+        paths: Iterable[str],
+        cached: bool = True,
+        store: bool = True,
+    ) -> dict[str, tuple[type[StatisticsModelMixin], int]]:
+        """
+        The model and primary key of the objects ``paths`` point to, through
+        the alias caches and one query per model for the rest. Backfills
+        pass ``store=False`` not to flush the caches of the live lookups.
+        """
+        resolved = {}
+        for model, keys in self.classify_many(paths).items():
+            found = alias_cache.for_model(model).get_many(
+                keys.values(), cached=cached, store=store
+            )
+            for path, key in keys.items():
+                if key in found:
+                    resolved[path] = (model, found[key]["pk"])
+        return resolved
+
+
+@functools.cache
+def get_classifier() -> PathClassifier:
+    return PathClassifier.from_urls()
@@ -0,0 +1,139 @@
+import os
+import time
+from collections.abc import Iterator
+from datetime import date, datetime, timedelta
+from itertools import batched
+
+from django.core import serializers
+from django.db import models, router, transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from request.models import Request
+
+from ..models import RequestDailyPathCount, ShortenedURL, UploadedFile
+from . import jsonl
+
+
+def through_models() -> list[type[models.Model]]:
+    """
+    The rows attributing requests to objects, they only reference them by id
+    so they have to be archived and deleted along with them.
+    """
+    return [
+        ShortenedURL.requests.through,
+        UploadedFile.requests.through,
+    ]
+
+
+def day_bounds(day: date) -> tuple[datetime, datetime]:
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    end = timezone.make_aware(
+        datetime.combine(day + timedelta(days=1), datetime.min.time())
+    )
+    return start, end
+
+
+def day_requests(day: date) -> models.QuerySet[Request]:
+    start, end = day_bounds(day)
+    return Request.objects.filter(time__gte=start, time__lt=end).order_by()
+
+
+def rolled_up_until() -> date | None:
+    """
+    The first day whose requests are still counted from the raw ``Request``
+    rows, None when nothing was rolled up yet.
+    """
+    last = RequestDailyPathCount.objects.aggregate(last=Max("day"))["last"]
+    return last + timedelta(days=1) if last else None
+
+
+def prunable_days(cutoff: date) -> Iterator[date]:
+    """
+    The days before ``cutoff`` that still have logged requests, oldest first.
+    """
+    first = Request.objects.aggregate(first=Min("time"))["first"]
+    if first is None:
+        return
+    day = timezone.localdate(first)
+    while day < cutoff:
+        yield day
+        day += timedelta(days=1)
+
+
+def roll_up_day(day: date) -> int:
+    """
+    Stores the per path request counts of ``day``, once: a day already
+    rolled up (and maybe partly deleted since) is left alone.
+    """
+    if RequestDailyPathCount.objects.filter(day=day).exists():
+        return 0
+    rows = [
+        RequestDailyPathCount(path=path, day=day, count=count)
+        for path, count in day_requests(day)
+        .values("path")
+        .annotate(count=Count("id"))
+        .values_list("path", "count")
+    ]
+    with transaction.atomic(using=router.db_for_write(RequestDailyPathCount)):
+        RequestDailyPathCount.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def archive_path(directory: str, day: date) -> str:
+    return os.path.join(
+        directory, f"{day:%Y}", f"{day:%m}", f"requests-{day:%Y-%m-%d}.jsonl.gz"
+    )
+
+
+def archive_day(day: date, directory: str, batch_size: int) -> str | None:
+    """
+    Writes the requests of ``day`` and their attribution rows to a gzip
+    compressed JSONL file, in ``import_jsonl``'s format. Returns its path,
+    None when it was already archived.
+    """
+    path = archive_path(directory, day)
+    if os.path.exists(path):
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path.removesuffix(".jsonl.gz") + ".partial.jsonl.gz"
+    stream = jsonl.open_jsonl(partial, "w")
+    try:
+        requests = day_requests(day).order_by("pk")
+        for chunk in batched(requests.iterator(chunk_size=batch_size), batch_size):
+            serializers.serialize("jsonl", chunk, stream=stream)
+            ids = [request.pk for request in chunk]
+            for through in through_models():
+                serializers.serialize(
+                    "jsonl",
+                    through.objects.filter(request_id__in=ids).order_by("pk"),
+                    stream=stream,
+                )
+    finally:
+        stream.close()
+    # only complete archives get their final name.
+    os.replace(partial, path)
+    return path
+
+
+def delete_day(day: date, batch_size: int, pause: float = 0) -> int:
+    """
+    Deletes the requests of ``day`` and their attribution rows,
+    ``batch_size`` requests at a time, sleeping ``pause`` seconds in between
+    so the writers of the request log get the lock.
+
+    Every table is deleted from in its own short transaction, on its own
+    database: a batch interrupted halfway leaves requests without their
+    attribution rows, which the next run deletes like the others.
+    """
+    deleted = 0
+    while ids := list(day_requests(day).values_list("pk", flat=True)[:batch_size]):
+        # the attribution rows first, they never reference a deleted request.
+        for through in through_models():
+            with transaction.atomic(using=router.db_for_write(through)):
+                through.objects.filter(request_id__in=ids).delete()
+        with transaction.atomic(using=router.db_for_write(Request)):
+            Request.objects.filter(pk__in=ids).delete()
+        deleted += len(ids)
+        if pause:
+            time.sleep(pause)
+    return deleted
@@ -1,19 +1,16 @@
-import os
 import typing as t
 from collections.abc import Iterator, Sequence
 
 from django.core.cache import cache
-from django.db.models import Count, QuerySet
-from django.urls import resolve
-from django.urls.exceptions import Resolver404
+from django.db.models import Count, QuerySet, Sum
 from request.models import Request
 
 from ..models import (
+    RequestDailyPathCount,
     ReversableModelMixin,
-    ShortenedURL,
     StatisticsModelMixin,
-    UploadedFile,
 )
+from . import paths, retention
 
 
 class Instance(t.TypedDict):
@@ -31,11 +28,20 @@ def get_all_request_counts() -> dict[str, int]:
     if request_counts:
         return request_counts
 
+    # the pruned days are counted from their daily rollups.
+    requests = Request.objects.all()
+    rolled_up_until = retention.rolled_up_until()
+    if rolled_up_until:
+        requests = requests.filter(time__gte=retention.day_bounds(rolled_up_until)[0])
     request_counts = dict(
-        Request.objects.values("path")
-        .annotate(count=Count("id"))
-        .values_list("path", "count")
+        requests.values("path").annotate(count=Count("id")).values_list("path", "count")
     )
+    for path, count in (
+        RequestDailyPathCount.objects.values("path")
+        .annotate(total=Sum("count"))
+        .values_list("path", "total")
+    ):
+        request_counts[path] = request_counts.get(path, 0) + count
     cache.set(
         "all_request_counts",
         request_counts,
@@ -69,26 +75,20 @@ def most_viewed_instances_no_post_save_signal(
 def resolve_url_path_to_db_instance(
     url_path: str,
 ) -> StatisticsModelMixin | None:
-    try:
-        match = resolve(url_path)
-        if match.view_name == "core:url_shortener_url":
-            return ShortenedURL.objects.filter(alias=match.kwargs["alias"]).first()
-        if match.view_name == "core:file_redirect":
-            alias, ext = os.path.splitext(match.kwargs["alias_filename"])
-            return UploadedFile.objects.filter(
-                alias=alias,
-                ext=ext,
-            ).first()
-    except Resolver404:
+    target = paths.get_classifier().resolve(url_path)
+    if target is None:
         return None
+    model, pk = target
+    return model.objects.filter(pk=pk).first()
 
 
 def most_viewed_instances(
     qs: QuerySet[StatisticsModelMixin],
     limit: int = 10,
 ) -> Iterator[Instance]:
-    instances = qs.annotate(request_count=Count("requests")).order_by("-request_count")[
-        :limit
-    ]
-    for instance in instances:
-        yield {"instance": instance, "view_count": instance.request_count}
+    """
+    Reads the denormalized ``view_count``, covered by the
+    ``(is_public, -view_count)`` indexes for the public listings.
+    """
+    for instance in qs.order_by("-view_count")[:limit]:
+        yield {"instance": instance, "view_count": instance.view_count}
@@ -0,0 +1,73 @@
+import functools
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.template.backends.django import Template
+
+
+class RequestTimings:
+    def __init__(self):
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_duration = 0.0
+
+
+_current: ContextVar[RequestTimings | None] = ContextVar(
+    "request_timings", default=None
+)
+# set while a template renders, so the templates it includes aren't counted
+# twice.
+_rendering: ContextVar[bool] = ContextVar("rendering_template", default=False)
+
+
+def record_cache(hit: bool) -> None:
+    timings = _current.get()
+    if timings is None:
+        return
+    if hit:
+        timings.cache_hits += 1
+    else:
+        timings.cache_misses += 1
+
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, *args, **kwargs):
+        timings = _current.get()
+        if timings is None or _rendering.get():
+            return render(self, *args, **kwargs)
+        token = _rendering.set(True)
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            timings.template_duration += time.perf_counter() - started
+            _rendering.reset(token)
+
+    wrapper.timed = True
+    return wrapper
+
+
+def install_template_timer() -> None:
+    """
+    Times the django template backend's renders, the entry point of
+    ``render()``, ``TemplateResponse`` and ``render_to_string``.
+    """
+    if not getattr(Template.render, "timed", False):
+        Template.render = _timed_render(Template.render)
+
+
+@contextmanager
+def track_request() -> Iterator[RequestTimings]:
+    """
+    Counts the alias and trending cache hits and misses and the template
+    render time in this context.
+    """
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+import typing as t
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Sum
+from django.utils import timezone
+
+from ..models import (
+    ShortenedURL,
+    StatisticsModelMixin,
+    UploadedFile,
+    daily_view_count_model,
+)
+from . import timing
+from .statistics import most_viewed_instances
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = "trending:snapshot"
+LOCK_KEY = "trending:lock"
+
+
+class Snapshot(t.TypedDict):
+    built_at: float
+    urls: list[ShortenedURL]
+    files: list[UploadedFile]
+
+
+stats = {
+    "hits": 0,
+    "misses": 0,
+    "refreshes": 0,
+}
+
+
+def top_instances(
+    model: type[StatisticsModelMixin],
+    limit: int,
+) -> list[StatisticsModelMixin]:
+    """
+    Public instances of ``model`` ordered by their ``TRENDING_MODE`` score:
+
+    - ``total``: all time views.
+    - ``window``: views in the last ``TRENDING_WINDOW_DAYS`` daily buckets,
+      today included.
+    - ``decay``: daily views weighted by ``0.5 ** (age / TRENDING_HALF_LIFE_DAYS)``
+      over the last ``TRENDING_HORIZON_DAYS`` days.
+    """
+    public = model.objects.filter(is_public=True)
+    if model is UploadedFile:
+        public = public.select_related("blob")
+    mode = getattr(settings, "TRENDING_MODE", "decay")
+    if mode == "total":
+        return [x["instance"] for x in most_viewed_instances(public, limit)]
+
+    today = timezone.localdate()
+    daily = daily_view_count_model(model).objects.filter(instance__is_public=True)
+    if mode == "window":
+        since = today - timedelta(days=getattr(settings, "TRENDING_WINDOW_DAYS", 1))
+        scored = (
+            daily.filter(day__gt=since)
+            .values("instance_id")
+            .annotate(score=Sum("count"))
+            .order_by("-score")
+            .values_list("instance_id", "score")[:limit]
+        )
+        ids = [pk for pk, _ in scored]
+    elif mode == "decay":
+        half_life = getattr(settings, "TRENDING_HALF_LIFE_DAYS", 1.0)
+        since = today - timedelta(days=getattr(settings, "TRENDING_HORIZON_DAYS", 30))
+        scores: dict[int, float] = defaultdict(float)
+        for pk, day, count in daily.filter(day__gt=since).values_list(
+            "instance_id", "day", "count"
+        ):
+            scores[pk] += count * 0.5 ** ((today - day).days / half_life)
+        ids = sorted(scores, key=lambda pk: scores[pk], reverse=True)[:limit]
+    else:
+        raise ValueError(f"Unknown TRENDING_MODE: {mode}")
+
+    instances = public.in_bulk(ids)
+    return [instances[pk] for pk in ids if pk in instances]
+
+
+def build_snapshot() -> Snapshot:
+    limit = getattr(settings, "TRENDING_LIMIT", 10)
+    snapshot: Snapshot = {
+        "built_at": time.time(),
+        "urls": top_instances(ShortenedURL, limit),  # pyright: ignore[reportAssignmentType]
+        "files": top_instances(UploadedFile, limit),  # pyright: ignore[reportAssignmentType]
+    }
+    cache.set(
+        SNAPSHOT_KEY,
+        snapshot,
+        getattr(settings, "TRENDING_SNAPSHOT_TIMEOUT", 3600 * 24),
+    )
+    stats["refreshes"] += 1
+    return snapshot
+
+
+def acquire_refresh_lock() -> bool:
+    return cache.add(LOCK_KEY, 1, getattr(settings, "TRENDING_LOCK_TIMEOUT", 60))
+
+
+def release_refresh_lock() -> None:
+    cache.delete(LOCK_KEY)
+
+
+def _locked_refresh() -> None:
+    try:
+        build_snapshot()
+    except Exception:
+        logger.exception("Failed to refresh the trending snapshot")
+    finally:
+        release_refresh_lock()
+        close_old_connections()
+
+
+def get_snapshot() -> Snapshot:
+    """
+    Returns the materialized trending lists, kept in the django cache.
+
+    Only the worker that takes the refresh lock recomputes them: inline when
+    there is no snapshot yet (after a deploy, a cache flush or an
+    invalidation), in a background thread when it's only stale, which keeps
+    being served meanwhile. Requests that miss the lock serve a missing
+    snapshot as empty lists. The snapshot, the lock and the invalidations are
+    only shared by the workers (and refresh_trending) with a shared
+    CACHE_URL, with a locmem one every process builds and invalidates its
+    own.
+    """
+    snapshot: Snapshot | None = cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        stats["misses"] += 1
+        timing.record_cache(hit=False)
+        if not acquire_refresh_lock():
+            return {"built_at": 0, "urls": [], "files": []}
+        try:
+            return build_snapshot()
+        finally:
+            release_refresh_lock()
+
+    stats["hits"] += 1
+    timing.record_cache(hit=True)
+    is_stale = time.time() - snapshot["built_at"] > getattr(
+        settings, "TRENDING_REFRESH_INTERVAL", 300
+    )
+    if is_stale and acquire_refresh_lock():
+        threading.Thread(
+            target=_locked_refresh,
+            name="trending-refresh",
+            daemon=True,
+        ).start()
+    return snapshot
+
+
+def invalidate() -> None:
+    cache.delete(SNAPSHOT_KEY)
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+from .file_metadata import SNIFF_SIZE, FileMetadata, sniff_content_type
+from .metrics import metrics
+
+
+def get_upload_dir() -> str:
+    return getattr(settings, "FILE_HOSTING_UPLOAD_DIR", None) or os.path.join(
+        settings.MEDIA_ROOT, ".incoming"
+    )
+
+
+class StreamedUploadedFile(UploadedFile):
+    """
+    Like django's ``TemporaryUploadedFile`` but created in ``directory``.
+
+    Keeping it on the same filesystem as MEDIA_ROOT lets ``FileSystemStorage``
+    rename it into place instead of copying it.
+    """
+
+    def __init__(
+        self,
+        directory,
+        name,
+        content_type,
+        size,
+        charset,
+        content_type_extra=None,
+    ):
+        _, ext = os.path.splitext(name)
+        # owned by this object, deleted by ``close()`` or moved into the storage.
+        file = tempfile.NamedTemporaryFile(suffix=".upload" + ext, dir=directory)  # noqa: SIM115
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # already moved into the storage.
+            pass
+
+
+class FileHostingUploadHandler(FileUploadHandler):
+    """
+    Streams uploads to disk in ``FILE_HOSTING_UPLOAD_CHUNK_SIZE`` chunks and
+    aborts as soon as more than ``max_size`` bytes were received, whatever
+    the request's Content-Length said.
+
+    The sha256 of the content is computed on the way and set as the
+    ``sha256`` attribute of the resulting file, along with its ``metadata``
+    (size, type sniffed from the first bytes and that checksum).
+    """
+
+    def __init__(self, request=None, max_size: int | None = None):
+        super().__init__(request)
+        self.chunk_size = getattr(
+            settings, "FILE_HOSTING_UPLOAD_CHUNK_SIZE", 4 * 1024 * 1024
+        )
+        self.max_size = max_size
+        self.received = 0
+        self.too_large = False
+        self.started = time.perf_counter()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        directory = get_upload_dir()
+        os.makedirs(directory, exist_ok=True)
+        self.hasher = hashlib.sha256()
+        self.head = b""
+        self.file = StreamedUploadedFile(
+            directory,
+            self.file_name,
+            self.content_type,
+            0,
+            self.charset,
+            self.content_type_extra,
+        )
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.max_size is not None and self.received > self.max_size:
+            self.too_large = True
+            # don't keep the partial upload until the request is done with.
+            self.file.close()
+            raise StopUpload(connection_reset=True)
+        if len(self.head) < SNIFF_SIZE:
+            self.head += raw_data[: SNIFF_SIZE - len(self.head)]
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hasher.hexdigest()
+        self.file.metadata = FileMetadata(
+            file_size,
+            sniff_content_type(self.head, self.file_name),
+            self.file.sha256,
+        )
+        metrics.inc("uploads_total")
+        metrics.inc("upload_bytes_total", file_size)
+        metrics.inc("upload_seconds_total", time.perf_counter() - self.started)
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            self.file.close()
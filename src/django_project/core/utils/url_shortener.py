@@ -1,14 +1,115 @@
+import hashlib
+import hmac
 import secrets
 import string
 from urllib.parse import urlparse
 
 available_chars = string.ascii_lowercase + string.digits
 
+# Grow the alias length once this share of the current length's space is used.
+ALIAS_FILL_RATIO = 0.3
+FEISTEL_ROUNDS = 4
+
 
 def generate_alias(length: int = 3) -> str:
     return "".join(secrets.choice(available_chars) for _ in range(length))
 
 
+def alias_slot(sequence: int, start_length: int = 3) -> tuple[int, int]:
+    """
+    Maps a sequence number to an alias length and an index within the
+    aliases of that length, keeping the same growth as counting rows did:
+    a length is used until ALIAS_FILL_RATIO of its space is taken.
+    """
+    length = start_length
+    while True:
+        capacity = int(len(available_chars) ** length * ALIAS_FILL_RATIO)
+        if sequence < capacity:
+            return length, sequence
+        sequence -= capacity
+        length += 1
+
+
+def alias_slot_to_sequence(length: int, index: int, start_length: int = 3) -> int:
+    sequence = index
+    for current in range(start_length, length):
+        sequence += int(len(available_chars) ** current * ALIAS_FILL_RATIO)
+    return sequence
+
+
+def _feistel(value: int, half_bits: int, key: bytes, decrypt: bool = False) -> int:
+    mask = (1 << half_bits) - 1
+    left, right = value >> half_bits, value & mask
+    rounds = range(FEISTEL_ROUNDS)
+    if decrypt:
+        left, right = right, left
+        rounds = reversed(rounds)
+    for i in rounds:
+        digest = hmac.digest(key, bytes([i]) + right.to_bytes(8, "big"), "sha256")
+        left, right = right, left ^ (int.from_bytes(digest[:8], "big") & mask)
+    if decrypt:
+        left, right = right, left
+    return (left << half_bits) | right
+
+
+def permute(index: int, length: int, key: bytes, decrypt: bool = False) -> int:
+    """
+    Keyed bijection over ``range(len(available_chars) ** length)``.
+
+    A balanced feistel network over the smallest even bit width covering the
+    domain, cycle walking until the result falls back into the domain.
+    """
+    domain = len(available_chars) ** length
+    half_bits = (domain.bit_length() + 1) // 2
+    value = _feistel(index, half_bits, key, decrypt)
+    while value >= domain:
+        value = _feistel(value, half_bits, key, decrypt)
+    return value
+
+
+def encode_alias(number: int, length: int) -> str:
+    base = len(available_chars)
+    chars = []
+    for _ in range(length):
+        number, remainder = divmod(number, base)
+        chars.append(available_chars[remainder])
+    return "".join(reversed(chars))
+
+
+def decode_alias(alias: str) -> int:
+    number = 0
+    for char in alias:
+        number = number * len(available_chars) + available_chars.index(char)
+    return number
+
+
+def permutation_key(secret: str, namespace: str, length: int) -> bytes:
+    return hashlib.sha256(f"{secret}:{namespace}:{length}".encode()).digest()
+
+
+def sequence_to_alias(
+    sequence: int,
+    secret: str,
+    namespace: str,
+    start_length: int = 3,
+) -> str:
+    length, index = alias_slot(sequence, start_length)
+    key = permutation_key(secret, namespace, length)
+    return encode_alias(permute(index, length, key), length)
+
+
+def alias_to_sequence(
+    alias: str,
+    secret: str,
+    namespace: str,
+    start_length: int = 3,
+) -> int:
+    length = len(alias)
+    key = permutation_key(secret, namespace, length)
+    index = permute(decode_alias(alias), length, key, decrypt=True)
+    return alias_slot_to_sequence(length, index, start_length)
+
+
 def is_http_url(url: str, allowed_schemes: list[str] | None = None) -> bool:
     if not allowed_schemes:
         allowed_schemes = ["https", "http"]
@@ -1,3 +1,4 @@
+import json
 import os
 import typing as t
 
@@ -6,19 +7,24 @@ from django.contrib.auth import get_user_model, login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView as DjangoLoginView
-from django.http import Http404, HttpRequest
+from django.core.exceptions import RequestDataTooBig
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 
 from . import models
+from .utils import alias_cache, delivery, http_cache, metrics, trending
 from .utils import url_shortener as url_shortener_utils
 from .utils.common import (
     get_latest_shortened_urls,
     get_latest_uploaded_files,
-    get_paginated_items,
+    get_list_page,
+    get_page_query,
 )
-from .utils.statistics import most_viewed_instances
+from .utils.uploads import FileHostingUploadHandler
 
 User = get_user_model()
 
@@ -36,19 +42,10 @@ def get_common_context() -> dict[str, t.Any]:
 
 def home(request):
     context = get_common_context()
+    snapshot = trending.get_snapshot()
     context |= {
-        "trending_urls": [
-            x["instance"]
-            for x in most_viewed_instances(
-                models.ShortenedURL.objects.filter(is_public=True),
-            )
-        ],
-        "trending_files": [
-            x["instance"]
-            for x in most_viewed_instances(
-                models.UploadedFile.objects.filter(is_public=True),
-            )
-        ],
+        "trending_urls": snapshot["urls"],
+        "trending_files": snapshot["files"],
     }
 
     return render(
@@ -94,15 +91,9 @@ class URLShortenerView(LoginRequiredMixin, View):
     def get_page(
         self,
     ):
-        try:
-            page = int(self.request.GET.get("page", 1))
-        except:
-            page = None
-        return get_paginated_items(
-            models.ShortenedURL.objects.filter(owner=self.request.user).order_by(
-                "-inserted_at"
-            ),
-            page,
+        return get_list_page(
+            self.request.GET,
+            models.ShortenedURL.objects.filter(owner=self.request.user),
             page_size=3,
         )
 
@@ -115,14 +106,15 @@ class URLShortenerView(LoginRequiredMixin, View):
 
     def post(self, request: HttpRequest):
         errors: list[str] = []
-        common_context = get_common_context() | {"page": self.get_page()}
+        # the page is only listed once the new URL is in it.
+        common_context = get_common_context()
         url = request.POST.get("url")
         if not url or not url_shortener_utils.is_http_url(url):
             errors.append("Invalid URL")
             return render(
                 request,
                 "core/url_shortener.html",
-                common_context | {"errors": errors},
+                common_context | {"page": self.get_page(), "errors": errors},
             )
         is_public = bool(request.POST.get("is_public"))
 
@@ -148,43 +140,118 @@ class URLShortenerView(LoginRequiredMixin, View):
         )
 
 
+# the csrf check only applies to session authenticated requests.
+@method_decorator(csrf_exempt, name="dispatch")
+class URLShortenerBatchView(LoginRequiredMixin, View):
+    """
+    Shortens many URLs at once.
+
+    Takes ``{"urls": [...], "is_public": false}`` and answers
+    ``{"results": [...]}`` in the same order, each result being either
+    ``{"url": ..., "shortened_url": ...}`` or ``{"url": ..., "error": ...}``.
+    The valid URLs are all inserted in one transaction.
+
+    Scripts authenticate with an ``APIToken`` (``Authorization: Bearer
+    <key>``), browsers with their session and CSRF token.
+    """
+
+    raise_exception = True
+
+    @t.override
+    def dispatch(self, request: HttpRequest, *args: t.Any, **kwargs: t.Any):
+        authorization = request.headers.get("Authorization")
+        if authorization is None:
+            return csrf_protect(super().dispatch)(request, *args, **kwargs)
+        user = models.APIToken.authenticate(authorization)
+        if user is None:
+            return JsonResponse({"error": "Invalid API token"}, status=401)
+        request.user = user
+        return super().dispatch(request, *args, **kwargs)
+
+    def post(self, request: HttpRequest):
+        max_size = getattr(settings, "URL_SHORTENER_BATCH_MAX_SIZE", 10_000)
+        try:
+            data = json.loads(request.body)
+        except RequestDataTooBig:
+            return JsonResponse({"error": "Request body too large"}, status=413)
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON"}, status=400)
+        urls = data.get("urls") if isinstance(data, dict) else None
+        if not isinstance(urls, list):
+            return JsonResponse({"error": "Missing list of urls"}, status=400)
+        if len(urls) > max_size:
+            return JsonResponse(
+                {"error": f"Too many urls (max: {max_size})"},
+                status=400,
+            )
+        is_public = data.get("is_public", False)
+        if not isinstance(is_public, bool):
+            return JsonResponse({"error": "is_public must be a boolean"}, status=400)
+
+        is_valid = [
+            isinstance(url, str) and url_shortener_utils.is_http_url(url)
+            for url in urls
+        ]
+        created = models.ShortenedURL.create_many(
+            [url for url, valid in zip(urls, is_valid) if valid],
+            request.user,
+            is_public,
+        )
+        # drops the negative entries left by lookups of not yet used aliases.
+        alias_cache.shortened_urls.invalidate_many_on_commit(
+            [obj.alias for obj in created]
+        )
+
+        # reversed once, the aliases only differ by their last segment.
+        prefix = request.build_absolute_uri(
+            reverse("core:url_shortener_url", kwargs={"alias": "_"})
+        ).removesuffix("_")
+        created_iter = iter(created)
+        results = []
+        for url, valid in zip(urls, is_valid):
+            if valid:
+                alias = next(created_iter).alias
+                results.append({"url": url, "shortened_url": prefix + alias})
+            else:
+                results.append({"url": url, "error": "Invalid URL"})
+        return JsonResponse({"results": results})
+
+
 class URLShortenerURLView(View):
     def get(self, request, alias, *args, **kwargs):
-        obj = get_object_or_404(
-            models.ShortenedURL,
-            alias=alias,
-        )
-        return redirect(obj.url)
+        target = alias_cache.shortened_urls.get_or_404(alias)
+        return http_cache.cached_redirect(request, target)
+
+
+async def url_shortener_url_async(request: HttpRequest, alias: str):
+    """
+    Native async ``URLShortenerURLView``, see ``ASYNC_REDIRECT_VIEWS``.
+    """
+    target = await alias_cache.shortened_urls.aget_or_404(alias)
+    return http_cache.cached_redirect(request, target)
 
 
 @login_required
 def url_shortener_url_delete(request, alias):
-    try:
-        page = int(request.GET.get("page", 1))
-    except:
-        page = 1
     obj = get_object_or_404(
         models.ShortenedURL,
         alias=alias,
         owner=request.user,
     )
     obj.delete()
-    return redirect(reverse("core:url_shortener") + f"?page={page}")
+    return redirect(reverse("core:url_shortener") + "?" + get_page_query(request.GET))
 
 
+@method_decorator(csrf_exempt, name="dispatch")
 class FileHostingView(LoginRequiredMixin, View):
     def get_page(
         self,
     ):
-        try:
-            page = int(self.request.GET.get("page", 1))
-        except:
-            page = None
-        return get_paginated_items(
-            models.UploadedFile.objects.filter(owner=self.request.user).order_by(
-                "-inserted_at"
+        return get_list_page(
+            self.request.GET,
+            models.UploadedFile.objects.filter(owner=self.request.user).select_related(
+                "blob"
             ),
-            page,
             page_size=3,
         )
 
@@ -197,7 +264,9 @@ class FileHostingView(LoginRequiredMixin, View):
 
     def post(self, request: HttpRequest):
         errors = []
-        common_context = get_common_context() | {"page": self.get_page()}
+        # the page is only listed once the new file is in it.
+        common_context = get_common_context()
+        max_size = common_context["file_hosting_max_size"]
         try:
             content_length = int(request.META.get("CONTENT_LENGTH"))
         except:
@@ -205,22 +274,41 @@ class FileHostingView(LoginRequiredMixin, View):
             return render(
                 request,
                 "core/file_hosting.html",
-                common_context | {"errors": errors},
+                common_context | {"page": self.get_page(), "errors": errors},
             )
-        if "file" not in request.FILES:
-            errors.append("Bad Request!")
+        # rejected before any of the body is read.
+        if content_length > max_size:
+            errors.append(f"File too large (size: {content_length / 1024 / 1024} MB)")
             return render(
                 request,
                 "core/file_hosting.html",
-                common_context | {"errors": errors},
+                common_context | {"page": self.get_page(), "errors": errors},
             )
 
-        if content_length > common_context["file_hosting_max_size"]:
-            errors.append(f"File too large (size: {content_length / 1024 / 1024} MB)")
+        # the upload handlers can only be swapped before the body is parsed,
+        # which the csrf check would do, hence the csrf_exempt dispatch.
+        upload_handler = FileHostingUploadHandler(request, max_size)
+        request.upload_handlers = [upload_handler]
+        return csrf_protect(self.upload)(request, upload_handler, common_context)
+
+    def upload(
+        self,
+        request: HttpRequest,
+        upload_handler: FileHostingUploadHandler,
+        common_context: dict[str, t.Any],
+    ):
+        errors = []
+        if "file" not in request.FILES:
+            if upload_handler.too_large:
+                errors.append(
+                    f"File too large (max size: {common_context['file_hosting_max_size_mb']} MB)"
+                )
+            else:
+                errors.append("Bad Request!")
             return render(
                 request,
                 "core/file_hosting.html",
-                common_context | {"errors": errors},
+                common_context | {"page": self.get_page(), "errors": errors},
             )
 
         is_public = bool(request.POST.get("is_public"))
@@ -248,22 +336,39 @@ class FileHostingView(LoginRequiredMixin, View):
 
 
 def file_redirect(request: HttpRequest, alias_filename: str):
-    alias, ext = os.path.splitext(alias_filename)
-    file_obj = get_object_or_404(
-        models.UploadedFile,
-        alias=alias,
-        ext=ext,
+    target = alias_cache.uploaded_files.get_or_404(alias_filename)
+    validators = http_cache.file_validators(target)
+    # answered before the file is even opened.
+    response = http_cache.not_modified(request, validators) or delivery.deliver(
+        request, target, validators
+    )
+
+    return http_cache.patch_caching_headers(
+        response,
+        validators,
+        getattr(settings, "FILE_CACHE_MAX_AGE", 0),
+    )
+
+
+async def file_redirect_async(request: HttpRequest, alias_filename: str):
+    """
+    Native async ``file_redirect``, see ``ASYNC_REDIRECT_VIEWS``.
+    """
+    target = await alias_cache.uploaded_files.aget_or_404(alias_filename)
+    validators = http_cache.file_validators(target)
+    response = http_cache.not_modified(request, validators) or (
+        await delivery.adeliver(request, target, validators)
     )
 
-    return redirect(request.build_absolute_uri(file_obj.file.url))
+    return http_cache.patch_caching_headers(
+        response,
+        validators,
+        getattr(settings, "FILE_CACHE_MAX_AGE", 0),
+    )
 
 
 @login_required
 def file_delete(request: HttpRequest, alias_filename: str):
-    try:
-        page = int(request.GET.get("page", 1))
-    except:
-        page = 1
     alias, ext = os.path.splitext(alias_filename)
     file_obj = get_object_or_404(
         models.UploadedFile,
@@ -273,7 +378,7 @@ def file_delete(request: HttpRequest, alias_filename: str):
     )
     file_obj.delete()
 
-    return redirect(reverse("core:file_hosting") + f"?page={page}")
+    return redirect(reverse("core:file_hosting") + "?" + get_page_query(request.GET))
 
 
 @login_required
@@ -291,3 +396,18 @@ def about_user(request):
         "core/about_user.html",
         context,
     )
+
+
+def metrics_view(request: HttpRequest):
+    """
+    The metrics of every worker in the Prometheus text format, only for the
+    ``METRICS_ALLOWED_IPS``.
+    """
+    if request.META["REMOTE_ADDR"] not in getattr(
+        settings, "METRICS_ALLOWED_IPS", ["127.0.0.1", "::1"]
+    ):
+        raise Http404
+    return HttpResponse(
+        metrics.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
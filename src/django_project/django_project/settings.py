@@ -83,7 +83,7 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "core.middleware.real_ip.RealIPMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
-    "request.middleware.RequestMiddleware",
+    "core.middleware.request_log.DeferredRequestMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django_htmx.middleware.HtmxMiddleware",
@@ -119,6 +119,62 @@ DATABASES = {
     }
 }
 
+# DB_PROFILE=production tunes SQLite for concurrent workers: WAL lets readers
+# run alongside the writer, writers wait up to SQLITE_BUSY_TIMEOUT ms for the
+# lock and take it when their transaction begins (IMMEDIATE), instead of
+# failing with "database is locked" when a read turns into a write.
+# Connections are kept for CONN_MAX_AGE seconds; with gevent workers each
+# greenlet still opens its own, only threads reuse them.
+DB_PROFILE = env.str("DB_PROFILE", "default")
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": env.int("SQLITE_BUSY_TIMEOUT", 5000),
+    "mmap_size": env.int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+    # negative values are in KiB.
+    "cache_size": -env.int("SQLITE_CACHE_SIZE_KB", 64 * 1024),
+    "temp_store": "MEMORY",
+}
+if DB_PROFILE == "production":
+    DATABASES["default"] |= {
+        "OPTIONS": {
+            "init_command": "".join(
+                f"PRAGMA {name}={value};" for name, value in SQLITE_PRAGMAS.items()
+            ),
+            "transaction_mode": "IMMEDIATE",
+            "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000,
+        },
+        "CONN_MAX_AGE": env.int("CONN_MAX_AGE", 600),
+        "CONN_HEALTH_CHECKS": True,
+    }
+elif DB_PROFILE != "default":
+    raise ValueError(f"Unknown DB_PROFILE: {DB_PROFILE}")
+
+# Keep django-request's log in its own SQLite file (e.g. request_log.sqlite3),
+# so logging every hit doesn't contend for the write lock with link and file
+# creation. Migrate it with `manage.py migrate --database request_log`.
+REQUEST_LOG_DB = env.str("REQUEST_LOG_DB", "")
+if REQUEST_LOG_DB:
+    request_log_options = DATABASES["default"].get("OPTIONS", {})
+    DATABASES["request_log"] = DATABASES["default"] | {
+        "NAME": BASE_DIR / REQUEST_LOG_DB,
+        "OPTIONS": request_log_options
+        | {
+            # Request.user references auth_user, in the default database.
+            "init_command": request_log_options.get("init_command", "")
+            + "PRAGMA foreign_keys=OFF;",
+        },
+    }
+    DATABASE_ROUTERS = ["core.routers.RequestLogRouter"]
+
+# The cache shared by the workers, e.g. redis://127.0.0.1:6379/1 (with the
+# redis package), memcached://127.0.0.1:11211 (with pymemcache) or
+# db://cache_table (after createcachetable).
+# A shared one is required to run more than one worker: with the default
+# in-process locmem cache every worker has its own copy, so a change made
+# through one worker is only seen by the others once their copy expires.
+CACHES = {"default": env.dj_cache_url("CACHE_URL", "locmem://")}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -170,6 +226,11 @@ ENABLE_REGISTRATION = env.bool("ENABLE_REGISTRATION")
 MB = 1024 * 1024
 
 FILE_HOSTING_MAX_SIZE = 512 * MB
+# Uploads are streamed in chunks of this size (a multiple of 4) into
+# FILE_HOSTING_UPLOAD_DIR, which defaults to MEDIA_ROOT/.incoming so finished
+# uploads are renamed into place rather than copied.
+FILE_HOSTING_UPLOAD_CHUNK_SIZE = env.int("FILE_HOSTING_UPLOAD_CHUNK_SIZE", 4 * MB)
+FILE_HOSTING_UPLOAD_DIR = env.str("FILE_HOSTING_UPLOAD_DIR", "")
 
 MEDIA_ROOT = env.str(
     "MEDIA_ROOT",
@@ -196,3 +257,149 @@ STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
 STATIC_ROOT = BASE_DIR / "static_root"
+
+# Alias -> target resolution cache used by the /s/<alias> and /f/<alias> views.
+# The in-process LRU sits in front of the django cache (CACHE_URL), changes
+# are dropped from the latter, so ALIAS_CACHE_LOCAL_TIMEOUT bounds how long a
+# worker may serve a target that was changed through another worker. With a
+# locmem CACHE_URL, which isn't shared, ALIAS_CACHE_TIMEOUT is capped to it.
+ALIAS_CACHE_LOCAL_SIZE = env.int("ALIAS_CACHE_LOCAL_SIZE", 10_000)
+ALIAS_CACHE_LOCAL_TIMEOUT = env.int("ALIAS_CACHE_LOCAL_TIMEOUT", 60)
+ALIAS_CACHE_TIMEOUT = env.int("ALIAS_CACHE_TIMEOUT", 3600)
+ALIAS_CACHE_NEGATIVE_TIMEOUT = env.int("ALIAS_CACHE_NEGATIVE_TIMEOUT", 30)
+# Reject the lookups of aliases that don't exist (scanners probing /s/ and
+# /f/) with a bloom filter of ALIAS_FILTER_SIZE bytes per kind, kept by every
+# worker and rebuilt every ALIAS_FILTER_REBUILD_INTERVAL seconds. The workers
+# learn about the aliases created or renamed elsewhere through the
+# ALIAS_FILTER_STAMP file (in the temporary directory by default), and about
+# imports through ALIAS_FILTER_STAMP.rebuild, so they must share a host.
+ALIAS_FILTER = env.bool("ALIAS_FILTER", False)
+ALIAS_FILTER_SIZE = env.int("ALIAS_FILTER_SIZE", 1024 * 1024)
+ALIAS_FILTER_REBUILD_INTERVAL = env.int("ALIAS_FILTER_REBUILD_INTERVAL", 3600)
+ALIAS_FILTER_STAMP = env.str("ALIAS_FILTER_STAMP", None)
+
+# Aliases are a keyed permutation of per-model sequence numbers, reserved from
+# the database in blocks of ALIAS_BLOCK_SIZE. Defaults to using SECRET_KEY as
+# the permutation key.
+ALIAS_BLOCK_SIZE = env.int("ALIAS_BLOCK_SIZE", 64)
+ALIAS_PERMUTATION_KEY = env.str("ALIAS_PERMUTATION_KEY", "")
+ALIAS_MAX_ATTEMPTS = env.int("ALIAS_MAX_ATTEMPTS", 10)
+
+# Logged requests are linked to the URL/file they hit in batches, from a
+# background thread. Set ATTRIBUTION_BUFFERED=false to link them inline. A
+# batch that fails is retried on the next flushes, ATTRIBUTION_MAX_ATTEMPTS
+# times in all.
+ATTRIBUTION_BUFFERED = env.bool("ATTRIBUTION_BUFFERED", True)
+ATTRIBUTION_BATCH_SIZE = env.int("ATTRIBUTION_BATCH_SIZE", 500)
+ATTRIBUTION_FLUSH_INTERVAL = env.float("ATTRIBUTION_FLUSH_INTERVAL", 2.0)
+ATTRIBUTION_MAX_ATTEMPTS = env.int("ATTRIBUTION_MAX_ATTEMPTS", 5)
+
+# Home page trending lists, materialized every TRENDING_REFRESH_INTERVAL
+# seconds (or by the refresh_trending command) into the django cache, which
+# has to be shared (CACHE_URL) for the workers to build them once and for
+# refresh_trending to be of any use. TRENDING_MODE is one of "total",
+# "window" (views in the last TRENDING_WINDOW_DAYS days) or "decay" (daily
+# views halving in weight every TRENDING_HALF_LIFE_DAYS days).
+TRENDING_MODE = env.str("TRENDING_MODE", "decay")
+TRENDING_LIMIT = env.int("TRENDING_LIMIT", 10)
+TRENDING_WINDOW_DAYS = env.int("TRENDING_WINDOW_DAYS", 1)
+TRENDING_HALF_LIFE_DAYS = env.float("TRENDING_HALF_LIFE_DAYS", 1.0)
+TRENDING_HORIZON_DAYS = env.int("TRENDING_HORIZON_DAYS", 30)
+TRENDING_REFRESH_INTERVAL = env.int("TRENDING_REFRESH_INTERVAL", 300)
+TRENDING_LOCK_TIMEOUT = env.int("TRENDING_LOCK_TIMEOUT", 60)
+
+# Store uploaded files once per distinct content (under MEDIA_ROOT/blobs/),
+# uploads of an already stored file only add a reference to it.
+FILE_HOSTING_CONTENT_ADDRESSED = env.bool("FILE_HOSTING_CONTENT_ADDRESSED", False)
+
+# Spread uploaded files over this many levels of 256 directories
+# (uploaded_files/ab/cd/<uuid>/ for 2) instead of one flat directory. Move
+# the existing ones with the shard_uploaded_files command.
+FILE_HOSTING_SHARD_DEPTH = env.int("FILE_HOSTING_SHARD_DEPTH", 0)
+
+# How /f/<alias> sends files: "redirect" (to MEDIA_URL), "direct" (streamed
+# by django with Range support), "x-accel-redirect" (nginx, through the
+# internal FILE_DELIVERY_ACCEL_PREFIX location aliased to MEDIA_ROOT) or
+# "x-sendfile" (apache/lighttpd).
+FILE_DELIVERY_MODE = env.str("FILE_DELIVERY_MODE", "redirect")
+FILE_DELIVERY_ACCEL_PREFIX = env.str("FILE_DELIVERY_ACCEL_PREFIX", "/protected-media/")
+
+# Cache-Control max-age of redirects and hosted files. With 0 clients always
+# revalidate (ETag/Last-Modified, answered with 304), which keeps every click
+# visible to the statistics. REDIRECT_PERMANENT_PUBLIC turns public short
+# URLs into 301s cached for REDIRECT_PERMANENT_MAX_AGE instead.
+REDIRECT_CACHE_MAX_AGE = env.int("REDIRECT_CACHE_MAX_AGE", 0)
+FILE_CACHE_MAX_AGE = env.int("FILE_CACHE_MAX_AGE", 0)
+REDIRECT_PERMANENT_PUBLIC = env.bool("REDIRECT_PERMANENT_PUBLIC", False)
+REDIRECT_PERMANENT_MAX_AGE = env.int("REDIRECT_PERMANENT_MAX_AGE", 3600 * 24 * 365)
+
+# Serve /s/<alias> and /f/<alias> with native async views when running under
+# ASGI (uvicorn, daphne), so slow clients don't each hold a worker thread.
+# The whole middleware chain then has to be async capable: WhiteNoise isn't,
+# the static files are expected to be served by the reverse proxy instead.
+# With FILE_DELIVERY_MODE "direct" files are read in threads, one
+# AsyncFileResponse.block_size chunk at a time.
+ASYNC_REDIRECT_VIEWS = env.bool("ASYNC_REDIRECT_VIEWS", False)
+if ASYNC_REDIRECT_VIEWS:
+    MIDDLEWARE.remove("whitenoise.middleware.WhiteNoiseMiddleware")
+
+# Maximum number of URLs shortened by one POST to /url-shortener/batch/.
+# DATA_UPLOAD_MAX_MEMORY_SIZE has to allow the matching request body size.
+URL_SHORTENER_BATCH_MAX_SIZE = env.int("URL_SHORTENER_BATCH_MAX_SIZE", 10_000)
+
+# Log the requests exceeding their view's query/latency budget (see
+# core.utils.budgets), VIEW_BUDGETS overrides budgets by URL name, e.g.
+# {"core:file_redirect": [1, 25]} for 1 query and 25ms. Only the queries have
+# default budgets, breaches are logged and nothing else.
+VIEW_BUDGETS_MIDDLEWARE = env.bool("VIEW_BUDGETS_MIDDLEWARE", False)
+if VIEW_BUDGETS_MIDDLEWARE:
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index("core.middleware.request_log.DeferredRequestMiddleware") + 1,
+        "core.middleware.budgets.QueryBudgetMiddleware",
+    )
+VIEW_BUDGETS = env.json("VIEW_BUDGETS", {})
+
+# Add a Server-Timing header (queries, cache hits/misses, template and total
+# time) to the responses and log SERVER_TIMING_LOG_SAMPLE_RATE of them as
+# JSON. Superusers' requests sending SERVER_TIMING_PROFILE_HEADER are
+# profiled, the stats are dumped to SERVER_TIMING_PROFILE_DIR (the temporary
+# directory by default).
+SERVER_TIMING = env.bool("SERVER_TIMING", False)
+if SERVER_TIMING:
+    # right after the authentication, the profiling needs request.user.
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index("django.contrib.auth.middleware.AuthenticationMiddleware") + 1,
+        "core.middleware.server_timing.ServerTimingMiddleware",
+    )
+SERVER_TIMING_LOG_SAMPLE_RATE = env.float("SERVER_TIMING_LOG_SAMPLE_RATE", 0.01)
+SERVER_TIMING_PROFILE_HEADER = env.str("SERVER_TIMING_PROFILE_HEADER", "X-Profile")
+SERVER_TIMING_PROFILE_DIR = env.str("SERVER_TIMING_PROFILE_DIR", None)
+
+# Expose /metrics in the Prometheus text format: request latencies and query
+# counts by URL name, redirects, uploads, file deliveries, cache lookups and
+# the attribution queue. Every worker process writes its metrics to
+# METRICS_DIR every METRICS_WRITE_INTERVAL seconds, /metrics adds them up.
+# The hooks of gunicorn.conf.py empty METRICS_DIR when the server starts and
+# fold the files of exited workers into one, other servers have to do both.
+METRICS = env.bool("METRICS", False)
+if METRICS:
+    MIDDLEWARE.insert(0, "core.middleware.metrics.MetricsMiddleware")
+METRICS_DIR = env.str("METRICS_DIR", None)
+METRICS_WRITE_INTERVAL = env.float("METRICS_WRITE_INTERVAL", 5.0)
+METRICS_ALLOWED_IPS = env.list("METRICS_ALLOWED_IPS", ["127.0.0.1", "::1"])
+
+# Logged requests kept by `manage.py prune_requests`, older ones are rolled up
+# into daily per path counts, archived to REQUEST_ARCHIVE_DIR and deleted.
+REQUEST_RETENTION_DAYS = env.int("REQUEST_RETENTION_DAYS", 90)
+REQUEST_ARCHIVE_DIR = env.str(
+    "REQUEST_ARCHIVE_DIR",
+    os.path.join(
+        BASE_DIR,
+        "request_archive",
+    ),
+)
+
+# Paginate the URL and file lists with cursors (?cursor=) on (inserted_at, id)
+# instead of page numbers: no COUNT(*) and no OFFSET scan, every page is one
+# range scan of the (owner, inserted_at, id) indexes.
+KEYSET_PAGINATION = env.bool("KEYSET_PAGINATION", False)
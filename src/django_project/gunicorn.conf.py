@@ -0,0 +1,17 @@
+# Loaded by gunicorn from the working directory, see `just prod`.
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_project.settings")
+
+
+def on_starting(server):
+    from core.utils import metrics_files
+
+    # the counters start over with the server.
+    metrics_files.clear()
+
+
+def child_exit(server, worker):
+    from core.utils import metrics_files
+
+    metrics_files.mark_process_dead(worker.pid)